@@ -0,0 +1,203 @@
+"""Runs every calcifer command against the local mock servers and reports wall-clock time, requests and peak memory.
+
+Run it with `poetry run python -m benchmarks.cli_commands [options]`, e.g. `--repos 200 --latency 0.05` to see how
+the GitHub commands scale with the number of repos on a slow network, or `--command repos-info` to run just one.
+Each command runs in its own process with an empty file cache, so nothing is reused between commands or runs.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional, TypedDict
+
+import click
+
+from benchmarks.mock_servers import DEFAULT_CONFIG, MockServer, start_mock_server
+
+GITHUB_ORG = "bench-org"
+JIRA_PROJECT = "BENCH"
+
+
+class CommandResult(TypedDict):
+    command: str
+    exit_code: int
+    wall_clock: float
+    requests: int
+    rate_limited: int
+    errors: int
+    peak_memory_mb: float
+
+
+def get_commands(url: str) -> dict[str, list[str]]:
+    """Returns the arguments of each benchmarked run by name; "command:variant" runs command in another mode."""
+    github = ["--github-user", "bench", "--github-token", "token"]
+    github += ["--github-url", f"{url}/github/", "--github-org", GITHUB_ORG]
+    jira = ["--jira-user", "bench", "--jira-api-token", "token"]
+    jira += ["--jira-url", f"{url}/jira", "--jira-project", JIRA_PROJECT]
+    jira += ["--since", "2021-01-01"]
+    auth0 = ["--auth0-token", "token", "--auth0-url", f"{url}/auth0"]
+    return {
+        "top-contributors": github,
+        "first-contribution": github,
+        "commits-with-tag": github + ["--tag", "release"],
+        "empty-repos": github,
+        "repos-not-on-main": github,
+        "backstage-missing": github,
+        "unprotected-repos": github,
+        "repos-info": github,
+        "repo-last-commit": github,
+        "issues-with-comments-by": jira + ["--search-for-user", "dev-1"],
+        "issues-change-status-log": jira,
+        "auth0-logs": auth0,
+        "auth0-logs:window": auth0
+        + ["--auth0-from-date", "2019-01-01", "--auth0-to-date", "2019-01-05"]
+        + ["--window-hours", "6"],
+    }
+
+
+def run_command(
+    server: MockServer, command: str, args: list[str], out_dir: Path
+) -> CommandResult:
+    """Runs command in a child process with its own temp dir, so that the file cache starts empty."""
+    server.reset_counters()
+    cache_dir = tempfile.mkdtemp(dir=out_dir)
+    file_name = command.replace(":", "-")
+    log_file = out_dir / f"{file_name}.log"
+    started_at = time.perf_counter()
+    with open(log_file, "w") as log:
+        process = subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                "from calcifer.calcifer import cli; cli()",
+                command.split(":")[0],
+            ]
+            + args
+            + ["--out-file-path", str(out_dir / f"{file_name}.csv")],
+            env={**os.environ, "TMPDIR": cache_dir},
+            stdout=log,
+            stderr=log,
+        )
+        # wait4 rather than wait, to get the resource usage of this child only
+        _, status, usage = os.wait4(process.pid, 0)
+    wall_clock = time.perf_counter() - started_at
+    exit_code = os.waitstatus_to_exitcode(status)
+    if exit_code:
+        print(f"{command} failed:\n{log_file.read_text()[-2000:]}", file=sys.stderr)
+    requests = server.requests
+    return CommandResult(
+        command=command,
+        exit_code=exit_code,
+        wall_clock=wall_clock,
+        requests=sum(requests[api] for api in ("github", "jira", "auth0")),
+        rate_limited=requests["rate_limited"],
+        errors=requests["errors"],
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        peak_memory_mb=usage.ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10),
+    )
+
+
+def print_results(results: list[CommandResult]) -> None:
+    print(
+        f"{'command':<26} {'exit':>4} {'seconds':>8} {'requests':>9} {'req/s':>8} "
+        f"{'limited':>8} {'errors':>7} {'peak MB':>8}"
+    )
+    for result in results:
+        print(
+            f"{result['command']:<26} {result['exit_code']:>4} {result['wall_clock']:>8.2f} "
+            f"{result['requests']:>9} {result['requests'] / result['wall_clock']:>8.1f} "
+            f"{result['rate_limited']:>8} {result['errors']:>7} {result['peak_memory_mb']:>8.1f}"
+        )
+
+
+@click.command()
+@click.option("--repos", type=int, default=DEFAULT_CONFIG["repos"])
+@click.option(
+    "--commits",
+    type=int,
+    default=DEFAULT_CONFIG["commits"],
+    help="Maximum commits per repo",
+)
+@click.option("--issues", type=int, default=DEFAULT_CONFIG["issues"])
+@click.option("--logs", type=int, default=DEFAULT_CONFIG["logs"])
+@click.option(
+    "--latency",
+    type=float,
+    default=DEFAULT_CONFIG["latency"],
+    help="Seconds added to every response",
+)
+@click.option(
+    "--error-rate",
+    type=float,
+    default=DEFAULT_CONFIG["error_rate"],
+    help="Share of requests answered with a 500",
+)
+@click.option(
+    "--rate-limit",
+    type=int,
+    default=DEFAULT_CONFIG["rate_limit"],
+    help="Requests allowed per rate limit window, 0 for no limit",
+)
+@click.option(
+    "--rate-limit-window", type=float, default=DEFAULT_CONFIG["rate_limit_window"]
+)
+@click.option("--seed", type=int, default=DEFAULT_CONFIG["seed"])
+@click.option(
+    "--command",
+    "commands",
+    type=str,
+    multiple=True,
+    help="Commands to run, all of them by default",
+)
+@click.option(
+    "--results-file", type=str, help="Also writes the results to this json file"
+)
+def main(
+    repos: int,
+    commits: int,
+    issues: int,
+    logs: int,
+    latency: float,
+    error_rate: float,
+    rate_limit: int,
+    rate_limit_window: float,
+    seed: int,
+    commands: tuple[str, ...],
+    results_file: Optional[str],
+):
+    server = start_mock_server(
+        {
+            "repos": repos,
+            "commits": commits,
+            "issues": issues,
+            "logs": logs,
+            "latency": latency,
+            "error_rate": error_rate,
+            "rate_limit": rate_limit,
+            "rate_limit_window": rate_limit_window,
+            "seed": seed,
+        }
+    )
+    all_commands = get_commands(server.url)
+    unknown = [command for command in commands if command not in all_commands]
+    if unknown:
+        raise click.BadParameter(f"Unknown commands {unknown}", param_hint="--command")
+    results = []
+    with tempfile.TemporaryDirectory() as out_dir:
+        for command in commands or all_commands:
+            results.append(
+                run_command(server, command, all_commands[command], Path(out_dir))
+            )
+    server.shutdown()
+    print_results(results)
+    if results_file:
+        with open(results_file, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Compares the throughput, in logs per second, of flattening and writing auth0 logs row by row and by columns.
+
+Run it with `poetry run python benchmarks/flatten_logs.py [number of logs]`.
+"""
+
+import copy
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+from calcifer.commands.auth0 import AUTH0_DEFAULT_FIELDS, flatten_logs_to_columns
+from calcifer.utils.file_writer import write_columns_to_file, write_to_file
+
+DEFAULT_LOGS = 200_000
+
+
+def flatten_logs(logs: list[dict]) -> list[dict]:
+    """The row by row flattening auth0_logs used before flatten_logs_to_columns, which changes the logs in place."""
+    for log in logs:
+        error = log.get("details", {}).get("error", {})
+        if type(error) is str:
+            log.update(
+                {"error_message": error, "error_oauth_error": "", "error_type": ""}
+            )
+        else:
+            log.update(
+                {
+                    "error_message": log.get("details", {})
+                    .get("error", {})
+                    .get("message", ""),
+                    "error_oauth_error": log.get("details", {})
+                    .get("error", {})
+                    .get("oauthError", ""),
+                    "error_type": log.get("details", {})
+                    .get("error", {})
+                    .get("type", ""),
+                }
+            )
+        for field in AUTH0_DEFAULT_FIELDS:
+            if field not in log:
+                log[field] = ""
+        if "details" in log:
+            log.pop("details")
+
+
+def make_logs(n: int) -> list[dict]:
+    errors = [
+        {
+            "error": {
+                "message": "Wrong password",
+                "oauthError": "invalid_grant",
+                "type": "x",
+            }
+        },
+        {"error": "Unauthorized"},
+        {},
+    ]
+    logs = []
+    for i in range(n):
+        log = {
+            "log_id": f"{i:056d}",
+            "date": "2024-01-01T00:00:00.000Z",
+            "type": "f" if i % 2 else "s",
+            "ip": "10.0.0.1",
+            "user_agent": "Chrome 120.0.0 / Mac OS X 10.15.7",
+            "hostname": "tenant.eu.auth0.com",
+            "details": errors[i % len(errors)],
+        }
+        # Only some of the default fields are there, as in real logs
+        for field in AUTH0_DEFAULT_FIELDS[: i % len(AUTH0_DEFAULT_FIELDS)]:
+            log[field] = f"{field}-{i % 100}"
+        logs.append(log)
+    return logs
+
+
+def measure(
+    name: str, logs: list[dict], flatten_and_write: Callable[[list[dict], Path], None]
+):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        out_file = Path(tmp_dir) / "logs.csv"
+        logs = copy.deepcopy(logs)  # flatten_logs changes the logs in place
+        start = time.perf_counter()
+        flatten_and_write(logs, out_file)
+        elapsed = time.perf_counter() - start
+    print(f"{name:<10} {elapsed:8.3f}s {len(logs) / elapsed:12,.0f} logs/s")
+    return elapsed
+
+
+def by_rows(logs: list[dict], out_file: Path):
+    flatten_logs(logs)
+    write_to_file(out_file, logs)
+
+
+def by_columns(logs: list[dict], out_file: Path):
+    write_columns_to_file(out_file, flatten_logs_to_columns(logs))
+
+
+if __name__ == "__main__":
+    logs = make_logs(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_LOGS)
+    rows_elapsed = measure("rows", logs, by_rows)
+    columns_elapsed = measure("columns", logs, by_columns)
+    print(f"columns are {rows_elapsed / columns_elapsed:.1f}x faster")
@@ -0,0 +1,437 @@
+"""Local stand-ins for the GitHub REST, Jira and Auth0 endpoints calcifer calls, serving synthetic data.
+
+A single server answers the three APIs under /github/, /jira/ and /auth0/. Orgs have `repos` repos with up to
+`commits` commits each, Jira projects have `issues` issues and Auth0 has `logs` logs; everything is generated from
+the seed, so two runs with the same config see the same data. Every response can be delayed by `latency` seconds,
+fail with a 500 with probability `error_rate` and be rate limited to `rate_limit` requests per `rate_limit_window`
+seconds (a 403 with X-RateLimit-* headers for GitHub, a 429 with Retry-After for Jira and Auth0). calcifer makes no
+GraphQL calls, so there is no GraphQL endpoint.
+"""
+
+import functools
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, TypedDict
+from urllib.parse import parse_qsl, urlparse
+
+START = datetime(2019, 1, 1, tzinfo=timezone.utc)
+AUTHORS = 50
+JQL_DATE_FORMAT = "%Y/%m/%d %H:%M"
+
+
+class MockConfig(TypedDict):
+    repos: int
+    commits: int
+    issues: int
+    logs: int
+    latency: float
+    error_rate: float
+    rate_limit: int
+    rate_limit_window: float
+    seed: int
+
+
+DEFAULT_CONFIG = MockConfig(
+    repos=50,
+    commits=200,
+    issues=500,
+    logs=5000,
+    latency=0.0,
+    error_rate=0.0,
+    rate_limit=0,
+    rate_limit_window=1.0,
+    seed=42,
+)
+
+
+def _date(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class SyntheticData:
+    """Generates the repos, commits, issues and logs of a config, each one only when first asked for."""
+
+    def __init__(self, config: MockConfig, base_url: str) -> None:
+        self.config = config
+        self.base_url = base_url
+
+    def _repo_seed(self, repo_index: int) -> random.Random:
+        return random.Random(self.config["seed"] * 1_000_003 + repo_index)
+
+    def get_repos(self, org: str) -> list[dict]:
+        repos = []
+        for i in range(self.config["repos"]):
+            name = f"repo-{i:04d}"
+            repo_url = f"{self.base_url}/github/repos/{org}/{name}"
+            moment = START + timedelta(days=i)
+            repos.append(
+                {
+                    "name": name,
+                    "full_name": f"{org}/{name}",
+                    "private": bool(i % 2),
+                    "archived": i % 25 == 24,
+                    "default_branch": "main" if i % 4 else "master",
+                    "git_tags_url": f"{repo_url}/git/tags{{/sha}}",
+                    "commits_url": f"{repo_url}/commits{{/sha}}",
+                    "contributors_url": f"{repo_url}/contributors{{/collaborator}}",
+                    "clone_url": f"{self.base_url}/git/{org}/{name}.git",
+                    "visibility": "private" if i % 2 else "public",
+                    "owner": {"login": org},
+                    "pushed_at": _date(moment),
+                    "updated_at": _date(moment),
+                }
+            )
+        return repos
+
+    @functools.lru_cache(maxsize=None)
+    def get_commits(self, repo_index: int) -> list[dict]:
+        """Commits of a repo, newest first as GitHub lists them; one repo in ten is empty."""
+        if repo_index % 10 == 0:
+            return []
+        rng = self._repo_seed(repo_index)
+        number = rng.randint(self.config["commits"] // 2, self.config["commits"])
+        commits = []
+        moment = datetime(2023, 1, 1, tzinfo=timezone.utc)
+        for j in range(number):
+            moment -= timedelta(hours=rng.randint(1, 96))
+            author = f"dev-{rng.randrange(AUTHORS)}"
+            commits.append(
+                {
+                    "sha": f"{repo_index:08x}{j:032x}",
+                    "commit": {
+                        "author": {"name": author, "date": _date(moment)},
+                        "message": f"Change {j} of repo {repo_index}\n\nDetails",
+                    },
+                    "author": {"login": author},
+                }
+            )
+        return commits
+
+    def get_contributors(self, repo_index: int) -> list[dict]:
+        contributions = Counter(
+            commit["author"]["login"] for commit in self.get_commits(repo_index)
+        )
+        return [
+            {"login": login, "contributions": count}
+            for login, count in contributions.most_common()
+        ]
+
+    def get_tags(self, repo_index: int) -> list[dict]:
+        return [
+            {
+                "name": f"release-{j}" if j % 20 == 0 else f"v{j}",
+                "commit": {"sha": commit["sha"], "url": ""},
+            }
+            for j, commit in enumerate(self.get_commits(repo_index))
+            if j % 10 == 0
+        ]
+
+    def get_protection(self, repo_index: int) -> Optional[dict]:
+        if repo_index % 3 == 0:
+            return None
+        return {
+            "required_status_checks": {"strict": bool(repo_index % 2)},
+            "required_pull_request_reviews": {
+                "required_approving_review_count": repo_index % 3,
+                "dismiss_stale_reviews": True,
+            },
+            "allow_force_pushes": {"enabled": False},
+            "require_linear_history": {"enabled": bool(repo_index % 5)},
+            "url": "",
+        }
+
+    def get_issue_created(self, issue_index: int) -> datetime:
+        return datetime(2022, 1, 1) + timedelta(minutes=30 * issue_index)
+
+    def get_issue_histories(self, issue_index: int) -> list[dict]:
+        """One issue in fifty has more changes than Jira embeds in a search result."""
+        created = self.get_issue_created(issue_index)
+        return [
+            {
+                "id": str(j),
+                "created": (created + timedelta(hours=j)).strftime(
+                    "%Y-%m-%dT%H:%M:%S.000+0000"
+                ),
+                "author": {"displayName": f"dev-{(issue_index + j) % AUTHORS}"},
+                "items": [
+                    {"field": "status", "fromString": f"s{j}", "toString": f"s{j + 1}"}
+                ],
+            }
+            for j in range(120 if issue_index % 50 == 0 else 3)
+        ]
+
+    def get_issue_comments(self, issue_index: int) -> list[dict]:
+        return [
+            {"author": {"displayName": f"dev-{(issue_index + j) % AUTHORS}"}}
+            for j in range(issue_index % 4 + 1)
+        ]
+
+    def get_issue(self, project: str, issue_index: int, expand: str) -> dict:
+        created = self.get_issue_created(issue_index).strftime(
+            "%Y-%m-%dT%H:%M:%S.000+0000"
+        )
+        comments = self.get_issue_comments(issue_index)
+        issue = {
+            "key": f"{project}-{issue_index}",
+            "fields": {
+                "created": created,
+                "updated": created,
+                "status": {"name": "Done"},
+                "assignee": {"displayName": f"dev-{issue_index % AUTHORS}"},
+                "description": "x" * 500,
+                "comment": {
+                    "startAt": 0,
+                    "maxResults": 2,
+                    "total": len(comments),
+                    "comments": comments[:2],
+                },
+            },
+        }
+        if "changelog" in (expand or ""):
+            histories = self.get_issue_histories(issue_index)
+            issue["changelog"] = {
+                "startAt": 0,
+                "maxResults": 100,
+                "total": len(histories),
+                "histories": list(reversed(histories[:100])),
+            }
+        return issue
+
+    @functools.cached_property
+    def logs(self) -> list[dict]:
+        rng = random.Random(self.config["seed"])
+        logs = []
+        for i in range(self.config["logs"]):
+            log = {
+                "log_id": f"{i:056d}",
+                "date": (START + timedelta(minutes=i)).strftime(
+                    "%Y-%m-%dT%H:%M:%S.000Z"
+                ),
+                "type": rng.choice(("s", "f", "fp", "seacft")),
+                "ip": f"10.0.{i % 256}.{rng.randrange(256)}",
+                "user_agent": "Chrome 120.0.0 / Mac OS X 10.15.7",
+                "hostname": "tenant.eu.auth0.com",
+                "client_id": f"client-{i % 5}",
+                "client_name": f"App {i % 5}",
+                "user_id": f"auth0|{i % 1000}",
+                "user_name": f"user{i % 1000}@example.com",
+                "connection": "Username-Password-Authentication",
+                "strategy": "auth0",
+                "strategy_type": "database",
+                "details": (
+                    {"error": {"message": "Wrong password", "type": "x"}}
+                    if i % 3 == 0
+                    else {}
+                ),
+            }
+            logs.append(log)
+        return logs
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config: MockConfig) -> None:
+        super().__init__(("127.0.0.1", 0), MockHandler)
+        self.config = config
+        self.url = f"http://127.0.0.1:{self.server_port}"
+        self.data = SyntheticData(config, self.url)
+        self.requests: Counter = Counter()
+        self._lock = threading.Lock()
+        self._rng = random.Random(config["seed"])
+        self._window_started_at = time.time()
+        self._window_requests = 0
+
+    def reset_counters(self) -> None:
+        with self._lock:
+            self.requests = Counter()
+
+    def admit(self, api: str) -> tuple[Optional[int], dict]:
+        """Counts a request and returns the error status to answer with, if any, and the rate limit headers."""
+        with self._lock:
+            self.requests[api] += 1
+            headers = {}
+            if self.config["rate_limit"]:
+                now = time.time()
+                if now - self._window_started_at >= self.config["rate_limit_window"]:
+                    self._window_started_at = now
+                    self._window_requests = 0
+                self._window_requests += 1
+                reset_at = self._window_started_at + self.config["rate_limit_window"]
+                remaining = max(self.config["rate_limit"] - self._window_requests, 0)
+                headers = {
+                    "X-RateLimit-Limit": str(self.config["rate_limit"]),
+                    "X-RateLimit-Remaining": str(remaining),
+                    "X-RateLimit-Reset": f"{reset_at:.3f}",
+                }
+                if self._window_requests > self.config["rate_limit"]:
+                    self.requests["rate_limited"] += 1
+                    if api == "github":
+                        return 403, headers
+                    return 429, {"Retry-After": f"{reset_at - now:.3f}"}
+            if self._rng.random() < self.config["error_rate"]:
+                self.requests["errors"] += 1
+                return 500, headers
+        return None, headers
+
+    def start(self) -> "MockServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    server: MockServer
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _send(self, status: int, body=None, headers: Optional[dict] = None) -> None:
+        content = b"" if body is None else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _handle(self, method: str) -> None:
+        url = urlparse(self.path)
+        api, _, path = url.path.lstrip("/").partition("/")
+        params = dict(parse_qsl(url.query))
+        if self.server.config["latency"]:
+            time.sleep(self.server.config["latency"])
+        error, headers = self.server.admit(api)
+        if error:
+            self._send(error, {"message": "mock error"}, headers)
+            return
+        handler = {
+            "github": self._github,
+            "jira": self._jira,
+            "auth0": self._auth0,
+        }.get(api)
+        status, body = handler(method, path, params) if handler else (404, None)
+        self._send(status, body, headers)
+
+    def do_GET(self) -> None:
+        self._handle("GET")
+
+    def do_PUT(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self._handle("PUT")
+
+    @staticmethod
+    def _page(items: list, params: dict) -> list:
+        per_page = int(params.get("per_page", 30))
+        start = (int(params.get("page", 1)) - 1) * per_page
+        return items[start:][:per_page]
+
+    def _github(self, method: str, path: str, params: dict) -> tuple[int, object]:
+        data = self.server.data
+        parts = path.split("/")
+        if parts[0] == "orgs" and parts[2:] == ["repos"]:
+            return 200, self._page(data.get_repos(parts[1]), params)
+        if parts[0] != "repos" or len(parts) < 4:
+            return 404, None
+        repo_index, resource = int(parts[2].split("-")[1]), parts[3]
+        if resource == "commits" and len(parts) == 5:
+            commits = data.get_commits(repo_index)
+            commit = next((c for c in commits if c["sha"] == parts[4]), None)
+            return (200, commit) if commit else (404, None)
+        if resource == "commits":
+            return 200, self._page(data.get_commits(repo_index), params)
+        if resource == "contributors":
+            return 200, self._page(data.get_contributors(repo_index), params)
+        if resource == "tags":
+            return 200, self._page(data.get_tags(repo_index), params)
+        if resource == "branches" and parts[-1] == "protection":
+            if method == "PUT":
+                return 200, data.get_protection(1)
+            protection = data.get_protection(repo_index)
+            return (200, protection) if protection else (404, None)
+        if resource == "contents":
+            if repo_index % 2:
+                return 404, None
+            return 200, {"name": parts[-1], "content": ""}
+        return 404, None
+
+    def _jira(self, method: str, path: str, params: dict) -> tuple[int, object]:
+        data = self.server.data
+        start_at = int(params.get("startAt", 0))
+        max_results = min(int(params.get("maxResults", 50)), 100)
+        if path == "rest/api/3/search":
+            project = re.search(r"project\s*=\s*\"?(\w+)", params.get("jql", ""))
+            project = project.group(1) if project else "PROJ"
+            indexes = range(data.config["issues"])
+            for operator, date in re.findall(
+                r'created\s*(>=|<)\s*"([^"]+)"', params.get("jql", "")
+            ):
+                bound = datetime.strptime(date, JQL_DATE_FORMAT)
+                indexes = [
+                    i
+                    for i in indexes
+                    if (data.get_issue_created(i) >= bound) == (operator == ">=")
+                ]
+            page = indexes[start_at:][:max_results]
+            return 200, {
+                "startAt": start_at,
+                "maxResults": max_results,
+                "total": len(indexes),
+                "issues": [
+                    data.get_issue(project, i, params.get("expand")) for i in page
+                ],
+            }
+        match = re.fullmatch(r"rest/api/3/issue/\w+-(\d+)/(changelog|comment)", path)
+        if not match:
+            return 404, None
+        issue_index = int(match.group(1))
+        if match.group(2) == "changelog":
+            items, collection = data.get_issue_histories(issue_index), "values"
+        else:
+            items, collection = data.get_issue_comments(issue_index), "comments"
+        return 200, {
+            "startAt": start_at,
+            "maxResults": max_results,
+            "total": len(items),
+            collection: items[start_at:][:max_results],
+        }
+
+    def _auth0(self, method: str, path: str, params: dict) -> tuple[int, object]:
+        if path != "logs":
+            return 404, None
+        logs = self.server.data.logs
+        window = re.search(r"date:\[(\S+) TO (\S+)\]", params.get("q", ""))
+        if window:
+            start, end = window.groups()
+            logs = [
+                log
+                for log in logs
+                if (start == "*" or log["date"] >= start)
+                and (end == "*" or log["date"] <= end)
+            ]
+        if "from" in params:
+            logs = [log for log in logs if log["log_id"] > params["from"]]
+            logs = logs[: int(params.get("take", 50))]
+        else:
+            page, per_page = int(params.get("page", 0)), int(params.get("per_page", 50))
+            if (page + 1) * per_page > 1000:
+                return 400, {"message": "You can only page through the first 1000"}
+            if params.get("sort", "date:-1") == "date:-1":
+                logs = logs[::-1]
+            start = page * per_page
+            logs = logs[start:][:per_page]
+        if params.get("fields"):
+            fields = params["fields"].split(",")
+            logs = [{k: v for k, v in log.items() if k in fields} for log in logs]
+        return 200, logs
+
+
+def start_mock_server(config: Optional[MockConfig] = None) -> MockServer:
+    """Starts a mock server on a free port, with GitHub at {url}/github/, Jira at {url}/jira, Auth0 at {url}/auth0."""
+    return MockServer({**DEFAULT_CONFIG, **(config or {})}).start()
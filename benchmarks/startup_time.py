@@ -0,0 +1,126 @@
+"""Checks that the CLI starts fast, failing when a command imports modules it doesn't need or takes too long to load.
+
+Each scenario runs `calcifer <args>` under `python -X importtime`, keeps the fastest of a few runs and checks the
+time spent importing after interpreter startup against its budget, and that none of its forbidden modules were
+imported. Run it with `poetry run python benchmarks/startup_time.py`; it exits with 1 when a check fails.
+"""
+
+import subprocess
+import sys
+from typing import TypedDict
+
+import click
+
+RUNS = 5
+
+# Slow to import, and not needed to list the commands or show their help
+HEAVY_MODULES = (
+    "requests",
+    "pydantic",
+    "tqdm",
+    "pyarrow",
+    "duckdb",
+    "pythonjsonlogger",
+)
+
+
+class Scenario(TypedDict):
+    args: list[str]
+    budget_ms: float
+    forbidden: tuple[str, ...]
+
+
+SCENARIOS = {
+    "help": Scenario(
+        args=["--help"],
+        budget_ms=50,
+        forbidden=HEAVY_MODULES + ("calcifer.cli", "calcifer.commands"),
+    ),
+    "auth0-logs help": Scenario(
+        args=["auth0-logs", "--help"],
+        budget_ms=250,
+        forbidden=("pyarrow", "duckdb", "calcifer.cli.github", "calcifer.cli.jira"),
+    ),
+    "repos-info help": Scenario(
+        args=["repos-info", "--help"],
+        budget_ms=250,
+        forbidden=("pyarrow", "duckdb", "calcifer.cli.auth0", "calcifer.cli.jira"),
+    ),
+}
+
+
+def measure_imports(args: list[str]) -> tuple[float, set[str]]:
+    """Returns the time, in ms, spent importing modules after interpreter startup, and the modules imported."""
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            "from calcifer.calcifer import cli; cli()",
+        ]
+        + args,
+        capture_output=True,
+        text=True,
+    )
+    total_ms = 0.0
+    modules = set()
+    after_startup = False
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        module = name.strip()
+        if after_startup:
+            modules.add(module)
+            # Nested imports are indented further, and already counted by their top level one
+            if len(name) - len(name.lstrip()) == 1:
+                total_ms += int(cumulative) / 1000
+        elif module == "site":
+            after_startup = True
+    return total_ms, modules
+
+
+def check_scenario(name: str, scenario: Scenario) -> bool:
+    runs = [measure_imports(scenario["args"]) for _ in range(RUNS)]
+    total_ms = min(total for total, _ in runs)
+    modules = runs[0][1]
+    forbidden = sorted(
+        module
+        for module in modules
+        if any(
+            module == prefix or module.startswith(prefix + ".")
+            for prefix in scenario["forbidden"]
+        )
+    )
+    passed = total_ms <= scenario["budget_ms"] and not forbidden
+    print(
+        f"{'ok' if passed else 'FAIL':<4} {name:<18} {total_ms:>7.1f}ms (budget {scenario['budget_ms']:.0f}ms), "
+        f"{len(modules)} modules imported"
+    )
+    if forbidden:
+        print(f"     imports {', '.join(forbidden)}")
+    return passed
+
+
+@click.command()
+@click.option(
+    "--budget-factor",
+    type=float,
+    default=1.0,
+    help="Multiplies every budget, e.g. on slow machines",
+)
+def main(budget_factor: float):
+    results = [
+        check_scenario(
+            name, {**scenario, "budget_ms": scenario["budget_ms"] * budget_factor}
+        )
+        for name, scenario in SCENARIOS.items()
+    ]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,428 +1,181 @@
 import click
 from typing import Optional
-from calcifer.services.jira_pager import JiraPager
-from calcifer.commands.jira import (
-    get_issues_for_project,
-    get_issues_change_logs,
-    get_comments_by_issue,
+from calcifer.utils.lazy_group import LazyGroup
+
+# Only click and LazyGroup are imported up front: the group options import what they need when a command runs, so
+# that --help and shell completion stay fast; see benchmarks/startup_time.py
+TRACE_FORMATS = ("otlp", "json")
+PROFILE_MODES = ("cpu", "wall", "memory")
+
+# Commands by name, with the module:function they are defined in and their short help. Modules are only imported when
+# one of their commands runs, so that --help and short runs don't pay for loading all of them.
+LAZY_COMMANDS = {
+    # Github commands
+    "commits-with-tag": (
+        "calcifer.cli.github:commits_with_tag",
+        "Retrieves all commits that match a specific tag across all repos of one or more orgs.",
+    ),
+    "top-contributors": (
+        "calcifer.cli.github:top_contributors",
+        "Retrieves the top n contributors for one or more github orgs.",
+    ),
+    "first-contribution": (
+        "calcifer.cli.github:first_contribution",
+        "Retrieves the very first contribution for all repos in one or more orgs.",
+    ),
+    "unprotected-repos": (
+        "calcifer.cli.github:unprotected_repos",
+        "Retrieves all unprotected repos in one or more orgs.",
+    ),
+    "empty-repos": (
+        "calcifer.cli.github:empty_repos",
+        "Retrieves all repos with no commits.",
+    ),
+    "repos-not-on-main": (
+        "calcifer.cli.github:repos_not_on_main",
+        "Retrieves all repos whose main branch is not called main.",
+    ),
+    "backstage-missing": (
+        "calcifer.cli.github:backstage_missing",
+        "Retrieves all repos that have no catalog-info.yaml.",
+    ),
+    "repos-info": (
+        "calcifer.cli.github:repos_info",
+        "For each repo retrieves whether it is empty, on main, missing backstage and its protections.",
+    ),
+    "repo-last-commit": (
+        "calcifer.cli.github:repo_last_commit",
+        "Retrieves the last commit of every repo in one or more orgs.",
+    ),
+    # Jira commands
+    "issues-with-comments-by": (
+        "calcifer.cli.jira:issues_with_comments_by",
+        "Retrieves the issues of a project commented by a user.",
+    ),
+    "issues-change-status-log": (
+        "calcifer.cli.jira:issues_change_status_log",
+        "Retrieves all status changes of the issues of a project.",
+    ),
+    # Auth0
+    "auth0-logs": (
+        "calcifer.cli.auth0:auth0_logs",
+        "Retrieves all event logs from auth0.",
+    ),
+}
+
+
+def __report_metrics(metrics_file: Optional[str]) -> None:
+    from calcifer.utils.metrics import metrics
+
+    metrics.log_summary()
+    if metrics_file:
+        metrics.write(metrics_file)
+
+
+def __start_trace(command: str):
+    from calcifer.utils.tracing import current_span, tracer
+
+    tracer.enable()
+    root_span = tracer.start_span(command)
+    current_span.set(root_span)
+    return root_span
+
+
+def __write_trace(root_span, trace_file: str, trace_format: str) -> None:
+    from calcifer.utils.tracing import tracer
+
+    tracer.end_span(root_span)
+    tracer.write(trace_file, trace_format)
+
+
+@click.group(cls=LazyGroup, lazy_commands=LAZY_COMMANDS)
+@click.option(
+    "--metrics-file",
+    envvar="CALCIFER_METRICS_FILE",
+    type=str,
+    required=False,
+    help="Writes per-endpoint request counts, latency percentiles and throughput of the run to this json file",
 )
-from pydantic import SecretStr, HttpUrl
-from pathlib import Path
-from calcifer.utils.file_writer import write_to_file
-
-from calcifer.services.github_rest_manager import GithubRestManager
-from calcifer.services.auth0_pager import Auth0FromLogIdPager, Auth0LatestLogsPager
-from calcifer.commands.auth0 import (
-    get_auth0_events_after_log_id,
-    get_auth0_latest_events,
-    flatten_logs,
+@click.option(
+    "--trace-file",
+    envvar="CALCIFER_TRACE_FILE",
+    type=str,
+    required=False,
+    help="Writes a span for each stage, repo, issue and HTTP call of the run to this json file",
 )
-from calcifer.commands.github import (
-    Repo,
-    RepoProtectionInfo,
-    add_protection_to_repo_if_missing,
-    get_all_repos,
-    get_commits_with_tag,
-    get_contributors,
-    get_first_contributions_by_author,
-    get_first_contributions,
-    get_repo_protections_info,
-    get_missing_catalog_info,
-    get_repo_commit_number,
-    get_repos_protections,
-    get_top_contributors,
-    get_last_commit,
+@click.option(
+    "--trace-format",
+    type=click.Choice(TRACE_FORMATS),
+    default="otlp",
+    help="otlp writes OTLP/JSON spans, json writes Chrome trace events for chrome://tracing or Perfetto",
 )
-
-
-@click.command()
-@click.option("--github-user", envvar="GITHUB_USER", type=str, required=True)
-@click.option("--github-token", envvar="GITHUB_TOKEN", type=SecretStr, required=True)
-@click.option("--github-org", type=str, required=True)
-@click.option("--out-file-path", type=str, required=True)
-@click.option("--n-contrib", type=int, default=3)
-@click.option("--ignore-repos", "-i", type=str, multiple=True)
-def top_contributors(
-    github_user: str,
-    github_token: SecretStr,
-    github_org: str,
-    out_file_path: Path,
-    n_contrib: int,
-    ignore_repos: list[str],
-):
-    """Retrieves the top n contributors for a github org."""
-    github_rest_manager = GithubRestManager(
-        user=github_user, token=github_token, url="https://api.github.com/"
-    )
-    repos = get_all_repos(github_rest_manager, ignore_repos, github_org)
-    contributors = get_contributors(github_rest_manager, repos)
-    top_contributors = get_top_contributors(contributors, n_contrib)
-    write_to_file(out_file_path, top_contributors)
-
-
-@click.command()
-@click.option("--github-user", envvar="GITHUB_USER", type=str, required=True)
-@click.option("--github-token", envvar="GITHUB_TOKEN", type=SecretStr, required=True)
-@click.option("--github-org", type=str, required=True)
-@click.option("--out-file-path", type=str, required=True)
-@click.option("--ignore-repos", "-i", type=str, multiple=True)
-def first_contribution(
-    github_user: str,
-    github_token: SecretStr,
-    github_org: str,
-    out_file_path: Path,
-    ignore_repos: list[str],
-):
-    """Retrieves the very first contribution for all repos in an org."""
-    github_rest_manager = GithubRestManager(
-        user=github_user, token=github_token, url="https://api.github.com/"
-    )
-    repos = get_all_repos(github_rest_manager, ignore_repos, github_org)
-    first_contributions = get_first_contributions(github_rest_manager, repos)
-    first_contributions_by_author = get_first_contributions_by_author(
-        first_contributions
-    )
-    write_to_file(out_file_path, first_contributions_by_author)
-
-
-@click.command()
-@click.option("--github-user", envvar="GITHUB_USER", type=str, required=True)
-@click.option("--github-token", envvar="GITHUB_TOKEN", type=SecretStr, required=True)
-@click.option("--github-org", type=str, required=True)
-@click.option("--ignore-repos", "-i", type=str, multiple=True)
-@click.option("--tag", type=str, required=True)
-@click.option("--out-file-path", type=str, required=True)
-def commits_with_tag(
-    github_user: str,
-    github_token: SecretStr,
-    github_org: str,
-    ignore_repos: list[str],
-    tag: str,
-    out_file_path: Path,
-):
-    """Retrieves all commits that matches a specific tag actoss al repositories in an organization and writes them to a csv file."""
-    github_rest_manager = GithubRestManager(
-        user=github_user, token=github_token, url="https://api.github.com/"
-    )
-    repos = get_all_repos(github_rest_manager, ignore_repos, github_org)
-    commits = get_commits_with_tag(github_rest_manager, repos, tag)
-    write_to_file(out_file_path, commits)
-
-
-def __get_empty_repos(
-    github_rest_manager: GithubRestManager, repos: list[Repo]
-) -> list[str]:
-    commits = get_repo_commit_number(github_rest_manager, repos)
-    return [{"name": commit["name"]} for commit in commits if commit["commits"] == 0]
-
-
-@click.command()
-@click.option("--github-user", envvar="GITHUB_USER", type=str, required=True)
-@click.option("--github-token", envvar="GITHUB_TOKEN", type=SecretStr, required=True)
-@click.option("--github-org", type=str, required=True)
-@click.option("--ignore-repos", "-i", type=str, multiple=True)
-@click.option("--out-file-path", type=str, required=True)
-def empty_repos(
-    github_user: str,
-    github_token: SecretStr,
-    github_org: str,
-    ignore_repos: list[str],
-    out_file_path: Path,
-):
-    """Retrieves all repos with no commits and writes them to a csv file."""
-    github_rest_manager = GithubRestManager(
-        user=github_user, token=github_token, url="https://api.github.com/"
-    )
-    repos = get_all_repos(github_rest_manager, ignore_repos, github_org)
-    empty_repos = __get_empty_repos(github_rest_manager, repos)
-    write_to_file(out_file_path, empty_repos)
-
-
-def __get_repos_not_on_main(repos: list[Repo]) -> list[Repo]:
-    return [repo for repo in repos if repo["default_branch"] != "main"]
-
-
-@click.command()
-@click.option("--github-user", envvar="GITHUB_USER", type=str, required=True)
-@click.option("--github-token", envvar="GITHUB_TOKEN", type=SecretStr, required=True)
-@click.option("--github-org", type=str, required=True)
-@click.option("--ignore-repos", "-i", type=str, multiple=True)
-@click.option("--out-file-path", type=str, required=True)
-def repos_not_on_main(
-    github_user: str,
-    github_token: SecretStr,
-    github_org: str,
-    ignore_repos: list[str],
-    out_file_path: Path,
-):
-    """Retrieves all repos whose main branch is not called main."""
-    github_rest_manager = GithubRestManager(
-        user=github_user, token=github_token, url="https://api.github.com/"
-    )
-    repos = get_all_repos(github_rest_manager, ignore_repos, github_org)
-    write_to_file(out_file_path, __get_repos_not_on_main(repos))
-
-
-@click.command()
-@click.option("--github-user", envvar="GITHUB_USER", type=str, required=True)
-@click.option("--github-token", envvar="GITHUB_TOKEN", type=SecretStr, required=True)
-@click.option("--github-org", type=str, required=True)
-@click.option("--ignore-repos", "-i", type=str, multiple=True)
-@click.option("--out-file-path", type=str, required=True)
-def backstage_missing(
-    github_user: str,
-    github_token: SecretStr,
-    github_org: str,
-    ignore_repos: list[str],
-    out_file_path: Path,
-):
-    """Retrieves all repos that have no catalog-info.yaml and writes them to a csv file."""
-    github_rest_manager = GithubRestManager(
-        user=github_user, token=github_token, url="https://api.github.com/"
-    )
-    repos = get_all_repos(github_rest_manager, ignore_repos, github_org)
-    repos = get_missing_catalog_info(github_rest_manager, repos)
-    write_to_file(out_file_path, repos)
-
-
-def __get_repo_protection_info(
-    github_rest_manager: GithubRestManager, repos: list[Repo], github_org: str
-) -> list[RepoProtectionInfo]:
-    repos_protections = get_repos_protections(github_rest_manager, repos, github_org)
-    return get_repo_protections_info(repos_protections)
-
-
-@click.command()
-@click.option("--github-user", envvar="GITHUB_USER", type=str, required=True)
-@click.option("--github-token", envvar="GITHUB_TOKEN", type=SecretStr, required=True)
-@click.option("--github-org", type=str, required=True)
-@click.option("--out-file-path", type=str, required=True)
-@click.option("--ignore-repos", "-i", type=str, multiple=True)
-@click.option("--add-protection-if-missing", type=bool, required=True, default=False)
-def unprotected_repos(
-    github_user: str,
-    github_token: SecretStr,
-    github_org: str,
-    out_file_path: Path,
-    ignore_repos: list[str],
-    add_protection_if_missing: bool,
-):
-    """Retrieves all unprotected repos in an organization and writes them to a csv file.
-
-    A protected repo is one that satisfy the following rules:
-    * required_pull_request_reviews.dismiss_stale_reviews is True
-    * required_pull_request_reviews.required_approving_review_count > 0
-    * required_linear_history is True
-        * allow_force_pushes is False
-        * required_status_checks.strict is True
-    * enforce_admins is False
-    * restrictions is None
-    """
-    github_rest_manager = GithubRestManager(
-        user=github_user, token=github_token, url="https://api.github.com/"
-    )
-    repos = get_all_repos(github_rest_manager, ignore_repos, github_org)
-    flatten_repos_protections = __get_repo_protection_info(
-        github_rest_manager, repos, github_org
-    )
-
-    if add_protection_if_missing:
-        add_protection_to_repo_if_missing(
-            github_rest_manager, flatten_repos_protections, github_org
-        )
-    write_to_file(out_file_path, flatten_repos_protections)
-
-
-@click.command()
-@click.option("--github-user", envvar="GITHUB_USER", type=str, required=True)
-@click.option("--github-token", envvar="GITHUB_TOKEN", type=SecretStr, required=True)
-@click.option("--github-org", type=str, required=True)
-@click.option("--out-file-path", type=str, required=True)
-@click.option("--ignore-repos", "-i", type=str, multiple=True)
-def repo_last_commit(
-    github_user: str,
-    github_token: SecretStr,
-    github_org: str,
-    out_file_path: Path,
-    ignore_repos: list[str],
-):
-    github_rest_manager = GithubRestManager(
-        user=github_user, token=github_token, url="https://api.github.com/"
-    )
-    repos = get_all_repos(github_rest_manager, ignore_repos, github_org)
-    last_commits = get_last_commit(github_rest_manager, repos)
-    write_to_file(out_file_path, last_commits)
-
-
-@click.command()
-@click.option("--github-user", envvar="GITHUB_USER", type=str, required=True)
-@click.option("--github-token", envvar="GITHUB_TOKEN", type=SecretStr, required=True)
-@click.option("--github-org", type=str, required=True)
-@click.option("--out-file-path", type=str, required=True)
-@click.option("--ignore-repos", "-i", type=str, multiple=True)
-def repos_info(
-    github_user: str,
-    github_token: SecretStr,
-    github_org: str,
-    out_file_path: Path,
-    ignore_repos: list[str],
-):
-    github_rest_manager = GithubRestManager(
-        user=github_user, token=github_token, url="https://api.github.com/"
-    )
-    repos = get_all_repos(github_rest_manager, ignore_repos, github_org)
-    empty_repos = [repo["name"] for repo in __get_empty_repos(github_rest_manager, repos)]
-    repos_not_on_main = {repo["name"]: repo for repo in __get_repos_not_on_main(repos)}
-    repos_with_missing_backstage = {
-        repo["name"]: repo
-        for repo in get_missing_catalog_info(github_rest_manager, repos)
-    }
-    repos_protection_info = {
-        repo["name"]: repo
-        for repo in __get_repo_protection_info(github_rest_manager, repos, github_org)
-    }
-    last_commits = {
-        commit["repo"]: commit for commit in get_last_commit(github_rest_manager, repos)
-    }
-
-    repos_info = []
-    for repo in repos:
-        repo_info = {
-            "name": repo["name"],
-            "is_empty": False,
-            "is_on_main": True,
-            "is_backstage_missing": False,
-        }
-        if repo["name"] in empty_repos:
-            repo_info["is_empty"] = True
-        if repo["name"] in repos_not_on_main:
-            repo_info["is_on_main"] = False
-        if repo["name"] in repos_with_missing_backstage:
-            repo_info["is_backstage_missing"] = True
-        repo_info.update(repos_protection_info.get(repo["name"], {}))
-        repo_info.update(last_commits.get(repo["name"], {}))
-        repos_info.append(repo_info)
-
-    write_to_file(out_file_path, repos_info)
-
-
-@click.command()
-@click.option("--jira-user", envvar="JIRA_USER", type=str, required=True)
 @click.option(
-    "--jira-api-token", envvar="JIRA_API_TOKEN", type=SecretStr, required=True
+    "--record-file",
+    type=str,
+    required=False,
+    help="Records every HTTP response of the run to this gzipped archive, for --replay-file",
 )
 @click.option(
-    "--jira-url",
-    envvar="JIRA_URL",
+    "--replay-file",
     type=str,
-    required=True,
-    default="https://instapartners.atlassian.net",
+    required=False,
+    help="Serves the HTTP responses recorded by --record-file instead of calling the apis",
 )
-@click.option("--search-for-user", type=str, required=True)
-@click.option("--jira-project", type=str, required=True)
 @click.option(
-    "--since", envvar="SINCE", type=str, required=True, default="startOfYear()"
+    "--replay-latency",
+    type=float,
+    default=0.0,
+    help="Waits this many times the recorded latency of each replayed response; 0 replays at full speed",
 )
-@click.option("--out-file-path", type=str, required=True)
-def issues_with_comments_by(
-    jira_user: str,
-    jira_api_token: SecretStr,
-    jira_url: HttpUrl,
-    search_for_user: str,
-    jira_project: str,
-    since: str,
-    out_file_path: Path,
-):
-    jira_pager = JiraPager(jira_url, jira_user, jira_api_token)
-    issues = get_issues_for_project(jira_pager, jira_project, since)
-    issues_comments = get_comments_by_issue(jira_pager, issues, search_for_user)
-    write_to_file(out_file_path, issues_comments)
-
-
-@click.command()
-@click.option("--jira-user", envvar="JIRA_USER", type=str, required=True)
 @click.option(
-    "--jira-api-token", envvar="JIRA_API_TOKEN", type=SecretStr, required=True
+    "--profile",
+    type=click.Choice(PROFILE_MODES),
+    required=False,
+    help="Profiles the command by cpu or wall time (cProfile) or memory (tracemalloc) and reports the top functions "
+    "or allocation sites, with the split between network and cpu time",
 )
 @click.option(
-    "--jira-url",
-    envvar="JIRA_URL",
+    "--profile-file",
     type=str,
-    required=True,
-    default="https://instapartners.atlassian.net",
+    required=False,
+    help="Writes the --profile report to this file, and the cProfile stats next to it as .pstats, instead of printing it",
 )
-@click.option("--jira-project", envvar="JIRA_PROJECT", type=str, required=True)
 @click.option(
-    "--since", envvar="SINCE", type=str, required=True, default="startOfYear()"
+    "--log-level",
+    envvar="CALCIFER_LOG_LEVEL",
+    type=str,
+    multiple=True,
+    help="Sets the log level, e.g. warning, or the level of a module and its submodules, e.g. "
+    "calcifer.services.rest_pager=debug for a log line per request; can be repeated",
 )
-@click.option("--out-file-path", type=str, required=True)
-def issues_change_status_log(
-    jira_user: str,
-    jira_api_token: SecretStr,
-    jira_url: HttpUrl,
-    jira_project: str,
-    since: str,
-    out_file_path: Path,
-):
-    """This command retrieves the list of all status changes for all issues created from `since` of project `jira_project`."""
-    jira_pager = JiraPager(jira_url, jira_user, jira_api_token)
-    issues = get_issues_for_project(jira_pager, jira_project, since)
-    change_log = get_issues_change_logs(jira_pager, issues)
-    write_to_file(out_file_path, change_log)
-
-
-@click.command()
-@click.option("--auth0-token", envvar="AUTH0_TOKEN", type=SecretStr, required=True)
 @click.option(
-    "--auth0-url",
-    envvar="AUTH0_URL",
-    type=str,
-    required=True,
-    default="https://credimi.eu.auth0.com/api/v2",
+    "--log-sample-rate",
+    type=click.FloatRange(0, 1, min_open=True),
+    default=1.0,
+    help="Writes only this fraction of the debug messages of each line of code, e.g. 0.01 for one every 100",
 )
-@click.option("--auth0-from-log-id", envvar="FROM_EVENT_ID", type=str, required=False)
 @click.option(
-    "--auth0-search_str",
-    type=str,
-    required=False,
-    default='client_name%3D"Futuro User Platform"',
+    "--log-max-repeats",
+    type=int,
+    default=20,
+    help="Writes at most this many debug messages from the same line of code every 10s, counting the ones dropped; "
+    "0 writes them all",
 )
-@click.option("--out-file-path", type=str, required=True)
-def auth0_logs(
-    auth0_token: SecretStr,
-    auth0_url: HttpUrl,
-    auth0_from_log_id: Optional[str],
-    auth0_search_str: Optional[str],
-    out_file_path: Path,
+@click.pass_context
+def cli(
+    ctx: click.Context,
+    metrics_file: Optional[str],
+    trace_file: Optional[str],
+    trace_format: str,
+    record_file: Optional[str],
+    replay_file: Optional[str],
+    replay_latency: float,
+    profile: Optional[str],
+    profile_file: Optional[str],
+    log_level: tuple[str, ...],
+    log_sample_rate: float,
+    log_max_repeats: int,
 ):
-    """Retrieves all event logs from auth0.
-
-    If auth0-from-log-id is given as input, then all events after that log id are fecthed. Else, only
-    the last 1000 commits will be retrieved. This is a limitation of auth0 APIs, if you try to go back in time
-    for more than 1000 commits, you'll get the following error message:
-
-    Requesting page 11 exceeds the allowed maximum of 1000 records: please consider searching by checkpoint
-    https://auth0.com/docs/logs/retrieve-log-events-using-mgmt-api#retrieve-logs-by-checkpoint
-
-    The easiest way to retrieve the log id is to use the UI, go to the search page, select the earliest date and select
-    the earliest entry from the result page.
-    """
-    if auth0_from_log_id:
-        auth0_pager = Auth0FromLogIdPager(bearer=auth0_token, url=auth0_url)
-        logs = get_auth0_events_after_log_id(
-            auth0_pager, auth0_from_log_id, auth0_search_str
-        )
-    else:
-        auth0_pager = Auth0LatestLogsPager(bearer=auth0_token, url=auth0_url)
-        logs = get_auth0_latest_events(auth0_pager, auth0_search_str)
-
-    flatten_logs(logs)
-
-    write_to_file(out_file_path, logs)
-
-
-@click.group()
-def cli():
     """
     \b
                                        /
@@ -447,23 +200,34 @@ def cli():
             /////,,,,,,,%       (................%    %,,,,,,,,/////
              ////,,,,,,,..................,,,,,,,,,,..,,,,,,,,/////&/.
     """
-    pass
-
-
-# Github commands
-cli.add_command(commits_with_tag)
-cli.add_command(top_contributors)
-cli.add_command(first_contribution)
-cli.add_command(unprotected_repos)
-cli.add_command(empty_repos)
-cli.add_command(repos_not_on_main)
-cli.add_command(backstage_missing)
-cli.add_command(repos_info)
-cli.add_command(repo_last_commit)
-
-# Jira commands
-cli.add_command(issues_with_comments_by)
-cli.add_command(issues_change_status_log)
-
-# Auth0
-cli.add_command(auth0_logs)
+    from calcifer.utils.json_logger import configure_logging
+    from calcifer.utils.metrics import metrics
+
+    try:
+        configure_logging(log_level, log_sample_rate, log_max_repeats)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--log-level")
+    metrics.reset()
+    metrics.measure_projection = bool(metrics_file)
+    ctx.call_on_close(lambda: __report_metrics(metrics_file))
+    if trace_file:
+        root_span = __start_trace(ctx.invoked_subcommand)
+        ctx.call_on_close(lambda: __write_trace(root_span, trace_file, trace_format))
+    if record_file and replay_file:
+        raise click.UsageError("--record-file and --replay-file can't be used together")
+    if record_file or replay_file:
+        from calcifer.utils.cache import disable_file_cache
+        from calcifer.utils.http_archive import http_archive
+
+        # Every request has to go through the archive, not be answered by the file cache
+        disable_file_cache()
+        if record_file:
+            http_archive.start_recording(record_file)
+        else:
+            http_archive.start_replay(replay_file, replay_latency)
+        ctx.call_on_close(http_archive.close)
+    if profile:
+        from calcifer.utils.profiling import profiler
+
+        profiler.start(profile)
+        ctx.call_on_close(lambda: profiler.stop(ctx.invoked_subcommand, profile_file))
@@ -0,0 +1,233 @@
+import click
+from datetime import datetime, timedelta
+from typing import Optional
+from pydantic import SecretStr, HttpUrl
+from pathlib import Path
+from calcifer.utils.file_writer import (
+    NDJSON_FORMATS,
+    OUTPUT_FORMATS,
+    OutputFormat,
+    write_columns_to_file,
+    write_ndjson_to_file,
+)
+from calcifer.utils.json_file import read_json_file, write_json_file
+from calcifer.utils.json_logger import get_logger
+from calcifer.utils.worker_pool import DEFAULT_MAX_WORKERS
+from calcifer.services.auth0_pager import Auth0FromLogIdPager, Auth0LatestLogsPager
+from calcifer.commands.auth0 import (
+    AUTH0_LOG_FIELDS,
+    AUTH0_LOG_SCHEMA,
+    DEFAULT_POLL_INTERVAL,
+    DEFAULT_WINDOW_HOURS,
+    get_auth0_events_after_log_id,
+    get_auth0_events_by_window,
+    get_auth0_latest_events,
+    flatten_logs_to_columns,
+    tail_auth0_events,
+)
+
+logger = get_logger(__name__)
+
+
+def __get_auth0_log_fields(output_format: OutputFormat) -> Optional[list[str]]:
+    # ndjson keeps the whole log payload, other formats only the flattened fields
+    return None if output_format in NDJSON_FORMATS else AUTH0_LOG_FIELDS
+
+
+def __write_auth0_logs(
+    out_file_path: Path, logs: list[dict], output_format: OutputFormat, append=False
+):
+    if output_format in NDJSON_FORMATS:
+        write_ndjson_to_file(out_file_path, logs, output_format, append=append)
+    else:
+        write_columns_to_file(
+            out_file_path,
+            flatten_logs_to_columns(logs),
+            append=append,
+            output_format=output_format,
+            column_types=AUTH0_LOG_SCHEMA,
+            table="auth0_logs",
+            key=("log_id",),
+        )
+
+
+def __tail_auth0_logs(
+    auth0_token: SecretStr,
+    auth0_url: HttpUrl,
+    auth0_from_log_id: Optional[str],
+    auth0_search_str: Optional[str],
+    out_file_path: Path,
+    output_format: OutputFormat,
+    checkpoint_file: Optional[str],
+    follow: bool,
+    poll_interval: int,
+):
+    if checkpoint_file:
+        auth0_from_log_id = read_json_file(checkpoint_file, {}).get(
+            "log_id", auth0_from_log_id
+        )
+    if not auth0_from_log_id:
+        raise click.UsageError(
+            "--auth0-from-log-id is required when there is no checkpoint to resume from"
+        )
+    logger.info(f"Appending events after {auth0_from_log_id} to {out_file_path}")
+    auth0_pager = Auth0FromLogIdPager(
+        bearer=auth0_token,
+        url=auth0_url,
+        fields=__get_auth0_log_fields(output_format),
+    )
+    try:
+        for logs in tail_auth0_events(
+            auth0_pager, auth0_from_log_id, auth0_search_str, follow, poll_interval
+        ):
+            last_log_id = logs[-1]["log_id"]
+            __write_auth0_logs(out_file_path, logs, output_format, append=True)
+            if checkpoint_file:
+                write_json_file(checkpoint_file, {"log_id": last_log_id})
+    except KeyboardInterrupt:
+        logger.info("Stopped following auth0 events")
+    auth0_pager.log_projection_summary()
+
+
+@click.command()
+@click.option("--auth0-token", envvar="AUTH0_TOKEN", type=SecretStr, required=True)
+@click.option(
+    "--auth0-url",
+    envvar="AUTH0_URL",
+    type=str,
+    required=True,
+    default="https://credimi.eu.auth0.com/api/v2",
+)
+@click.option("--auth0-from-log-id", envvar="FROM_EVENT_ID", type=str, required=False)
+@click.option(
+    "--auth0-search_str",
+    type=str,
+    required=False,
+    default='client_name%3D"Futuro User Platform"',
+)
+@click.option("--out-file-path", type=str, required=True)
+@click.option("--output-format", type=click.Choice(OUTPUT_FORMATS), default="csv")
+@click.option(
+    "--checkpoint-file",
+    envvar="AUTH0_CHECKPOINT_FILE",
+    type=str,
+    required=False,
+    help="Stores the last exported log id; when it exists the export resumes from it and appends to out-file-path",
+)
+@click.option(
+    "--follow",
+    is_flag=True,
+    default=False,
+    help="Keep polling for new events once caught up, until interrupted",
+)
+@click.option(
+    "--poll-interval",
+    type=int,
+    default=DEFAULT_POLL_INTERVAL,
+    help="Seconds to wait between polls in follow mode",
+)
+@click.option(
+    "--auth0-from-date",
+    type=click.DateTime(),
+    required=False,
+    help="Export all events from this date (UTC), searching date windows concurrently",
+)
+@click.option(
+    "--auth0-to-date",
+    type=click.DateTime(),
+    required=False,
+    help="End (UTC) of the auth0-from-date export, defaults to now",
+)
+@click.option(
+    "--window-hours",
+    type=int,
+    default=DEFAULT_WINDOW_HOURS,
+    help="Size of the date windows searched concurrently by the auth0-from-date export",
+)
+@click.option("--max-workers", type=int, default=DEFAULT_MAX_WORKERS)
+def auth0_logs(
+    auth0_token: SecretStr,
+    auth0_url: HttpUrl,
+    auth0_from_log_id: Optional[str],
+    auth0_search_str: Optional[str],
+    out_file_path: Path,
+    output_format: OutputFormat,
+    checkpoint_file: Optional[str],
+    follow: bool,
+    poll_interval: int,
+    auth0_from_date: Optional[datetime],
+    auth0_to_date: Optional[datetime],
+    window_hours: int,
+    max_workers: int,
+):
+    """Retrieves all event logs from auth0.
+
+    If auth0-from-log-id is given as input, then all events after that log id are fecthed. Else, only
+    the last 1000 commits will be retrieved. This is a limitation of auth0 APIs, if you try to go back in time
+    for more than 1000 commits, you'll get the following error message:
+
+    Requesting page 11 exceeds the allowed maximum of 1000 records: please consider searching by checkpoint
+    https://auth0.com/docs/logs/retrieve-log-events-using-mgmt-api#retrieve-logs-by-checkpoint
+
+    The easiest way to retrieve the log id is to use the UI, go to the search page, select the earliest date and select
+    the earliest entry from the result page.
+
+    With checkpoint-file and/or follow, events are appended to out-file-path one page at a time and the last exported
+    log id is saved after every page, so an interrupted export resumes where it stopped.
+
+    With auth0-from-date, the events in the date range are searched in date windows concurrently instead, which is much
+    faster than following log ids for large exports. Only events still within the tenant log retention can be found.
+    """
+    if auth0_from_date:
+        if auth0_from_log_id or checkpoint_file or follow:
+            raise click.UsageError(
+                "--auth0-from-date can't be used together with a log id, checkpoint or follow"
+            )
+        auth0_pager = Auth0LatestLogsPager(
+            bearer=auth0_token,
+            url=auth0_url,
+            fields=__get_auth0_log_fields(output_format),
+        )
+        logs = get_auth0_events_by_window(
+            auth0_pager,
+            auth0_search_str,
+            (auth0_from_date, auth0_to_date or datetime.utcnow()),
+            timedelta(hours=window_hours),
+            max_workers=max_workers,
+        )
+    elif checkpoint_file or follow:
+        if output_format in ("parquet", "arrow"):
+            raise click.UsageError(
+                "--checkpoint-file and --follow append to the output, which parquet and arrow files don't support"
+            )
+        __tail_auth0_logs(
+            auth0_token,
+            auth0_url,
+            auth0_from_log_id,
+            auth0_search_str,
+            out_file_path,
+            output_format,
+            checkpoint_file,
+            follow,
+            poll_interval,
+        )
+        return
+    elif auth0_from_log_id:
+        auth0_pager = Auth0FromLogIdPager(
+            bearer=auth0_token,
+            url=auth0_url,
+            fields=__get_auth0_log_fields(output_format),
+        )
+        logs = get_auth0_events_after_log_id(
+            auth0_pager, auth0_from_log_id, auth0_search_str
+        )
+    else:
+        auth0_pager = Auth0LatestLogsPager(
+            bearer=auth0_token,
+            url=auth0_url,
+            fields=__get_auth0_log_fields(output_format),
+        )
+        logs = get_auth0_latest_events(auth0_pager, auth0_search_str)
+
+    __write_auth0_logs(out_file_path, logs, output_format)
+    auth0_pager.log_projection_summary()
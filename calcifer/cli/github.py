@@ -0,0 +1,557 @@
+import click
+from typing import Callable, Optional
+from pydantic import SecretStr, HttpUrl
+from pathlib import Path
+from calcifer.utils.cache import disable_file_cache
+from calcifer.utils.file_writer import (
+    NDJSON_FORMATS,
+    OUTPUT_FORMATS,
+    OutputFormat,
+    write_to_file,
+)
+from calcifer.utils.tracing import traced
+from calcifer.utils.watermark_store import RepoWatermarkStore
+from calcifer.utils.worker_pool import DEFAULT_MAX_WORKERS, map_concurrently
+from calcifer.services.github_rest_manager import DEFAULT_GITHUB_URL, GithubRestManager
+from calcifer.services.git_mirror import GitMirror
+from calcifer.models.github import AuthorContribution, FlattenCommit
+from calcifer.commands.github import (
+    Repo,
+    RepoProtectionInfo,
+    add_protection_to_repo_if_missing,
+    get_all_repos,
+    get_commits_with_tag,
+    get_contributors,
+    get_first_contributions_by_author,
+    get_first_contributions,
+    get_first_contributions_from_mirror,
+    get_commits_with_tag_from_mirror,
+    get_last_commit_from_mirror,
+    get_repo_commit_number_from_mirror,
+    get_repo_protections_info,
+    get_missing_catalog_info,
+    get_repo_commit_number,
+    get_repos_info,
+    get_repos_protections,
+    get_top_contributors,
+    get_last_commit,
+    sync_repo_mirrors,
+)
+
+
+def __get_github_rest_manager(
+    github_user: str, github_token: SecretStr, github_url: HttpUrl
+) -> GithubRestManager:
+    return GithubRestManager(user=github_user, token=github_token, url=github_url)
+
+
+def __get_watermark_store(state_file: Optional[Path]) -> Optional[RepoWatermarkStore]:
+    if not state_file:
+        return None
+    disable_file_cache()
+    return RepoWatermarkStore(state_file)
+
+
+def __save_watermark_store(watermark_store: Optional[RepoWatermarkStore]) -> None:
+    if watermark_store:
+        watermark_store.save()
+
+
+def __for_each_org(
+    github_orgs: tuple[str, ...], get_org_rows: Callable[[str], list[dict]]
+) -> list[dict]:
+    """Runs get_org_rows for all orgs concurrently and merges the results, adding an org column."""
+    traced_get_org_rows = traced("org", attributes=lambda org: {"org": org})(
+        get_org_rows
+    )
+    rows_by_org = dict(
+        map_concurrently(
+            traced_get_org_rows,
+            github_orgs,
+            max_workers=len(github_orgs),
+            show_progress=False,
+        )
+    )
+    return [{"org": org, **row} for org in github_orgs for row in rows_by_org[org]]
+
+
+@click.command()
+@click.option("--github-user", envvar="GITHUB_USER", type=str, required=True)
+@click.option("--github-token", envvar="GITHUB_TOKEN", type=SecretStr, required=True)
+@click.option(
+    "--github-url", envvar="GITHUB_API_URL", type=str, default=DEFAULT_GITHUB_URL
+)
+@click.option("--github-org", "github_orgs", type=str, required=True, multiple=True)
+@click.option("--out-file-path", type=str, required=True)
+@click.option("--output-format", type=click.Choice(OUTPUT_FORMATS), default="csv")
+@click.option("--n-contrib", type=int, default=3)
+@click.option("--ignore-repos", "-i", type=str, multiple=True)
+@click.option("--state-file", envvar="GITHUB_STATE_FILE", type=str, required=False)
+def top_contributors(
+    github_user: str,
+    github_token: SecretStr,
+    github_url: HttpUrl,
+    github_orgs: tuple[str, ...],
+    out_file_path: Path,
+    output_format: OutputFormat,
+    n_contrib: int,
+    ignore_repos: list[str],
+    state_file: Optional[Path],
+):
+    """Retrieves the top n contributors for one or more github orgs."""
+    github_rest_manager = __get_github_rest_manager(
+        github_user, github_token, github_url
+    )
+    watermark_store = __get_watermark_store(state_file)
+
+    def get_org_top_contributors(github_org: str) -> list[dict]:
+        repos = get_all_repos(github_rest_manager, ignore_repos, github_org)
+        contributors = get_contributors(
+            github_rest_manager, repos, watermark_store=watermark_store
+        )
+        return get_top_contributors(contributors, n_contrib)
+
+    write_to_file(
+        out_file_path,
+        __for_each_org(github_orgs, get_org_top_contributors),
+        output_format=output_format,
+        table="top_contributors",
+        key=("org", "repo"),
+    )
+    __save_watermark_store(watermark_store)
+
+
+@click.command()
+@click.option("--github-user", envvar="GITHUB_USER", type=str, required=True)
+@click.option("--github-token", envvar="GITHUB_TOKEN", type=SecretStr, required=True)
+@click.option(
+    "--github-url", envvar="GITHUB_API_URL", type=str, default=DEFAULT_GITHUB_URL
+)
+@click.option("--github-org", "github_orgs", type=str, required=True, multiple=True)
+@click.option("--out-file-path", type=str, required=True)
+@click.option("--output-format", type=click.Choice(OUTPUT_FORMATS), default="csv")
+@click.option("--ignore-repos", "-i", type=str, multiple=True)
+@click.option("--state-file", envvar="GITHUB_STATE_FILE", type=str, required=False)
+@click.option("--git-mirror-dir", envvar="GIT_MIRROR_DIR", type=str, required=False)
+def first_contribution(
+    github_user: str,
+    github_token: SecretStr,
+    github_url: HttpUrl,
+    github_orgs: tuple[str, ...],
+    out_file_path: Path,
+    output_format: OutputFormat,
+    ignore_repos: list[str],
+    state_file: Optional[Path],
+    git_mirror_dir: Optional[Path],
+):
+    """Retrieves the very first contribution for all repos in one or more orgs.
+
+    If git-mirror-dir is given, commit history is read from local partial mirrors kept in that folder instead of the
+    REST API.
+    """
+    github_rest_manager = __get_github_rest_manager(
+        github_user, github_token, github_url
+    )
+    watermark_store = __get_watermark_store(state_file)
+    git_mirror = (
+        GitMirror(git_mirror_dir, github_user, github_token) if git_mirror_dir else None
+    )
+
+    def get_org_first_contributions(github_org: str) -> list[dict]:
+        repos = get_all_repos(github_rest_manager, ignore_repos, github_org)
+        if git_mirror:
+            sync_repo_mirrors(git_mirror, repos)
+            first_contributions = get_first_contributions_from_mirror(git_mirror, repos)
+        else:
+            first_contributions = get_first_contributions(
+                github_rest_manager, repos, watermark_store=watermark_store
+            )
+        return get_first_contributions_by_author(first_contributions)
+
+    write_to_file(
+        out_file_path,
+        __for_each_org(github_orgs, get_org_first_contributions),
+        output_format=output_format,
+        table="first_contribution",
+        key=("org", "author"),
+        model=AuthorContribution,
+    )
+    __save_watermark_store(watermark_store)
+
+
+@click.command()
+@click.option("--github-user", envvar="GITHUB_USER", type=str, required=True)
+@click.option("--github-token", envvar="GITHUB_TOKEN", type=SecretStr, required=True)
+@click.option(
+    "--github-url", envvar="GITHUB_API_URL", type=str, default=DEFAULT_GITHUB_URL
+)
+@click.option("--github-org", "github_orgs", type=str, required=True, multiple=True)
+@click.option("--ignore-repos", "-i", type=str, multiple=True)
+@click.option("--state-file", envvar="GITHUB_STATE_FILE", type=str, required=False)
+@click.option("--tag", type=str, required=True)
+@click.option("--out-file-path", type=str, required=True)
+@click.option("--output-format", type=click.Choice(OUTPUT_FORMATS), default="csv")
+@click.option("--git-mirror-dir", envvar="GIT_MIRROR_DIR", type=str, required=False)
+def commits_with_tag(
+    github_user: str,
+    github_token: SecretStr,
+    github_url: HttpUrl,
+    github_orgs: tuple[str, ...],
+    ignore_repos: list[str],
+    state_file: Optional[Path],
+    tag: str,
+    out_file_path: Path,
+    output_format: OutputFormat,
+    git_mirror_dir: Optional[Path],
+):
+    """Retrieves all commits that matches a specific tag actoss al repositories in one or more organizations and writes them to a csv file."""
+    github_rest_manager = __get_github_rest_manager(
+        github_user, github_token, github_url
+    )
+    watermark_store = __get_watermark_store(state_file)
+    git_mirror = (
+        GitMirror(git_mirror_dir, github_user, github_token) if git_mirror_dir else None
+    )
+
+    def get_org_commits_with_tag(github_org: str) -> list[dict]:
+        repos = get_all_repos(github_rest_manager, ignore_repos, github_org)
+        if git_mirror:
+            sync_repo_mirrors(git_mirror, repos)
+            return get_commits_with_tag_from_mirror(git_mirror, repos, tag)
+        return get_commits_with_tag(
+            github_rest_manager, repos, tag, watermark_store=watermark_store
+        )
+
+    write_to_file(
+        out_file_path,
+        __for_each_org(github_orgs, get_org_commits_with_tag),
+        output_format=output_format,
+        table="commits_with_tag",
+        key=("org", "repo", "tag"),
+        model=FlattenCommit,
+    )
+    __save_watermark_store(watermark_store)
+
+
+def __get_empty_repos(
+    github_rest_manager: GithubRestManager,
+    repos: list[Repo],
+    git_mirror: Optional[GitMirror] = None,
+    watermark_store: Optional[RepoWatermarkStore] = None,
+) -> list[str]:
+    if git_mirror:
+        sync_repo_mirrors(git_mirror, repos)
+        commits = get_repo_commit_number_from_mirror(git_mirror, repos)
+    else:
+        commits = get_repo_commit_number(
+            github_rest_manager, repos, watermark_store=watermark_store
+        )
+    return [{"name": commit["name"]} for commit in commits if commit["commits"] == 0]
+
+
+@click.command()
+@click.option("--github-user", envvar="GITHUB_USER", type=str, required=True)
+@click.option("--github-token", envvar="GITHUB_TOKEN", type=SecretStr, required=True)
+@click.option(
+    "--github-url", envvar="GITHUB_API_URL", type=str, default=DEFAULT_GITHUB_URL
+)
+@click.option("--github-org", "github_orgs", type=str, required=True, multiple=True)
+@click.option("--ignore-repos", "-i", type=str, multiple=True)
+@click.option("--state-file", envvar="GITHUB_STATE_FILE", type=str, required=False)
+@click.option("--out-file-path", type=str, required=True)
+@click.option("--output-format", type=click.Choice(OUTPUT_FORMATS), default="csv")
+@click.option("--git-mirror-dir", envvar="GIT_MIRROR_DIR", type=str, required=False)
+def empty_repos(
+    github_user: str,
+    github_token: SecretStr,
+    github_url: HttpUrl,
+    github_orgs: tuple[str, ...],
+    ignore_repos: list[str],
+    state_file: Optional[Path],
+    out_file_path: Path,
+    output_format: OutputFormat,
+    git_mirror_dir: Optional[Path],
+):
+    """Retrieves all repos with no commits and writes them to a csv file."""
+    github_rest_manager = __get_github_rest_manager(
+        github_user, github_token, github_url
+    )
+    watermark_store = __get_watermark_store(state_file)
+    git_mirror = (
+        GitMirror(git_mirror_dir, github_user, github_token) if git_mirror_dir else None
+    )
+
+    def get_org_empty_repos(github_org: str) -> list[dict]:
+        repos = get_all_repos(github_rest_manager, ignore_repos, github_org)
+        return __get_empty_repos(
+            github_rest_manager, repos, git_mirror, watermark_store
+        )
+
+    write_to_file(
+        out_file_path,
+        __for_each_org(github_orgs, get_org_empty_repos),
+        output_format=output_format,
+        table="empty_repos",
+        key=("org", "name"),
+    )
+    __save_watermark_store(watermark_store)
+
+
+def __get_repos_not_on_main(repos: list[Repo]) -> list[Repo]:
+    return [repo for repo in repos if repo["default_branch"] != "main"]
+
+
+@click.command()
+@click.option("--github-user", envvar="GITHUB_USER", type=str, required=True)
+@click.option("--github-token", envvar="GITHUB_TOKEN", type=SecretStr, required=True)
+@click.option(
+    "--github-url", envvar="GITHUB_API_URL", type=str, default=DEFAULT_GITHUB_URL
+)
+@click.option("--github-org", "github_orgs", type=str, required=True, multiple=True)
+@click.option("--ignore-repos", "-i", type=str, multiple=True)
+@click.option("--out-file-path", type=str, required=True)
+@click.option("--output-format", type=click.Choice(OUTPUT_FORMATS), default="csv")
+def repos_not_on_main(
+    github_user: str,
+    github_token: SecretStr,
+    github_url: HttpUrl,
+    github_orgs: tuple[str, ...],
+    ignore_repos: list[str],
+    out_file_path: Path,
+    output_format: OutputFormat,
+):
+    """Retrieves all repos whose main branch is not called main."""
+    github_rest_manager = __get_github_rest_manager(
+        github_user, github_token, github_url
+    )
+
+    def get_org_repos_not_on_main(github_org: str) -> list[dict]:
+        repos = get_all_repos(github_rest_manager, ignore_repos, github_org)
+        return __get_repos_not_on_main(repos)
+
+    write_to_file(
+        out_file_path,
+        __for_each_org(github_orgs, get_org_repos_not_on_main),
+        output_format=output_format,
+        table="repos_not_on_main",
+        key=("org", "name"),
+        model=Repo,
+    )
+
+
+@click.command()
+@click.option("--github-user", envvar="GITHUB_USER", type=str, required=True)
+@click.option("--github-token", envvar="GITHUB_TOKEN", type=SecretStr, required=True)
+@click.option(
+    "--github-url", envvar="GITHUB_API_URL", type=str, default=DEFAULT_GITHUB_URL
+)
+@click.option("--github-org", "github_orgs", type=str, required=True, multiple=True)
+@click.option("--ignore-repos", "-i", type=str, multiple=True)
+@click.option("--state-file", envvar="GITHUB_STATE_FILE", type=str, required=False)
+@click.option("--out-file-path", type=str, required=True)
+@click.option("--output-format", type=click.Choice(OUTPUT_FORMATS), default="csv")
+def backstage_missing(
+    github_user: str,
+    github_token: SecretStr,
+    github_url: HttpUrl,
+    github_orgs: tuple[str, ...],
+    ignore_repos: list[str],
+    state_file: Optional[Path],
+    out_file_path: Path,
+    output_format: OutputFormat,
+):
+    """Retrieves all repos that have no catalog-info.yaml and writes them to a csv file."""
+    github_rest_manager = __get_github_rest_manager(
+        github_user, github_token, github_url
+    )
+    watermark_store = __get_watermark_store(state_file)
+
+    def get_org_missing_catalog_info(github_org: str) -> list[dict]:
+        repos = get_all_repos(github_rest_manager, ignore_repos, github_org)
+        return get_missing_catalog_info(
+            github_rest_manager, repos, watermark_store=watermark_store
+        )
+
+    write_to_file(
+        out_file_path,
+        __for_each_org(github_orgs, get_org_missing_catalog_info),
+        output_format=output_format,
+        table="backstage_missing",
+        key=("org", "name"),
+        model=Repo,
+    )
+    __save_watermark_store(watermark_store)
+
+
+@click.command()
+@click.option("--github-user", envvar="GITHUB_USER", type=str, required=True)
+@click.option("--github-token", envvar="GITHUB_TOKEN", type=SecretStr, required=True)
+@click.option(
+    "--github-url", envvar="GITHUB_API_URL", type=str, default=DEFAULT_GITHUB_URL
+)
+@click.option("--github-org", "github_orgs", type=str, required=True, multiple=True)
+@click.option("--out-file-path", type=str, required=True)
+@click.option("--output-format", type=click.Choice(OUTPUT_FORMATS), default="csv")
+@click.option("--ignore-repos", "-i", type=str, multiple=True)
+@click.option("--state-file", envvar="GITHUB_STATE_FILE", type=str, required=False)
+@click.option("--add-protection-if-missing", type=bool, required=True, default=False)
+def unprotected_repos(
+    github_user: str,
+    github_token: SecretStr,
+    github_url: HttpUrl,
+    github_orgs: tuple[str, ...],
+    out_file_path: Path,
+    output_format: OutputFormat,
+    ignore_repos: list[str],
+    state_file: Optional[Path],
+    add_protection_if_missing: bool,
+):
+    """Retrieves all unprotected repos in one or more organizations and writes them to a csv file.
+
+    A protected repo is one that satisfy the following rules:
+    * required_pull_request_reviews.dismiss_stale_reviews is True
+    * required_pull_request_reviews.required_approving_review_count > 0
+    * required_linear_history is True
+        * allow_force_pushes is False
+        * required_status_checks.strict is True
+    * enforce_admins is False
+    * restrictions is None
+    """
+    github_rest_manager = __get_github_rest_manager(
+        github_user, github_token, github_url
+    )
+    watermark_store = __get_watermark_store(state_file)
+
+    def get_org_repos_protections(github_org: str) -> list[dict]:
+        repos = get_all_repos(github_rest_manager, ignore_repos, github_org)
+        repos_protections = get_repos_protections(
+            github_rest_manager, repos, github_org, watermark_store=watermark_store
+        )
+        flatten_repos_protections = get_repo_protections_info(repos_protections)
+
+        if add_protection_if_missing:
+            add_protection_to_repo_if_missing(
+                github_rest_manager, flatten_repos_protections, repos, github_org
+            )
+        # ndjson keeps the whole protection objects, the other formats their flattened info
+        if output_format in NDJSON_FORMATS:
+            return repos_protections
+        return flatten_repos_protections
+
+    write_to_file(
+        out_file_path,
+        __for_each_org(github_orgs, get_org_repos_protections),
+        output_format=output_format,
+        table="unprotected_repos",
+        key=("org", "name"),
+        model=RepoProtectionInfo,
+    )
+    __save_watermark_store(watermark_store)
+
+
+@click.command()
+@click.option("--github-user", envvar="GITHUB_USER", type=str, required=True)
+@click.option("--github-token", envvar="GITHUB_TOKEN", type=SecretStr, required=True)
+@click.option(
+    "--github-url", envvar="GITHUB_API_URL", type=str, default=DEFAULT_GITHUB_URL
+)
+@click.option("--github-org", "github_orgs", type=str, required=True, multiple=True)
+@click.option("--out-file-path", type=str, required=True)
+@click.option("--output-format", type=click.Choice(OUTPUT_FORMATS), default="csv")
+@click.option("--ignore-repos", "-i", type=str, multiple=True)
+@click.option("--state-file", envvar="GITHUB_STATE_FILE", type=str, required=False)
+@click.option("--git-mirror-dir", envvar="GIT_MIRROR_DIR", type=str, required=False)
+def repo_last_commit(
+    github_user: str,
+    github_token: SecretStr,
+    github_url: HttpUrl,
+    github_orgs: tuple[str, ...],
+    out_file_path: Path,
+    output_format: OutputFormat,
+    ignore_repos: list[str],
+    state_file: Optional[Path],
+    git_mirror_dir: Optional[Path],
+):
+    github_rest_manager = __get_github_rest_manager(
+        github_user, github_token, github_url
+    )
+    watermark_store = __get_watermark_store(state_file)
+    git_mirror = (
+        GitMirror(git_mirror_dir, github_user, github_token) if git_mirror_dir else None
+    )
+
+    def get_org_last_commits(github_org: str) -> list[dict]:
+        repos = get_all_repos(github_rest_manager, ignore_repos, github_org)
+        if git_mirror:
+            sync_repo_mirrors(git_mirror, repos)
+            return get_last_commit_from_mirror(git_mirror, repos)
+        return get_last_commit(
+            github_rest_manager, repos, watermark_store=watermark_store
+        )
+
+    write_to_file(
+        out_file_path,
+        __for_each_org(github_orgs, get_org_last_commits),
+        output_format=output_format,
+        table="repo_last_commit",
+        key=("org", "repo"),
+        model=FlattenCommit,
+    )
+    __save_watermark_store(watermark_store)
+
+
+@click.command()
+@click.option("--github-user", envvar="GITHUB_USER", type=str, required=True)
+@click.option("--github-token", envvar="GITHUB_TOKEN", type=SecretStr, required=True)
+@click.option(
+    "--github-url", envvar="GITHUB_API_URL", type=str, default=DEFAULT_GITHUB_URL
+)
+@click.option("--github-org", "github_orgs", type=str, required=True, multiple=True)
+@click.option("--out-file-path", type=str, required=True)
+@click.option("--output-format", type=click.Choice(OUTPUT_FORMATS), default="csv")
+@click.option("--ignore-repos", "-i", type=str, multiple=True)
+@click.option("--state-file", envvar="GITHUB_STATE_FILE", type=str, required=False)
+@click.option("--max-workers", type=int, default=DEFAULT_MAX_WORKERS)
+def repos_info(
+    github_user: str,
+    github_token: SecretStr,
+    github_url: HttpUrl,
+    github_orgs: tuple[str, ...],
+    out_file_path: Path,
+    output_format: OutputFormat,
+    ignore_repos: list[str],
+    state_file: Optional[Path],
+    max_workers: int,
+):
+    """For each repo retrieves whether it is empty, on main, missing backstage, its protections and its last commit.
+
+    All the probes of all the repos of all the orgs run concurrently in a pool of max-workers threads and each repo
+    row is written to the output as soon as its probes complete.
+    """
+    github_rest_manager = __get_github_rest_manager(
+        github_user, github_token, github_url
+    )
+    watermark_store = __get_watermark_store(state_file)
+    repos = [
+        repo
+        for _, org_repos in map_concurrently(
+            lambda github_org: get_all_repos(
+                github_rest_manager, ignore_repos, github_org
+            ),
+            github_orgs,
+            max_workers=len(github_orgs),
+            show_progress=False,
+        )
+        for repo in org_repos
+    ]
+    repos_info = get_repos_info(
+        github_rest_manager, repos, max_workers, watermark_store=watermark_store
+    )
+    write_to_file(
+        out_file_path,
+        repos_info,
+        output_format=output_format,
+        table="repos_info",
+        key=("org", "name"),
+    )
+    __save_watermark_store(watermark_store)
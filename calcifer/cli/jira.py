@@ -0,0 +1,118 @@
+import click
+from typing import Optional
+from calcifer.services.jira_pager import JiraPager
+from calcifer.commands.jira import (
+    CHANGE_LOG_ISSUE_FIELDS,
+    COMMENTS_ISSUE_FIELDS,
+    get_issues_for_project,
+    get_issues_change_logs,
+    get_comments_by_issue,
+    sync_issues_change_logs,
+)
+from pydantic import SecretStr, HttpUrl
+from pathlib import Path
+from calcifer.utils.cache import disable_file_cache
+from calcifer.utils.file_writer import OUTPUT_FORMATS, OutputFormat, write_to_file
+from calcifer.utils.jira_issue_store import JiraIssueStore
+
+
+@click.command()
+@click.option("--jira-user", envvar="JIRA_USER", type=str, required=True)
+@click.option(
+    "--jira-api-token", envvar="JIRA_API_TOKEN", type=SecretStr, required=True
+)
+@click.option(
+    "--jira-url",
+    envvar="JIRA_URL",
+    type=str,
+    required=True,
+    default="https://instapartners.atlassian.net",
+)
+@click.option("--search-for-user", type=str, required=True)
+@click.option("--jira-project", type=str, required=True)
+@click.option(
+    "--since", envvar="SINCE", type=str, required=True, default="startOfYear()"
+)
+@click.option("--out-file-path", type=str, required=True)
+@click.option("--output-format", type=click.Choice(OUTPUT_FORMATS), default="csv")
+def issues_with_comments_by(
+    jira_user: str,
+    jira_api_token: SecretStr,
+    jira_url: HttpUrl,
+    search_for_user: str,
+    jira_project: str,
+    since: str,
+    out_file_path: Path,
+    output_format: OutputFormat,
+):
+    jira_pager = JiraPager(
+        jira_url, jira_user, jira_api_token, fields=COMMENTS_ISSUE_FIELDS
+    )
+    issues = get_issues_for_project(jira_pager, jira_project, since)
+    issues_comments = get_comments_by_issue(jira_pager, issues, search_for_user)
+    write_to_file(
+        out_file_path,
+        issues_comments,
+        output_format=output_format,
+        table="issues_with_comments_by",
+        key=("key",),
+    )
+    jira_pager.log_projection_summary()
+
+
+@click.command()
+@click.option("--jira-user", envvar="JIRA_USER", type=str, required=True)
+@click.option(
+    "--jira-api-token", envvar="JIRA_API_TOKEN", type=SecretStr, required=True
+)
+@click.option(
+    "--jira-url",
+    envvar="JIRA_URL",
+    type=str,
+    required=True,
+    default="https://instapartners.atlassian.net",
+)
+@click.option("--jira-project", envvar="JIRA_PROJECT", type=str, required=True)
+@click.option(
+    "--since", envvar="SINCE", type=str, required=True, default="startOfYear()"
+)
+@click.option("--out-file-path", type=str, required=True)
+@click.option("--output-format", type=click.Choice(OUTPUT_FORMATS), default="csv")
+@click.option("--state-file", envvar="JIRA_STATE_FILE", type=str, required=False)
+def issues_change_status_log(
+    jira_user: str,
+    jira_api_token: SecretStr,
+    jira_url: HttpUrl,
+    jira_project: str,
+    since: str,
+    out_file_path: Path,
+    output_format: OutputFormat,
+    state_file: Optional[Path],
+):
+    """This command retrieves the list of all status changes for all issues created from `since` of project `jira_project`.
+
+    If state-file is given, issues and their status changes are kept there and each run only fetches issues updated
+    since the previous one, and only their new changelog entries.
+    """
+    jira_pager = JiraPager(
+        jira_url, jira_user, jira_api_token, fields=CHANGE_LOG_ISSUE_FIELDS
+    )
+    if state_file:
+        disable_file_cache()
+        jira_issue_store = JiraIssueStore(state_file, f"{jira_project}:{since}")
+        change_log = sync_issues_change_logs(
+            jira_pager, jira_issue_store, jira_project, since
+        )
+    else:
+        issues = get_issues_for_project(jira_pager, jira_project, since, "changelog")
+        change_log = get_issues_change_logs(jira_pager, issues)
+    write_to_file(
+        out_file_path,
+        change_log,
+        output_format=output_format,
+        table="issues_change_status_log",
+        key=("key", "created"),
+    )
+    if state_file:
+        jira_issue_store.save()
+    jira_pager.log_projection_summary()
@@ -5,12 +5,73 @@ from calcifer.services.auth0_pager import (
     get_default_auth0_latest_logs_query_param,
 )
 from calcifer.utils.cache import cache_to_file
-from typing import Optional
+from calcifer.utils.worker_pool import DEFAULT_MAX_WORKERS, map_concurrently
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, Optional
+import time
 
-from calcifer.utils.json_logger import logger
+from calcifer.utils.json_logger import get_logger
+from calcifer.utils.tracing import traced
 
+logger = get_logger(__name__)
 
-@cache_to_file(file_prefix="auth0_latest_events")
+DEFAULT_POLL_INTERVAL = 60
+
+# Auth0 log search can't page past the first 1000 results of a query
+MAX_LOGS_PER_SEARCH = 1000
+MIN_WINDOW = timedelta(minutes=1)
+DEFAULT_WINDOW_HOURS = 24
+LUCENE_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.000Z"
+
+DateWindow = tuple[datetime, datetime]
+
+AUTH0_DEFAULT_FIELDS = (
+    "client_name",
+    "user_name",
+    "client_id",
+    "user_id",
+    "strategy",
+    "connection",
+    "strategy_type",
+    "session_connection",
+    "audience",
+    "scope",
+    "description",
+    "auth0_client",
+    "tracking_id",
+)
+
+# Log fields written by auth0_logs, used to narrow down the api results
+AUTH0_LOG_FIELDS = [
+    "log_id",
+    "date",
+    "type",
+    "ip",
+    "user_agent",
+    "hostname",
+    "details",
+    *AUTH0_DEFAULT_FIELDS,
+]
+
+# Fields taken from details.error, which is either a message or an object
+AUTH0_ERROR_SCHEMA = {
+    "error_message": ("message", str),
+    "error_oauth_error": ("oauthError", str),
+    "error_type": ("type", str),
+}
+
+# Columns written by auth0_logs and their type
+AUTH0_LOG_SCHEMA = {
+    **{field: str for field in AUTH0_LOG_FIELDS if field != "details"},
+    "auth0_client": dict,
+    **{column: column_type for column, (_, column_type) in AUTH0_ERROR_SCHEMA.items()},
+}
+
+
+@cache_to_file(
+    file_prefix="auth0_latest_events",
+    key=lambda auth0_pager, auth0_search_str: f"{auth0_search_str}:{auth0_pager.fields}",
+)
 def get_auth0_latest_events(
     auth0_pager: Auth0LatestLogsPager, auth0_search_str: Optional[str]
 ):
@@ -24,7 +85,12 @@ def get_auth0_latest_events(
     )
 
 
-@cache_to_file(file_prefix="auth0_after_log_id")
+@cache_to_file(
+    file_prefix="auth0_after_log_id",
+    key=lambda auth0_pager, from_log_id, auth0_search_str: (
+        f"{from_log_id}:{auth0_search_str}:{auth0_pager.fields}"
+    ),
+)
 def get_auth0_events_after_log_id(
     auth0_pager: Auth0FromLogIdPager, from_log_id: str, auth0_search_str: Optional[str]
 ):
@@ -38,43 +104,135 @@ def get_auth0_events_after_log_id(
     )
 
 
-def flatten_logs(logs: list[dict]) -> list[dict]:
+def tail_auth0_events(
+    auth0_pager: Auth0FromLogIdPager,
+    from_log_id: str,
+    auth0_search_str: Optional[str],
+    follow: bool = False,
+    poll_interval: int = DEFAULT_POLL_INTERVAL,
+) -> Iterator[list[dict]]:
+    """Yields the events after from_log_id one page at a time, as soon as each page is fetched.
+
+    In follow mode, once caught up it polls for new events every poll_interval seconds and never returns.
+    """
+    while True:
+        logger.info(f"Getting events after {from_log_id}")
+        params = Auth0FromLogIdLogsParam(take=100, q=auth0_search_str)
+        params["from"] = from_log_id
+        for logs in auth0_pager.iter_pages(
+            path="/logs", query_params=params, collection_name=None
+        ):
+            from_log_id = logs[-1]["log_id"]
+            yield logs
+        if not follow:
+            return
+        time.sleep(poll_interval)
+
+
+def _get_window_query(auth0_search_str: Optional[str], window: DateWindow) -> str:
+    start, end = window
+    date_query = f"date:[{start.strftime(LUCENE_DATE_FORMAT)} TO {end.strftime(LUCENE_DATE_FORMAT)}]"
+    if auth0_search_str:
+        return f"({auth0_search_str}) AND {date_query}"
+    return date_query
+
+
+def _split_window(window: DateWindow, size: timedelta) -> list[DateWindow]:
+    start, end = window
+    boundaries = [start]
+    while boundaries[-1] + size < end:
+        boundaries.append(boundaries[-1] + size)
+    boundaries.append(end)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+@traced(
+    "get_auth0_window_events",
+    attributes=lambda _, auth0_search_str, window: {
+        "window.start": window[0],
+        "window.end": window[1],
+    },
+)
+def get_auth0_window_events(
+    auth0_pager: Auth0LatestLogsPager,
+    auth0_search_str: Optional[str],
+    window: DateWindow,
+) -> list[dict]:
+    """Returns the events of window, oldest first, stopping at the MAX_LOGS_PER_SEARCH Auth0 lets a search page through."""
+    params = get_default_auth0_latest_logs_query_param().copy()
+    params["q"] = _get_window_query(auth0_search_str, window)
+    params["sort"] = "date:1"
+    logs = []
+    for page in auth0_pager.iter_pages(
+        path="/logs", query_params=params, collection_name=None
+    ):
+        logs += page
+        if len(logs) >= MAX_LOGS_PER_SEARCH:
+            break
+    return logs
+
+
+@cache_to_file(
+    file_prefix="auth0_events_by_window",
+    key=lambda auth0_pager, auth0_search_str, window, window_size, *_, **__: (
+        f"{auth0_search_str}:{window[0]}:{window[1]}:{window_size}:{auth0_pager.fields}"
+    ),
+)
+def get_auth0_events_by_window(
+    auth0_pager: Auth0LatestLogsPager,
+    auth0_search_str: Optional[str],
+    window: DateWindow,
+    window_size: timedelta,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> list[dict]:
+    """Retrieves all events in window by splitting it in date windows of window_size searched concurrently.
+
+    Windows that hit the MAX_LOGS_PER_SEARCH limit are halved and searched again until they fit or are a minute
+    long. Windows bounds are inclusive, so events are merged by log_id, which also sorts them chronologically.
+    """
+    windows_to_fetch = _split_window(window, window_size)
+    logger.info(f"Getting events between {window[0]} and {window[1]}")
+    logs_by_id = {}
+    while windows_to_fetch:
+        fetched_windows = map_concurrently(
+            lambda w: get_auth0_window_events(auth0_pager, auth0_search_str, w),
+            windows_to_fetch,
+            max_workers=max_workers,
+        )
+        windows_to_fetch = []
+        for (start, end), logs in fetched_windows:
+            if len(logs) >= MAX_LOGS_PER_SEARCH:
+                if end - start > MIN_WINDOW:
+                    windows_to_fetch += _split_window((start, end), (end - start) / 2)
+                    continue
+                logger.warning(
+                    f"More than {MAX_LOGS_PER_SEARCH} events between {start} and {end}, some are missing"
+                )
+            for log in logs:
+                logs_by_id.setdefault(log["log_id"], log)
+    return [logs_by_id[log_id] for log_id in sorted(logs_by_id)]
+
+
+def flatten_logs_to_columns(logs: Iterable[dict]) -> dict[str, list]:
+    """Flattens logs, in a single pass and without changing them, into one list per AUTH0_LOG_SCHEMA column."""
+    columns = {column: [] for column in AUTH0_LOG_SCHEMA}
+    field_appenders = [
+        (field, columns[field].append)
+        for field in AUTH0_LOG_SCHEMA
+        if field not in AUTH0_ERROR_SCHEMA
+    ]
+    error_appenders = [
+        (error_field, columns[column].append)
+        for column, (error_field, _) in AUTH0_ERROR_SCHEMA.items()
+    ]
     for log in logs:
-        error = log.get("details", {}).get("error", {})
-        if type(error) == str:
-            log.update(
-                {"error_message": error, "error_oauth_error": "", "error_type": ""}
-            )
+        for field, append in field_appenders:
+            append(log.get(field, ""))
+        error = (log.get("details") or {}).get("error") or {}
+        if type(error) is str:
+            for error_field, append in error_appenders:
+                append(error if error_field == "message" else "")
         else:
-            log.update(
-                {
-                    "error_message": log.get("details", {})
-                    .get("error", {})
-                    .get("message", ""),
-                    "error_oauth_error": log.get("details", {})
-                    .get("error", {})
-                    .get("oauthError", ""),
-                    "error_type": log.get("details", {})
-                    .get("error", {})
-                    .get("type", ""),
-                }
-            )
-        for field in (
-            "client_name",
-            "user_name",
-            "client_id",
-            "user_id",
-            "strategy",
-            "connection",
-            "strategy_type",
-            "session_connection",
-            "audience",
-            "scope",
-            "description",
-            "auth0_client",
-            "tracking_id",
-        ):
-            if field not in log:
-                log[field] = ""
-        if "details" in log:
-            log.pop("details")
+            for error_field, append in error_appenders:
+                append(error.get(error_field, ""))
+    return columns
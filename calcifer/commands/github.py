@@ -1,4 +1,4 @@
-from typing import Callable
+from typing import Any, Callable, Iterable, Iterator, Optional
 from calcifer.models.github import (
     Repo,
     FlattenCommit,
@@ -10,19 +10,64 @@ from calcifer.models.github import (
     RepoProtection,
     RepoProtectionInfo,
     RepoCommits,
+    RepoRecord,
+    FlattenCommitRecord,
+    ContributorWithRepoRecord,
 )
 from calcifer.services.github_rest_manager import (
     GithubRestManager,
     get_default_github_query_param,
 )
+from calcifer.services.git_mirror import GitMirror
 from calcifer.utils.cache import cache_to_file
-from calcifer.utils.json_logger import logger
+from calcifer.utils.json_logger import get_logger
+from calcifer.utils.spill_table import SpillTable
+from calcifer.utils.tracing import traced
+from calcifer.utils.watermark_store import RepoWatermarkStore
+from calcifer.utils.worker_pool import DEFAULT_MAX_WORKERS, map_concurrently
 from tqdm import tqdm
 from datetime import datetime
 import itertools
 
+logger = get_logger(__name__)
 
-@cache_to_file(file_prefix="github_repos")
+
+def _repos_cache_key(
+    github_rest_manager: GithubRestManager, repos: list[Repo], *args, **kwargs
+):
+    return ",".join([repo["full_name"] for repo in repos] + [str(arg) for arg in args])
+
+
+# Changing branch protection moves neither pushed_at nor updated_at, so it is fetched again on every run
+UNWATERMARKED_SECTIONS = ("protections",)
+
+
+@traced(
+    "fetch_for_repo",
+    attributes=lambda _, section, repo, *args: {
+        "section": section,
+        "repo": repo["full_name"],
+    },
+)
+def _fetch_for_repo(
+    watermark_store: Optional[RepoWatermarkStore],
+    section: str,
+    repo: Repo,
+    fetch: Callable[[], Any],
+) -> Any:
+    if watermark_store is None or section in UNWATERMARKED_SECTIONS:
+        return fetch()
+    return watermark_store.get_or_fetch(section, repo, fetch)
+
+
+@traced(
+    "list_repos", attributes=lambda _, ignore_repos, github_org: {"org": github_org}
+)
+@cache_to_file(
+    file_prefix="github_repos",
+    key=lambda _, ignore_repos, github_org: f"{github_org}:{sorted(ignore_repos)}",
+    record_type=RepoRecord,
+)
 def get_all_repos(
     github_rest_manager: GithubRestManager, ignore_repos: list[str], github_org: str
 ) -> list[Repo]:
@@ -30,19 +75,34 @@ def get_all_repos(
         f"Retrieving all not archived repos for org {github_org}, ignoring {ignore_repos}"
     )
     repos = github_rest_manager.get_all_pages(
-        f"orgs/{github_org}/repos", get_default_github_query_param(), None
+        f"orgs/{github_org}/repos",
+        get_default_github_query_param(),
+        None,
+        map_item=RepoRecord.from_dict,
     )
     return [r for r in repos if r["name"] not in ignore_repos and not r["archived"]]
 
 
-@cache_to_file(file_prefix="github_release_commits")
+@cache_to_file(
+    file_prefix="github_release_commits",
+    key=_repos_cache_key,
+    record_type=FlattenCommitRecord,
+)
 def get_commits_with_tag(
-    github_rest_manager: GithubRestManager, repos: list[Repo], tag: str
+    github_rest_manager: GithubRestManager,
+    repos: list[Repo],
+    tag: str,
+    watermark_store: Optional[RepoWatermarkStore] = None,
 ) -> list[FlattenCommit]:
     print(f"Retrieving all commits with tag {tag}")
     commits = []
     for repo in tqdm(repos):
-        commits += get_repo_commits_with_tag(github_rest_manager, repo, tag)
+        commits += _fetch_for_repo(
+            watermark_store,
+            f"commits_with_tag:{tag}",
+            repo,
+            lambda: get_repo_commits_with_tag(github_rest_manager, repo, tag),
+        )
     return commits
 
 
@@ -56,7 +116,7 @@ def get_repo_commits_with_tag(
             github_rest_manager, repo, commit["commit"]["sha"]
         )
         commits_with_tag_details.append(
-            FlattenCommit(
+            FlattenCommitRecord(
                 repo=repo["name"],
                 tag=commit["name"],
                 author=commit_details["commit"]["author"]["name"],
@@ -88,41 +148,38 @@ def get_commit_with_sha(
     )[0]
 
 
-@cache_to_file(file_prefix="github_first_contribution")
+@cache_to_file(
+    file_prefix="github_first_contribution", key=_repos_cache_key, stream=True
+)
 def get_first_contributions(
-    github_rest_manager: GithubRestManager, repos: list
-) -> list[dict[str, AuthorContribution]]:
+    github_rest_manager: GithubRestManager,
+    repos: list,
+    watermark_store: Optional[RepoWatermarkStore] = None,
+) -> Iterator[AuthorContribution]:
+    """Yields the first contribution of each author to each repo, one repo at a time."""
     print("Retrieving first contributions")
-    contributions = []
     for repo in tqdm(repos):
-        contributions_by_repo = get_first_contributions_by_repo(
-            github_rest_manager, repo
+        contributions_by_repo = _fetch_for_repo(
+            watermark_store,
+            "first_contributions",
+            repo,
+            lambda: get_first_contributions_by_repo(github_rest_manager, repo),
         )
-        if len(contributions_by_repo):
-            contributions.append(contributions_by_repo)
-    return contributions
+        yield from contributions_by_repo.values()
 
 
 def get_first_contributions_by_author(
-    contributions: list[dict[str, AuthorContribution]]
+    contributions: Iterable[AuthorContribution],
 ) -> list[AuthorContribution]:
-    first_contributions = {}
-    now = datetime.now().isoformat()
-    for contribution in contributions:
-        for author in contribution:
-            curr_author_contribution = {
-                "date": now,
-                "repo": contribution[author]["repo"],
-            }
-            if (
-                first_contributions.setdefault(author, curr_author_contribution)["date"]
-                > contribution[author]["date"]
-            ):
-                first_contributions[author] = {
-                    "date": contribution[author]["date"],
-                    "repo": contribution[author]["repo"],
-                }
-    return [contrib for contrib in first_contributions.values()]
+    """Groups contributions by author in a SpillTable, so that memory doesn't grow with the history of the org."""
+    with SpillTable(AuthorContribution.__annotations__) as table:
+        table.extend(contributions)
+        # sqlite takes the repo of a MIN aggregate from the row with the minimum date
+        return list(
+            table.query(
+                "SELECT author, MIN(date) AS date, repo FROM spill GROUP BY author ORDER BY author"
+            )
+        )
 
 
 def get_first_contributions_by_repo(
@@ -131,10 +188,10 @@ def get_first_contributions_by_repo(
     commits = get_all_commits_for_repo(
         github_rest_manager, repo, stop_if=_stop_if_after_2021
     )
-    date_commits = [
-        {"author": c["commit"]["author"]["name"], "date": c["commit"]["author"]["date"]}
-        for c in commits
-    ]
+    date_commits = sorted(
+        ({"author": c["author"], "date": c["date"]} for c in commits),
+        key=lambda x: x["author"],
+    )
     return {
         author: {
             "author": author,
@@ -164,40 +221,66 @@ def get_first_page() -> Callable[dict, bool]:
     return stop_if_after_first_page
 
 
-@cache_to_file(file_prefix="github_first_page_of_commits")
+@cache_to_file(
+    file_prefix="github_first_page_of_commits",
+    key=_repos_cache_key,
+    record_type=FlattenCommitRecord,
+    stream=True,
+)
 def get_repos_first_page_commits(
-    github_rest_manager: GithubRestManager, repos: list[Repo]
-) -> list[RepoCommits]:
-    commits = []
+    github_rest_manager: GithubRestManager,
+    repos: list[Repo],
+    watermark_store: Optional[RepoWatermarkStore] = None,
+) -> Iterator[FlattenCommit]:
     for repo in tqdm(repos):
-        repo_commits = get_all_commits_for_repo(
-            github_rest_manager, repo, stop_if=get_first_page()
+        yield from _fetch_for_repo(
+            watermark_store,
+            "first_page_commits",
+            repo,
+            lambda: _probe_first_page_commits(github_rest_manager, repo),
         )
-        commits += repo_commits
-    return commits
 
 
 def get_last_commit(
-    github_rest_manager: GithubRestManager, repos: list[Repo]
+    github_rest_manager: GithubRestManager,
+    repos: list[Repo],
+    watermark_store: Optional[RepoWatermarkStore] = None,
 ) -> list[FlattenCommit]:
     logger.info("Retrieving last commit")
-    repo_commits = get_repos_first_page_commits(github_rest_manager, repos)
-    last_commits = []
-    for _, commits in itertools.groupby(repo_commits, lambda x: x["repo"]):
-        last_commits.append(sorted(commits, key=lambda x: x["date"])[-1])
-    return last_commits
+    repo_commits = get_repos_first_page_commits(
+        github_rest_manager, repos, watermark_store=watermark_store
+    )
+    with SpillTable(FlattenCommit.__annotations__) as table:
+        table.extend(repo_commits)
+        # sqlite takes the other columns of a MAX aggregate from the row with the maximum date
+        return list(
+            table.query(
+                "SELECT repo, tag, author, message, MAX(date) AS date FROM spill GROUP BY repo ORDER BY repo"
+            )
+        )
 
 
 def get_repo_commit_number(
-    github_rest_manager: GithubRestManager, repos: list[Repo]
+    github_rest_manager: GithubRestManager,
+    repos: list[Repo],
+    watermark_store: Optional[RepoWatermarkStore] = None,
 ) -> list[RepoCommits]:
     logger.info("Retrieving number of commits")
-    repos_commits = get_repos_first_page_commits(github_rest_manager, repos)
-    commits_num = []
-    for repo in repos:
-        repo_commits = [commit for commit in repos_commits if commit["repo"] == repo["name"]]
-        commits_num.append({"name": repo["name"], "commits": len(repo_commits)})
-    return commits_num
+    repos_commits = get_repos_first_page_commits(
+        github_rest_manager, repos, watermark_store=watermark_store
+    )
+    with SpillTable(("repo",)) as table:
+        table.extend(repos_commits)
+        commits_by_repo = {
+            row["repo"]: row["commits"]
+            for row in table.query(
+                "SELECT repo, COUNT(*) AS commits FROM spill GROUP BY repo"
+            )
+        }
+    return [
+        {"name": repo["name"], "commits": commits_by_repo.get(repo["name"], 0)}
+        for repo in repos
+    ]
 
 
 def get_all_commits_for_repo(
@@ -205,58 +288,94 @@ def get_all_commits_for_repo(
 ) -> list[FlattenCommit]:
     query_params_with_sha = get_default_github_query_param()
     query_params_with_sha.update({"sha": repo["default_branch"]})
-    commits = github_rest_manager.get_all_pages(
+    return github_rest_manager.get_all_pages(
         repo["commits_url"].replace("{/sha}", ""),
         query_params_with_sha,
         None,
-        stop_if=stop_if,
-        show_progress=False,
-    )
-    return [
-        FlattenCommit(
+        map_item=lambda commit: FlattenCommitRecord(
             repo=repo["name"],
             tag=commit["sha"],
             author=commit["commit"]["author"]["name"],
             message=commit["commit"]["message"].replace("\n", "; "),
             date=commit["commit"]["author"]["date"],
-        )
-        for commit in commits
-    ]
+        ),
+        stop_if=stop_if,
+        show_progress=False,
+    )
 
 
-@cache_to_file(file_prefix="github_top_contributions")
+@cache_to_file(
+    file_prefix="github_top_contributions",
+    key=_repos_cache_key,
+    record_type=ContributorWithRepoRecord,
+    stream=True,
+)
 def get_contributors(
-    github_rest_manager: GithubRestManager, repos: list[Repo]
-) -> list[ContributorWithRepo]:
-    all_contributors = []
+    github_rest_manager: GithubRestManager,
+    repos: list[Repo],
+    watermark_store: Optional[RepoWatermarkStore] = None,
+) -> Iterator[ContributorWithRepo]:
     for repo in tqdm(repos):
-        repo_contributors = get_contributors_for_repo(github_rest_manager, repo)
-        for contributor in repo_contributors:
-            contributor.update({"repo": repo["name"]})
-        all_contributors += repo_contributors
-    return all_contributors
+        yield from _fetch_for_repo(
+            watermark_store,
+            "contributors",
+            repo,
+            lambda: get_contributors_with_repo(github_rest_manager, repo),
+        )
+
+
+def get_contributors_with_repo(
+    github_rest_manager: GithubRestManager, repo: Repo
+) -> list[ContributorWithRepo]:
+    return get_contributors_for_repo(
+        github_rest_manager,
+        repo,
+        map_item=lambda contributor: ContributorWithRepoRecord(
+            login=contributor["login"],
+            contributions=contributor["contributions"],
+            repo=repo["name"],
+        ),
+    )
 
 
 def get_contributors_for_repo(
-    github_rest_manager: GithubRestManager, repo: list[Repo]
+    github_rest_manager: GithubRestManager,
+    repo: list[Repo],
+    map_item: Callable[[dict], dict] = lambda item: item,
 ) -> list[Contributor]:
     return github_rest_manager.get_all_pages(
         repo["contributors_url"].replace("{/collaborator}", ""),
         get_default_github_query_param(),
         None,
+        map_item=map_item,
         show_progress=False,
     )
 
 
 def get_top_contributors(
-    contributors: list[ContributorWithRepo], n_contributors: int
+    contributors: Iterable[ContributorWithRepo], n_contributors: int
 ) -> dict:
+    """Ranks the contributors of each repo in a SpillTable, so that only the top n of a repo are held in memory."""
+    with SpillTable(ContributorWithRepo.__annotations__) as table:
+        table.extend(contributors)
+        ranked_contributors = table.query(
+            "SELECT repo, login, contributions FROM ("
+            "SELECT *, ROW_NUMBER() OVER (PARTITION BY repo ORDER BY contributions DESC, rowid) AS rank FROM spill"
+            ") WHERE rank <= ? ORDER BY repo, rank",
+            (n_contributors,),
+        )
+        return _get_top_contributor_rows(ranked_contributors, n_contributors)
+
+
+def _get_top_contributor_rows(
+    ranked_contributors: Iterator[dict], n_contributors: int
+) -> list[dict]:
     top_contributors = []
-    for repo, contributions in itertools.groupby(contributors, lambda x: x["repo"]):
+    for repo, contributions in itertools.groupby(
+        ranked_contributors, lambda x: x["repo"]
+    ):
         contributors = {}
-        sorted_contributors = sorted(
-            contributions, key=lambda x: x["contributions"], reverse=True
-        )[:n_contributors]
+        sorted_contributors = list(contributions)
         for i in range(0, n_contributors):
             if i < len(sorted_contributors):
                 contributors.update(
@@ -285,29 +404,38 @@ def get_top_contributors(
 
 
 def get_missing_catalog_info(
-    github_rest_manager: GithubRestManager, repos: list[Repo]
+    github_rest_manager: GithubRestManager,
+    repos: list[Repo],
+    watermark_store: Optional[RepoWatermarkStore] = None,
 ) -> list[Repo]:
     missing_catalog_info = []
     for repo in tqdm(repos):
-        if github_rest_manager.get_file(
-            repo["owner"]["login"],
-            repo["name"],
-            "catalog-info.yaml",
+        if _fetch_for_repo(
+            watermark_store,
+            "has_catalog_info",
+            repo,
+            lambda: _probe_catalog_info(github_rest_manager, repo),
         ):
             continue
         missing_catalog_info.append(repo)
     return missing_catalog_info
 
 
-@cache_to_file(file_prefix="github_repo_protections")
+@cache_to_file(file_prefix="github_repo_protections", key=_repos_cache_key)
 def get_repos_protections(
-    github_rest_manager: GithubRestManager, repos: list[Repo], github_org: str
+    github_rest_manager: GithubRestManager,
+    repos: list[Repo],
+    github_org: str,
+    watermark_store: Optional[RepoWatermarkStore] = None,
 ) -> list[RepoProtectionInfo]:
     print("Retrieving repo protections")
     protections = []
     for repo in tqdm(repos):
-        protections_by_repo = get_protections_by_repo(
-            github_rest_manager, repo, github_org
+        protections_by_repo = _fetch_for_repo(
+            watermark_store,
+            "protections",
+            repo,
+            lambda: get_protections_by_repo(github_rest_manager, repo, github_org),
         )
         protections.append(protections_by_repo)
     return protections
@@ -368,8 +496,10 @@ def get_repo_protections_info(repos: list[RepoProtection]) -> list[RepoProtectio
 def add_protection_to_repo_if_missing(
     github_rest_manager: GithubRestManager,
     repo_protections: list[RepoProtectionInfo],
+    repos: list[Repo],
     github_org: str,
 ) -> None:
+    default_branches = {repo["name"]: repo["default_branch"] for repo in repos}
     unprotected_repos = [
         repo for repo in repo_protections if repo["is_protection_missing"]
     ]
@@ -380,13 +510,208 @@ def add_protection_to_repo_if_missing(
         )
         try:
             github_rest_manager.add_protections(
-                github_org, repo["name"], repo["default_branch"], DEFAULT_PROTECTION
+                github_org,
+                repo["name"],
+                default_branches[repo["name"]],
+                DEFAULT_PROTECTION,
             )
         except Exception as e:
             logger.error(f'Error adding protection to {repo["name"]}: {e}')
             continue
 
 
+def sync_repo_mirrors(
+    git_mirror: GitMirror,
+    repos: list[Repo],
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> None:
+    print(f"Syncing local mirrors of {len(repos)} repos in {git_mirror.mirror_dir}")
+    for _ in map_concurrently(
+        lambda repo: git_mirror.sync(repo["full_name"], repo["clone_url"]),
+        repos,
+        max_workers=max_workers,
+    ):
+        pass
+
+
+def get_mirror_commits_for_repo(
+    git_mirror: GitMirror, repo: Repo, *log_args: str
+) -> list[FlattenCommit]:
+    default_branch = f'refs/heads/{repo["default_branch"]}'
+    if not git_mirror.has_ref(repo["full_name"], default_branch):
+        return []
+    return [
+        FlattenCommitRecord(
+            repo=repo["name"],
+            tag=commit["sha"],
+            author=commit["author"],
+            message=commit["message"].replace("\n", "; "),
+            date=commit["date"],
+        )
+        for commit in git_mirror.get_commits(
+            repo["full_name"], [default_branch], *log_args
+        )
+    ]
+
+
+def get_first_contributions_from_mirror(
+    git_mirror: GitMirror, repos: list[Repo]
+) -> Iterator[AuthorContribution]:
+    print("Retrieving first contributions from local mirrors")
+    for repo in tqdm(repos):
+        contributions_by_repo = {}
+        for commit in get_mirror_commits_for_repo(git_mirror, repo):
+            author = commit["author"]
+            if (
+                author not in contributions_by_repo
+                or contributions_by_repo[author]["date"] > commit["date"]
+            ):
+                contributions_by_repo[author] = {
+                    "author": author,
+                    "date": commit["date"],
+                    "repo": repo["name"],
+                }
+        yield from contributions_by_repo.values()
+
+
+def get_last_commit_from_mirror(
+    git_mirror: GitMirror, repos: list[Repo]
+) -> list[FlattenCommit]:
+    logger.info("Retrieving last commit from local mirrors")
+    last_commits = []
+    for repo in tqdm(repos):
+        last_commits += get_mirror_commits_for_repo(git_mirror, repo, "--max-count=1")
+    return last_commits
+
+
+def get_repo_commit_number_from_mirror(
+    git_mirror: GitMirror, repos: list[Repo]
+) -> list[RepoCommits]:
+    logger.info("Retrieving number of commits from local mirrors")
+    return [
+        {
+            "name": repo["name"],
+            "commits": git_mirror.count_commits(
+                repo["full_name"], f'refs/heads/{repo["default_branch"]}'
+            ),
+        }
+        for repo in tqdm(repos)
+    ]
+
+
+def get_commits_with_tag_from_mirror(
+    git_mirror: GitMirror, repos: list[Repo], tag: str
+) -> list[FlattenCommit]:
+    print(f"Retrieving all commits with tag {tag} from local mirrors")
+    commits = []
+    for repo in tqdm(repos):
+        tags = {
+            name: sha
+            for name, sha in git_mirror.get_tags(repo["full_name"]).items()
+            if tag in name
+        }
+        commits_by_sha = {
+            commit["sha"]: commit
+            for commit in git_mirror.get_commits(
+                repo["full_name"], sorted(set(tags.values())), "--no-walk=unsorted"
+            )
+        }
+        for name, sha in tags.items():
+            commits.append(
+                FlattenCommitRecord(
+                    repo=repo["name"],
+                    tag=name,
+                    author=commits_by_sha[sha]["author"],
+                    message=commits_by_sha[sha]["message"].replace("\n", "; "),
+                    date=commits_by_sha[sha]["date"],
+                )
+            )
+    return commits
+
+
+def _probe_first_page_commits(
+    github_rest_manager: GithubRestManager, repo: Repo
+) -> list[FlattenCommit]:
+    return get_all_commits_for_repo(github_rest_manager, repo, stop_if=get_first_page())
+
+
+def _probe_catalog_info(github_rest_manager: GithubRestManager, repo: Repo) -> bool:
+    return bool(
+        github_rest_manager.get_file(
+            repo["owner"]["login"], repo["name"], "catalog-info.yaml"
+        )
+    )
+
+
+def _probe_protection(
+    github_rest_manager: GithubRestManager, repo: Repo
+) -> RepoProtection:
+    return get_protections_by_repo(github_rest_manager, repo, repo["owner"]["login"])
+
+
+# Probes are keyed by the watermark store section they share with the other commands
+REPO_INFO_PROBES = {
+    "first_page_commits": _probe_first_page_commits,
+    "has_catalog_info": _probe_catalog_info,
+    "protections": _probe_protection,
+}
+
+
+def _build_repo_info(repo: Repo, probes: dict) -> dict:
+    commits = probes["first_page_commits"]
+    last_commit = (
+        sorted(commits, key=lambda x: x["date"])[-1]
+        if len(commits)
+        else {field: None for field in FlattenCommit.__annotations__}
+    )
+    repo_info = {
+        "org": repo["owner"]["login"],
+        "name": repo["name"],
+        "is_empty": len(commits) == 0,
+        "is_on_main": repo["default_branch"] == "main",
+        "is_backstage_missing": not probes["has_catalog_info"],
+    }
+    repo_info.update(get_repo_protections_info([probes["protections"]])[0])
+    repo_info.update(last_commit)
+    return repo_info
+
+
+def get_repos_info(
+    github_rest_manager: GithubRestManager,
+    repos: list[Repo],
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    watermark_store: Optional[RepoWatermarkStore] = None,
+) -> Iterator[dict]:
+    """Runs every probe of every repo in a single worker pool and yields a repo row as soon as all its probes are done."""
+    logger.info(f"Retrieving info for {len(repos)} repos with {max_workers} workers")
+    repos_by_name = {repo["full_name"]: repo for repo in repos}
+    pending = {repo["full_name"]: {} for repo in repos}
+    tasks = [
+        (repo["full_name"], probe_name)
+        for repo in repos
+        for probe_name in REPO_INFO_PROBES
+    ]
+
+    def run_probe(task: tuple[str, str]):
+        repo_name, probe_name = task
+        repo = repos_by_name[repo_name]
+        return _fetch_for_repo(
+            watermark_store,
+            probe_name,
+            repo,
+            lambda: REPO_INFO_PROBES[probe_name](github_rest_manager, repo),
+        )
+
+    for (repo_name, probe_name), result in map_concurrently(
+        run_probe, tasks, max_workers=max_workers
+    ):
+        probes = pending[repo_name]
+        probes[probe_name] = result
+        if len(probes) == len(REPO_INFO_PROBES):
+            del pending[repo_name]
+            yield _build_repo_info(repos_by_name[repo_name], probes)
+
+
 DEFAULT_PROTECTION = {
     "required_pull_request_reviews": {
         "dismiss_stale_reviews": True,
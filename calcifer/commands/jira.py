@@ -1,76 +1,369 @@
-from calcifer.services.jira_pager import JiraPager
-from calcifer.utils.json_logger import logger
+import math
+from datetime import datetime, timedelta
+from typing import Optional
+from calcifer.services.jira_pager import SEARCH_PATH, JiraPager
+from calcifer.utils.json_logger import get_logger
+from calcifer.utils.tracing import traced
 import json
 from calcifer.utils.cache import cache_to_file
+from calcifer.utils.jira_issue_store import JiraIssueStore
+from calcifer.utils.worker_pool import DEFAULT_MAX_WORKERS, map_concurrently
 from calcifer.services.jira_pager import get_default_query_param
 
+logger = get_logger(__name__)
 
-from tqdm import tqdm
 
+def _issues_cache_key(jira_pager: JiraPager, issues: json, *args) -> str:
+    return ",".join([issue["key"] for issue in issues] + [str(arg) for arg in args])
 
-@cache_to_file(file_prefix="issues_for_project")
+
+JQL_DATE_FORMAT = "%Y/%m/%d %H:%M"
+MAX_ISSUES_PER_WINDOW = 1000
+MIN_WINDOW = timedelta(minutes=1)
+
+DateWindow = tuple[datetime, datetime]
+
+
+def _get_window_jql(jql_query: str, window: DateWindow) -> str:
+    start, end = window
+    return (
+        f'{jql_query} AND created >= "{start.strftime(JQL_DATE_FORMAT)}" '
+        f'AND created < "{end.strftime(JQL_DATE_FORMAT)}"'
+    )
+
+
+def _split_window(window: DateWindow, parts: int) -> list[DateWindow]:
+    start, end = window
+    step = max((end - start) / parts, MIN_WINDOW)
+    boundaries = [start]
+    while boundaries[-1] + step < end:
+        boundaries.append((boundaries[-1] + step).replace(second=0, microsecond=0))
+    boundaries.append(end)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def count_issues(jira_pager: JiraPager, jql_query: str) -> int:
+    query_param = get_default_query_param()
+    query_param["jql"] = jql_query
+    query_param["maxResults"] = 0
+    return jira_pager.get_search_page(query_param)["total"]
+
+
+def get_created_windows(
+    jira_pager: JiraPager,
+    jql_query: str,
+    window: DateWindow,
+    total: int,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> list[DateWindow]:
+    """Splits window in created-date windows of at most MAX_ISSUES_PER_WINDOW issues each.
+
+    Windows are sized from the total of the window they come from and counted concurrently; those still too large
+    are split again until they fit or are a minute long.
+    """
+    windows_to_count = _split_window(window, math.ceil(total / MAX_ISSUES_PER_WINDOW))
+    windows = []
+    while windows_to_count:
+        counted_windows = map_concurrently(
+            lambda w: count_issues(jira_pager, _get_window_jql(jql_query, w)),
+            windows_to_count,
+            max_workers=max_workers,
+            show_progress=False,
+        )
+        windows_to_count = []
+        for (start, end), count in counted_windows:
+            if count > MAX_ISSUES_PER_WINDOW and end - start > MIN_WINDOW:
+                windows_to_count += _split_window(
+                    (start, end), math.ceil(count / MAX_ISSUES_PER_WINDOW)
+                )
+            elif count:
+                windows.append((start, end))
+    return sorted(windows)
+
+
+@traced(
+    "search_issues",
+    attributes=lambda jira_pager, jira_project, *args, **kwargs: {
+        "project": jira_project
+    },
+)
+@cache_to_file(
+    file_prefix="issues_for_project",
+    key=lambda jira_pager, jira_project, since, expand=None, updated_since=None, **_: (
+        f"{jira_project}:{since}:{expand}:{updated_since}:{jira_pager.fields}"
+    ),
+)
 def get_issues_for_project(
-    jira_pager: JiraPager, jira_project: str, since: str
+    jira_pager: JiraPager,
+    jira_project: str,
+    since: str,
+    expand: Optional[str] = None,
+    updated_since: Optional[str] = None,
+    max_workers: int = DEFAULT_MAX_WORKERS,
 ) -> list:
+    """Retrieves all issues of jira_project created after since.
+
+    Large projects are split in created-date windows (see get_created_windows) that are fetched concurrently and
+    merged, dropping duplicates, so that no query has to page deep into the results.
+    """
     jql_query = f"project={jira_project} AND createdDate > {since}"
+    if updated_since:
+        jql_query += f' AND updated >= "{updated_since}"'
     logger.info(f"Retrieving Jira issues with jql {jql_query}")
     query_param = get_default_query_param()
-    query_param["jql"] = jql_query
-    issues = jira_pager.get_all_pages(
-        "/rest/api/3/search",
+    if expand:
+        query_param["expand"] = expand
+
+    first_issue_param = get_default_query_param()
+    first_issue_param.update(
+        {
+            "jql": f"{jql_query} ORDER BY created ASC",
+            "maxResults": 1,
+            "fields": "created",
+        }
+    )
+    first_page = jira_pager.get_search_page(first_issue_param)
+    total = first_page["total"]
+    if total <= MAX_ISSUES_PER_WINDOW:
+        query_param["jql"] = jql_query
+        return jira_pager.get_all_pages(SEARCH_PATH, query_param, "issues")
+
+    # A day of margin on both sides, since JQL dates are in the user timezone
+    first_created = datetime.strptime(
+        first_page["issues"][0]["fields"]["created"][:10], "%Y-%m-%d"
+    )
+    windows = get_created_windows(
+        jira_pager,
+        jql_query,
+        (first_created - timedelta(days=1), datetime.now() + timedelta(days=1)),
+        total,
+        max_workers,
+    )
+    logger.info(f"Retrieving {total} issues in {len(windows)} created-date windows")
+
+    def get_window_issues(window: DateWindow) -> list:
+        window_param = query_param.copy()
+        window_param["jql"] = (
+            f"{_get_window_jql(jql_query, window)} ORDER BY created ASC"
+        )
+        return jira_pager.get_all_pages(
+            SEARCH_PATH, window_param, "issues", show_progress=False
+        )
+
+    issues_by_window = dict(
+        map_concurrently(get_window_issues, windows, max_workers=max_workers)
+    )
+    issues_by_key = {}
+    for window in windows:
+        for issue in issues_by_window[window]:
+            issues_by_key.setdefault(issue["key"], issue)
+    return list(issues_by_key.values())
+
+
+@traced(
+    "get_issue_change_log",
+    attributes=lambda jira_pager, issue_key, *args, **kwargs: {"issue_key": issue_key},
+)
+def get_issue_change_log(
+    jira_pager: JiraPager, issue_key: str, start_at: int = 0
+) -> list:
+    query_param = get_default_query_param()
+    query_param["startAt"] = start_at
+    return jira_pager.get_all_pages(
+        f"/rest/api/3/issue/{issue_key}/changelog",
         query_param,
-        "issues",
+        "values",
+        show_progress=False,
     )
-    return issues
 
 
-@cache_to_file(file_prefix="issues_change_status_log")
-def get_issues_change_logs(jira_pager: JiraPager, issues: json) -> list:
-    change_logs = []
+def _is_change_log_truncated(issue: dict) -> bool:
+    change_log = issue.get("changelog")
+    return change_log is None or change_log["total"] > len(change_log["histories"])
 
-    for i in tqdm(issues):
-        change_log = jira_pager.get_all_pages(
-            f'/rest/api/3/issue/{i["key"]}/changelog',
-            get_default_query_param(),
-            "values",
-            show_progress=False,
+
+# Issue fields read by each command, used to narrow down the search results
+CHANGE_LOG_ISSUE_FIELDS = ["assignee", "updated"]
+COMMENTS_ISSUE_FIELDS = ["created", "comment"]
+
+
+def get_issues_histories(
+    jira_pager: JiraPager,
+    issues: json,
+    known_totals: Optional[dict[str, int]] = None,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> dict[str, list]:
+    """Returns the change log histories of each issue, oldest first.
+
+    Issues should be searched with expand=changelog: their embedded history is used as is and the change log is
+    fetched, concurrently, only for those whose embedded history is truncated, skipping the known_totals entries
+    already seen.
+    """
+    known_totals = known_totals or {}
+    truncated_issues = [i["key"] for i in issues if _is_change_log_truncated(i)]
+    logger.info(
+        f"Fetching full change log of {len(truncated_issues)}/{len(issues)} issues"
+    )
+    fetched_histories = dict(
+        map_concurrently(
+            lambda issue_key: get_issue_change_log(
+                jira_pager, issue_key, known_totals.get(issue_key, 0)
+            ),
+            truncated_issues,
+            max_workers=max_workers,
         )
-        for log in change_log:
-            for field in log["items"]:
-                if field["field"] == "status":
-                    assignee = (
-                        i["fields"]["assignee"]["displayName"]
-                        if i["fields"]["assignee"]
-                        else None
-                    )
-                    change_logs.append(
-                        {
-                            "key": i["key"],
-                            "assignee": assignee,
-                            "created": log["created"],
-                            "from": field["fromString"],
-                            "to": field["toString"],
-                        }
-                    )
+    )
+    return {
+        i["key"]: (
+            fetched_histories[i["key"]]
+            if i["key"] in fetched_histories
+            else sorted(
+                i["changelog"]["histories"],
+                key=lambda log: (log["created"], log["id"]),
+            )
+        )
+        for i in issues
+    }
+
+
+def get_status_changes(issue: dict, histories: list) -> list:
+    change_logs = []
+    for log in histories:
+        for field in log["items"]:
+            if field["field"] == "status":
+                assignee = (
+                    issue["fields"]["assignee"]["displayName"]
+                    if issue["fields"]["assignee"]
+                    else None
+                )
+                change_logs.append(
+                    {
+                        "key": issue["key"],
+                        "assignee": assignee,
+                        "created": log["created"],
+                        "from": field["fromString"],
+                        "to": field["toString"],
+                    }
+                )
+    return change_logs
+
+
+@cache_to_file(file_prefix="issues_change_status_log", key=_issues_cache_key)
+def get_issues_change_logs(
+    jira_pager: JiraPager, issues: json, max_workers: int = DEFAULT_MAX_WORKERS
+) -> list:
+    histories = get_issues_histories(jira_pager, issues, max_workers=max_workers)
+    change_logs = []
+
+    for i in issues:
+        change_logs += get_status_changes(i, histories[i["key"]])
     return change_logs
 
 
-@cache_to_file(file_prefix="comments_by_issue")
+def sync_issues_change_logs(
+    jira_pager: JiraPager,
+    jira_issue_store: JiraIssueStore,
+    jira_project: str,
+    since: str,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> list:
+    """Brings jira_issue_store up to date and returns the status change log of all its issues.
+
+    Only issues updated since the last stored `updated` (minus a day, JQL dates being in the user timezone) are
+    searched, and only their changelog entries newer than the last stored one are added.
+    """
+    last_updated = jira_issue_store.get_last_updated()
+    updated_since = None
+    if last_updated:
+        updated_since = (
+            datetime.strptime(last_updated[:10], "%Y-%m-%d") - timedelta(days=1)
+        ).strftime(JQL_DATE_FORMAT)
+    issues = get_issues_for_project(
+        jira_pager, jira_project, since, "changelog", updated_since=updated_since
+    )
+    histories = get_issues_histories(
+        jira_pager, issues, jira_issue_store.get_change_log_totals(), max_workers
+    )
+    for issue in issues:
+        new_histories = jira_issue_store.get_new_histories(
+            issue["key"], histories[issue["key"]]
+        )
+        jira_issue_store.update_issue(
+            issue["key"],
+            issue["fields"]["updated"],
+            issue["changelog"]["total"],
+            new_histories,
+            get_status_changes(issue, new_histories),
+        )
+    return jira_issue_store.get_change_logs()
+
+
+@traced(
+    "get_issue_comments",
+    attributes=lambda jira_pager, issue_key, *args, **kwargs: {"issue_key": issue_key},
+)
+def get_issue_comments(jira_pager: JiraPager, issue_key: str, start_at: int) -> list:
+    query_param = get_default_query_param()
+    query_param["startAt"] = start_at
+    return jira_pager.get_all_pages(
+        f"/rest/api/3/issue/{issue_key}/comment",
+        query_param,
+        "comments",
+        show_progress=False,
+    )
+
+
+def _get_embedded_comments(issue: dict) -> list:
+    return issue["fields"].get("comment", {}).get("comments", [])
+
+
+def _is_comment_page_truncated(issue: dict) -> bool:
+    comment = issue["fields"].get("comment")
+    return comment is None or comment["total"] > len(comment["comments"])
+
+
+@cache_to_file(file_prefix="comments_by_issue", key=_issues_cache_key)
 def get_comments_by_issue(
-    jira_pager: JiraPager, issues: json, search_for_user: str
+    jira_pager: JiraPager,
+    issues: json,
+    search_for_user: str,
+    max_workers: int = DEFAULT_MAX_WORKERS,
 ) -> list:
-    issues_with_comments_by = []
+    """Returns, once, every issue with at least a comment by search_for_user.
 
-    for issue in tqdm(issues):
-        comments = jira_pager.get_all_pages(
-            f'/rest/api/3/issue/{issue["key"]}/comment',
-            get_default_query_param(),
-            "comments",
-            show_progress=False,
+    Issues should be searched with COMMENTS_ISSUE_FIELDS: the embedded comments are checked first and the remaining comment
+    pages are fetched, concurrently, only for issues with more comments than the search page includes and none by
+    search_for_user among them.
+    """
+
+    def has_comment_by_user(comments: list) -> bool:
+        return any(
+            comment["author"]["displayName"] == search_for_user for comment in comments
         )
-        for comment in comments:
-            if comment["author"]["displayName"] == search_for_user:
-                issues_with_comments_by.append(
-                    {"key": issue["key"], "creationdate": issue["fields"]["created"]}
-                )
-    return issues_with_comments_by
+
+    issues_to_complete = [
+        issue
+        for issue in issues
+        if not has_comment_by_user(_get_embedded_comments(issue))
+        and _is_comment_page_truncated(issue)
+    ]
+    logger.info(
+        f"Fetching remaining comments of {len(issues_to_complete)}/{len(issues)} issues"
+    )
+    remaining_comments = {
+        issue["key"]: comments
+        for issue, comments in map_concurrently(
+            lambda issue: get_issue_comments(
+                jira_pager, issue["key"], len(_get_embedded_comments(issue))
+            ),
+            issues_to_complete,
+            max_workers=max_workers,
+        )
+    }
+
+    return [
+        {"key": issue["key"], "creationdate": issue["fields"]["created"]}
+        for issue in issues
+        if has_comment_by_user(_get_embedded_comments(issue))
+        or has_comment_by_user(remaining_comments.get(issue["key"], []))
+    ]
@@ -1,5 +1,6 @@
 from typing import TypedDict
 from pydantic import HttpUrl
+from calcifer.utils.compact_record import compact_record
 
 
 class RepoOwner(TypedDict):
@@ -31,8 +32,12 @@ class Repo(TypedDict):
     default_branch: str
     git_tags_url: HttpUrl
     commits_url: HttpUrl
-    visibility: bool
+    contributors_url: HttpUrl
+    clone_url: HttpUrl
+    visibility: str
     owner: RepoOwner
+    pushed_at: str
+    updated_at: str
 
 
 class RepoProtection(TypedDict):
@@ -45,7 +50,7 @@ class RepoProtection(TypedDict):
 
 class RepoProtectionInfo(TypedDict):
     name: str
-    visibility: bool
+    visibility: str
     required_status_checks: bool
     dismiss_stale_review: bool
     require_approving_review_count: int
@@ -104,4 +109,11 @@ class Contributor(TypedDict):
 
 class ContributorWithRepo(TypedDict):
     login: str
+    contributions: int
     repo: str
+
+
+# Compact records that api items are trimmed to as they are fetched, keeping only the fields the commands read
+RepoRecord = compact_record(Repo)
+FlattenCommitRecord = compact_record(FlattenCommit)
+ContributorWithRepoRecord = compact_record(ContributorWithRepo)
@@ -5,6 +5,7 @@ from calcifer.services.rest_pager import (
     RestPager,
     HTTPBearer,
 )
+from calcifer.services.rate_budget import RateBudget
 from pydantic import SecretStr, HttpUrl
 
 
@@ -12,6 +13,9 @@ class Auth0LatestLogsParam(QueryParams):
     page: int
     per_page: int
     q: Optional[str]
+    sort: Optional[str]
+    fields: Optional[str]
+    include_fields: Optional[str]
 
 
 # Note: not using an explicit "from" here because it's a reserved word
@@ -19,16 +23,34 @@ class Auth0LatestLogsParam(QueryParams):
 class Auth0FromLogIdLogsParam(QueryParams):
     take: int
     q: Optional[str]
+    fields: Optional[str]
+    include_fields: Optional[str]
 
 
 def get_default_auth0_latest_logs_query_param() -> Auth0LatestLogsParam:
     return Auth0LatestLogsParam(page=0, per_page=DEFAULT_PAGE_SIZE, q=None)
 
 
+def project_auth0_fields(query_params: QueryParams, fields: list[str]) -> QueryParams:
+    new_params = query_params.copy()
+    new_params["fields"] = ",".join(fields)
+    new_params["include_fields"] = "true"
+    return new_params
+
+
 class Auth0FromLogIdPager(RestPager[Auth0FromLogIdLogsParam]):
-    def __init__(self, url: HttpUrl, bearer: SecretStr) -> None:
-        self.url = url
-        self.auth = HTTPBearer(bearer.get_secret_value())
+    projectable_paths = ("/logs",)
+
+    def __init__(
+        self,
+        url: HttpUrl,
+        bearer: SecretStr,
+        rate_budget: Optional[RateBudget] = None,
+        fields: Optional[list[str]] = None,
+    ) -> None:
+        super().__init__(
+            url, HTTPBearer(bearer.get_secret_value()), rate_budget, fields
+        )
 
     def update_params(
         self, query_params: Auth0FromLogIdLogsParam, last_results: list[dict]
@@ -37,11 +59,25 @@ class Auth0FromLogIdPager(RestPager[Auth0FromLogIdLogsParam]):
         new_params["from"] = last_results[-1]["log_id"]
         return new_params
 
+    def project_fields(
+        self, query_params: Auth0FromLogIdLogsParam
+    ) -> Auth0FromLogIdLogsParam:
+        return project_auth0_fields(query_params, self.fields)
+
 
 class Auth0LatestLogsPager(RestPager[Auth0LatestLogsParam]):
-    def __init__(self, url: HttpUrl, bearer: SecretStr) -> None:
-        self.url = url
-        self.auth = HTTPBearer(bearer.get_secret_value())
+    projectable_paths = ("/logs",)
+
+    def __init__(
+        self,
+        url: HttpUrl,
+        bearer: SecretStr,
+        rate_budget: Optional[RateBudget] = None,
+        fields: Optional[list[str]] = None,
+    ) -> None:
+        super().__init__(
+            url, HTTPBearer(bearer.get_secret_value()), rate_budget, fields
+        )
 
     def update_params(
         self, query_params: Auth0LatestLogsParam, last_results: list[dict]
@@ -49,3 +85,8 @@ class Auth0LatestLogsPager(RestPager[Auth0LatestLogsParam]):
         new_params = query_params.copy()
         new_params["page"] += 1
         return new_params
+
+    def project_fields(
+        self, query_params: Auth0LatestLogsParam
+    ) -> Auth0LatestLogsParam:
+        return project_auth0_fields(query_params, self.fields)
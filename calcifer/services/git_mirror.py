@@ -0,0 +1,150 @@
+import base64
+import os
+import subprocess
+from pathlib import Path
+from typing import Optional
+from pydantic import SecretStr
+from calcifer.utils.json_logger import get_logger
+
+logger = get_logger(__name__)
+
+FIELD_SEPARATOR = "\x1f"
+RECORD_SEPARATOR = "\x1e"
+GIT_DATE_FORMAT = "format-local:%Y-%m-%dT%H:%M:%SZ"
+# Only branches and tags are read, e.g. GitHub's refs/pull/* are left out
+MIRROR_REFSPECS = ("+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*")
+
+
+class GitCommandException(Exception):
+    pass
+
+
+class GitMirror:
+    """Keeps a local partial (blob-less) mirror of each repo so commit history can be read at disk speed.
+
+    Mirrors are created with `git clone --bare --filter=blob:none` the first time a repo is seen, set up to fetch
+    only branches and tags, and refreshed with an incremental `git fetch --prune` afterwards. Any url git understands
+    works, including `file://` ones.
+    """
+
+    def __init__(
+        self,
+        mirror_dir: Path,
+        user: Optional[str] = None,
+        token: Optional[SecretStr] = None,
+    ) -> None:
+        self.mirror_dir = Path(mirror_dir)
+        self.mirror_dir.mkdir(parents=True, exist_ok=True)
+        self.env = {**os.environ, "TZ": "UTC", "GIT_TERMINAL_PROMPT": "0"}
+        if user and token:
+            credentials = base64.b64encode(
+                f"{user}:{token.get_secret_value()}".encode()
+            ).decode()
+            # Passed as environment config rather than with -c, so that the token never shows up in the process list
+            config_index = int(self.env.get("GIT_CONFIG_COUNT", 0))
+            self.env.update(
+                {
+                    "GIT_CONFIG_COUNT": str(config_index + 1),
+                    f"GIT_CONFIG_KEY_{config_index}": "http.extraHeader",
+                    f"GIT_CONFIG_VALUE_{config_index}": f"Authorization: Basic {credentials}",
+                }
+            )
+
+    def _run(self, git_dir: Optional[Path], *args: str) -> subprocess.CompletedProcess:
+        git_dir_args = ["--git-dir", str(git_dir)] if git_dir else []
+        return subprocess.run(
+            ["git", *git_dir_args, *args],
+            capture_output=True,
+            text=True,
+            env=self.env,
+        )
+
+    def _git(self, git_dir: Optional[Path], *args: str) -> str:
+        result = self._run(git_dir, *args)
+        if result.returncode != 0:
+            logger.error(f"Failed git {args[0]} with error {result.stderr.strip()}")
+            raise GitCommandException(
+                f"Something went wrong while running git {args[0]}"
+            )
+        return result.stdout
+
+    def get_mirror_path(self, repo_name: str) -> Path:
+        return self.mirror_dir / f"{repo_name}.git"
+
+    def sync(self, repo_name: str, clone_url: str) -> Path:
+        mirror_path = self.get_mirror_path(repo_name)
+        if mirror_path.exists():
+            self._git(mirror_path, "fetch", "--prune", "--quiet", "origin")
+        else:
+            self._git(
+                None,
+                "clone",
+                "--bare",
+                "--filter=blob:none",
+                "--quiet",
+                clone_url,
+                str(mirror_path),
+            )
+            for refspec in MIRROR_REFSPECS:
+                self._git(
+                    mirror_path, "config", "--add", "remote.origin.fetch", refspec
+                )
+        return mirror_path
+
+    def has_ref(self, repo_name: str, ref: str) -> bool:
+        """Whether ref points to a commit, e.g. False for the default branch of an empty repo."""
+        result = self._run(
+            self.get_mirror_path(repo_name),
+            "rev-parse",
+            "--verify",
+            "--quiet",
+            f"{ref}^{{commit}}",
+        )
+        return result.returncode == 0
+
+    def count_commits(self, repo_name: str, ref: str) -> int:
+        if not self.has_ref(repo_name, ref):
+            return 0
+        return int(
+            self._git(self.get_mirror_path(repo_name), "rev-list", "--count", ref)
+        )
+
+    def get_commits(
+        self, repo_name: str, revisions: list[str], *log_args: str
+    ) -> list[dict]:
+        """Returns sha, author, date and message for the commits selected by `git log <log_args> <revisions>`."""
+        if not revisions:
+            return []
+        output = self._git(
+            self.get_mirror_path(repo_name),
+            "log",
+            f"--date={GIT_DATE_FORMAT}",
+            f"--format=%H{FIELD_SEPARATOR}%an{FIELD_SEPARATOR}%ad{FIELD_SEPARATOR}%B{RECORD_SEPARATOR}",
+            *log_args,
+            *revisions,
+            "--",
+        )
+        commits = []
+        for record in output.split(RECORD_SEPARATOR):
+            record = record.strip("\n")
+            if not record:
+                continue
+            sha, author, date, message = record.split(FIELD_SEPARATOR, 3)
+            commits.append(
+                {"sha": sha, "author": author, "date": date, "message": message.strip()}
+            )
+        return commits
+
+    def get_tags(self, repo_name: str) -> dict[str, str]:
+        """Returns the commit sha of every tag, peeling annotated tags."""
+        output = self._git(
+            self.get_mirror_path(repo_name),
+            "for-each-ref",
+            f"--format=%(refname:strip=2){FIELD_SEPARATOR}%(objectname){FIELD_SEPARATOR}%(*objectname)",
+            "refs/tags",
+        )
+        tags = {}
+        for line in output.splitlines():
+            name, sha, peeled_sha = line.split(FIELD_SEPARATOR)
+            tags[name] = peeled_sha or sha
+        return tags
@@ -1,9 +1,11 @@
-import requests
 from requests.auth import HTTPBasicAuth
 from typing import Optional
+from calcifer.services.rate_budget import RateBudget
 from calcifer.services.rest_pager import DEFAULT_PAGE_SIZE, QueryParams, RestPager
 from pydantic import SecretStr, HttpUrl
 
+DEFAULT_GITHUB_URL = "https://api.github.com/"
+
 
 class GithubQueryParam(QueryParams):
     page: int
@@ -16,9 +18,16 @@ def get_default_github_query_param() -> GithubQueryParam:
 
 
 class GithubRestManager(RestPager[GithubQueryParam]):
-    def __init__(self, url: HttpUrl, user: str, token: SecretStr) -> None:
-        self.url = url
-        self.auth = HTTPBasicAuth(user, token.get_secret_value())
+    def __init__(
+        self,
+        url: HttpUrl,
+        user: str,
+        token: SecretStr,
+        rate_budget: Optional[RateBudget] = None,
+    ) -> None:
+        super().__init__(
+            url, HTTPBasicAuth(user, token.get_secret_value()), rate_budget
+        )
 
     def update_params(
         self, query_params: GithubQueryParam, last_results: list[dict]
@@ -34,10 +43,10 @@ class GithubRestManager(RestPager[GithubQueryParam]):
         main_branch: str,
         protections: dict,
     ) -> None:
-        response = requests.put(
-            f"{self.url}https://api.github.com/repos/{github_org}/{github_repo_name}/branches/{main_branch}/protection",
+        response = self._request(
+            "PUT",
+            f"{self.url}repos/{github_org}/{github_repo_name}/branches/{main_branch}/protection",
             json=protections,
-            auth=HTTPBasicAuth(self.user, self.token.get_secret_value()),
         )
         if response.status_code not in (200, 204):
             raise Exception(
@@ -50,9 +59,9 @@ class GithubRestManager(RestPager[GithubQueryParam]):
         github_repo_name: str,
         file_name: str,
     ) -> Optional[dict]:
-        response = requests.get(
-            f"https://api.github.com/repos/{github_org}/{github_repo_name}/contents/{file_name}",
-            auth=self.auth,
+        response = self._request(
+            "GET",
+            f"{self.url}repos/{github_org}/{github_repo_name}/contents/{file_name}",
         )
         if response.status_code == 404:
             return None
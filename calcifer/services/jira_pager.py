@@ -1,13 +1,27 @@
+import json
 from typing import Optional
-from calcifer.services.rest_pager import DEFAULT_PAGE_SIZE, QueryParams, RestPager
+from calcifer.services.rest_pager import (
+    DEFAULT_PAGE_SIZE,
+    HttpErrorException,
+    QueryParams,
+    RestPager,
+)
+from calcifer.services.rate_budget import RateBudget
 from pydantic import SecretStr, HttpUrl
 from requests.auth import HTTPBasicAuth
+from calcifer.utils.json_logger import get_logger
+
+logger = get_logger(__name__)
+
+SEARCH_PATH = "/rest/api/3/search"
 
 
 class JiraQueryParam(QueryParams):
     maxResults: int
     startAt: int
     jql: Optional[str]
+    expand: Optional[str]
+    fields: Optional[str]
 
 
 def get_default_query_param() -> JiraQueryParam:
@@ -15,14 +29,44 @@ def get_default_query_param() -> JiraQueryParam:
 
 
 class JiraPager(RestPager):
-    def __init__(self, url: HttpUrl, user: str, token: SecretStr) -> None:
-        self.url = url
+    projectable_paths = (SEARCH_PATH,)
+
+    def __init__(
+        self,
+        url: HttpUrl,
+        user: str,
+        token: SecretStr,
+        rate_budget: Optional[RateBudget] = None,
+        fields: Optional[list[str]] = None,
+    ) -> None:
+        super().__init__(
+            url, HTTPBasicAuth(user, token.get_secret_value()), rate_budget, fields
+        )
         self.total_param = "total"
-        self.auth = HTTPBasicAuth(user, token.get_secret_value())
+        self.start_param = "startAt"
 
     def update_params(
         self, query_params: JiraQueryParam, last_results: list[dict]
     ) -> JiraQueryParam:
         new_params = query_params.copy()
-        new_params["startAt"] += self.page_size
+        new_params["startAt"] += len(last_results)
         return new_params
+
+    def project_fields(self, query_params: JiraQueryParam) -> JiraQueryParam:
+        new_params = query_params.copy()
+        new_params["fields"] = ",".join(self.fields)
+        return new_params
+
+    def get_search_page(self, query_params: JiraQueryParam) -> dict:
+        """Returns a single page of search results, e.g. to read its total."""
+        response = self._request("GET", f"{self.url}{SEARCH_PATH}", params=query_params)
+        if response.status_code != 200:
+            logger.error(
+                f"Failed search with jql {query_params.get('jql')} "
+                f"with response {response.status_code} {response.content}"
+            )
+            raise HttpErrorException(
+                message="Something went wrong while searching jira issues",
+                response=response,
+            )
+        return json.loads(response.content)
@@ -0,0 +1,79 @@
+import threading
+import time
+from typing import Optional
+from requests import Response
+from calcifer.utils.json_logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_MAX_CONCURRENT_REQUESTS = 16
+DEFAULT_RESERVED_REQUESTS = 10
+
+
+class RateBudget:
+    """Request budget shared by every pager (and thread) that uses it.
+
+    It caps the number of requests in flight and, based on the X-RateLimit-* headers of the last response, pauses
+    everybody until the rate limit window resets once only `reserved_requests` calls are left.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+        reserved_requests: int = DEFAULT_RESERVED_REQUESTS,
+    ) -> None:
+        self.max_concurrent_requests = max_concurrent_requests
+        self.reserved_requests = reserved_requests
+        self.remaining: Optional[int] = None
+        self.reset_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(max_concurrent_requests)
+
+    def acquire(self) -> None:
+        self._in_flight.acquire()
+        while wait := self._take():
+            # Sleeps without the lock, so that the responses in flight can still update the budget
+            logger.warning(f"Rate budget exhausted, waiting {wait:.0f}s for reset")
+            time.sleep(wait)
+
+    def _take(self) -> float:
+        """Takes a request from the budget, or returns how long to wait for its reset when it is exhausted."""
+        with self._lock:
+            now = time.time()
+            if (
+                self.remaining is not None
+                and self.remaining <= self.reserved_requests
+                and self.reset_at
+                and self.reset_at > now
+            ):
+                return self.reset_at - now + 1
+            if self.reset_at and self.reset_at <= now:
+                self.remaining = None
+            if self.remaining is not None:
+                self.remaining -= 1
+            return 0
+
+    def release(self) -> None:
+        self._in_flight.release()
+
+    def update(self, response: Response) -> None:
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset_at = response.headers.get("X-RateLimit-Reset")
+        retry_after = response.headers.get("Retry-After")
+        with self._lock:
+            if remaining is not None:
+                self.remaining = int(remaining)
+            if reset_at is not None:
+                self.reset_at = float(reset_at)
+            if retry_after is not None:
+                self.remaining = 0
+                self.reset_at = time.time() + float(retry_after)
+
+    def is_rate_limited(self, response: Response) -> bool:
+        return response.status_code == 429 or (
+            response.status_code == 403
+            and (
+                response.headers.get("X-RateLimit-Remaining") == "0"
+                or "Retry-After" in response.headers
+            )
+        )
@@ -1,13 +1,25 @@
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import AuthBase
 from tqdm import tqdm
 import json
 from pydantic import SecretStr, HttpUrl
-from typing import Callable, TypedDict, Generic, TypeVar, Optional
-from calcifer.utils.json_logger import logger
+from typing import Callable, Iterator, TypedDict, Generic, TypeVar, Optional
+from calcifer.utils.http_archive import http_archive
+from calcifer.utils.json_logger import get_logger
+from calcifer.utils.metrics import metrics
+from calcifer.utils.tracing import span, traced
+from calcifer.services.rate_budget import RateBudget
 from pydantic.generics import GenericModel
 
+logger = get_logger(__name__)
+
 DEFAULT_PAGE_SIZE = 100
+MAX_RETRIES = 3
+# Server errors are retried after RETRY_BACKOFF seconds, doubled on each retry
+RETRY_BACKOFF = 0.5
 
 
 class NoResponse(Exception):
@@ -42,18 +54,157 @@ class HttpErrorException(Exception):
     message: str
     response: GenericModel
 
+    def __init__(self, message: str, response: GenericModel) -> None:
+        super().__init__(message)
+        self.message = message
+        self.response = response
+
 
 class RestPager(Generic[T]):
 
     url: HttpUrl
     page_size: int = DEFAULT_PAGE_SIZE
     total_param: Optional[str] = None
+    # Query param of the offset of the first result, so that a listing resumed at an offset knows when it is done
+    start_param: Optional[str] = None
     bearer: Optional[SecretStr]
     auth: AuthBase
+    rate_budget: RateBudget
+    session: requests.Session
+    # Paths whose results can be narrowed down to `fields`, see project_fields
+    projectable_paths: tuple[str, ...] = ()
+
+    def __init__(
+        self,
+        url: HttpUrl,
+        auth: AuthBase,
+        rate_budget: Optional[RateBudget] = None,
+        fields: Optional[list[str]] = None,
+    ) -> None:
+        self.url = url
+        self.auth = auth
+        self.fields = fields
+        self.projected_bytes = 0
+        self.projection_ratio: Optional[float] = None
+        self._stats_lock = threading.Lock()
+        self.rate_budget = rate_budget or RateBudget()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.rate_budget.max_concurrent_requests,
+            pool_maxsize=self.rate_budget.max_concurrent_requests,
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Every call goes through here so that it shares the connection pool and the rate budget, and is measured.
+
+        The recorded latency includes the retries and the waits for the rate budget. When the http archive is
+        replaying, responses come from it instead of the network, see HttpArchive.
+        """
+        started_at = time.perf_counter()
+        with span(
+            f"HTTP {method}", **{"http.method": method, "http.url": url}
+        ) as request_span:
+            if http_archive.mode == "replay":
+                response, retries = self._replay(method, url, **kwargs), 0
+            else:
+                response, retries = self._send(method, url, **kwargs)
+            if request_span:
+                request_span.set_attribute("http.status_code", response.status_code)
+                request_span.set_attribute("http.retries", retries)
+        latency = time.perf_counter() - started_at
+        metrics.record_request(
+            method,
+            url,
+            response.status_code,
+            latency,
+            len(response.content),
+            retries,
+        )
+        # Lazy %-formatting, so that the message is only built when debug is on for this module and the record sampled
+        logger.debug(
+            "Call %s %s returned %s in %.3fs",
+            method,
+            url,
+            response.status_code,
+            latency,
+        )
+        return response
+
+    def _send(self, method: str, url: str, **kwargs) -> tuple[requests.Response, int]:
+        """Sends the request within the rate budget, retrying it if rate limited or on a 5xx; returns the response and retries."""
+        for retries in range(MAX_RETRIES + 1):
+            self.rate_budget.acquire()
+            try:
+                response = self.session.request(method, url, auth=self.auth, **kwargs)
+            finally:
+                self.rate_budget.release()
+            self.rate_budget.update(response)
+            if retries == MAX_RETRIES:
+                break
+            if self.rate_budget.is_rate_limited(response):
+                logger.warning(f"Call {method} {url} was rate limited, retrying")
+            elif response.status_code >= 500:
+                backoff = RETRY_BACKOFF * 2**retries
+                logger.warning(
+                    f"Call {method} {url} returned {response.status_code}, retrying in {backoff}s"
+                )
+                time.sleep(backoff)
+            else:
+                break
+
+        # Only the final response is recorded, so that replays don't go through the retries
+        if http_archive.mode == "record":
+            http_archive.record(response, response.elapsed.total_seconds())
+        return response, retries
+
+    def _replay(self, method: str, url: str, **kwargs) -> requests.Response:
+        # Prepared without auth, as credentials are not part of the recorded requests
+        return http_archive.replay(
+            self.session.prepare_request(requests.Request(method, url, **kwargs))
+        )
 
     def update_params(self, query_params: T, last_results: list[dict]) -> T:
         raise NotImplementedError
 
+    def project_fields(self, query_params: T) -> T:
+        """Returns query_params asking the api to return only self.fields."""
+        raise NotImplementedError
+
+    def _get_projected(self, url: str, query_params: T) -> requests.Response:
+        response = self._request("GET", url, params=self.project_fields(query_params))
+        if response.status_code != 200:
+            return response
+        with self._stats_lock:
+            self.projected_bytes += len(response.content)
+            measure_ratio = self.projection_ratio is None and metrics.measure_projection
+            if measure_ratio:
+                self.projection_ratio = 1.0
+        if measure_ratio:
+            # One unprojected call per pager to estimate how much the projection saves, only when metrics are saved
+            full_response = self._request("GET", url, params=query_params)
+            if full_response.status_code == 200 and len(full_response.content):
+                self.projection_ratio = len(response.content) / len(
+                    full_response.content
+                )
+        return response
+
+    def log_projection_summary(self) -> None:
+        if not self.fields or not self.projection_ratio:
+            return
+        saved_bytes = (
+            self.projected_bytes / self.projection_ratio - self.projected_bytes
+        )
+        metrics.record_projection_savings(saved_bytes)
+        logger.info(
+            f"Field projection on {self.fields} received {self.projected_bytes} bytes, "
+            f"saving about {saved_bytes:.0f} bytes ({1 - self.projection_ratio:.0%})"
+        )
+
+    @traced(
+        "get_all_pages", attributes=lambda self, path, *args, **kwargs: {"path": path}
+    )
     def get_all_pages(
         self,
         path: str,
@@ -70,70 +221,87 @@ class RestPager(Generic[T]):
         if self.url in path:
             path = path.replace(self.url, "")
 
-        def make_request(query_params: T):
-            response = requests.get(
-                f"{self.url}{path}",
-                params=query_params,
-                auth=self.auth,
-            )
-            if response.status_code in (400, 404, 409, 204):
-                if response.status_code == 400:
-                    logger.warn(
-                        f"Call to {response.request.method}/{response.request.url} {response.request.body} returned 400"
-                    )
-                return []
-            elif response.status_code == 200:
-                return json.loads(response.content)
-            else:
-                logger.error(
-                    f"Failed call {response.request.method}/{response.request.url} {response.request.body} "
-                    f"with response {response.status_code} {response.content}"
-                )
-                raise HttpErrorException(
-                    message="Something went wrong while calling the github api",
-                    response=response,
-                )
-
         data = []
 
         # TODO: refactor the two branches
         if self.total_param:
-            curr_res = make_request(
-                query_params
-            )  # TODO: I'm actually making an extra call here
-            for i in tqdm(
-                range(0, curr_res[self.total_param], self.page_size),
+            start = query_params.get(self.start_param, 0) if self.start_param else 0
+            curr_res = self._get_page(path, query_params)
+            with tqdm(
+                total=curr_res[self.total_param] - start if len(curr_res) else 0,
                 disable=not show_progress,
-            ):  # TODO: not sure if tdqm is just autocalculating the number of pages or what here
-                curr_res = make_request(query_params)
-                if len(curr_res):
-                    query_params = self.update_params(query_params)
+            ) as progress:
+                while len(curr_res):
+                    total = curr_res[self.total_param]
                     if type(curr_res) is dict:
                         curr_res = curr_res[collection_name]
-                    if stop_if(curr_res[0]):
+                    if not len(curr_res) or stop_if(curr_res[0]):
                         break
                     valid_results = [map_item(res) for res in curr_res]
                     data += valid_results
-            return data
-        else:
-            while (
-                True
-            ):  # TODO: this is for github that doesn't give the total number of repos; only way to do it is to use graphql https://docs.github.com/en/graphql
-                curr_res = make_request(query_params)
-                if type(curr_res) is dict:
-                    if collection_name:
-                        curr_res = curr_res.get(collection_name, [])
-                    else:
-                        data += [
-                            map_item(res) for res in [curr_res]
-                        ]  # This is a response with a single result
+                    progress.update(len(valid_results))
+                    if start + len(data) >= total:
                         break
-                if len(curr_res):
-                    if stop_if(curr_res[0]):
-                        break
-                    valid_results = [map_item(res) for res in curr_res]
                     query_params = self.update_params(query_params, valid_results)
-                    data += valid_results
-                else:
-                    break
+                    curr_res = self._get_page(path, query_params)
+            return data
+        else:
+            for page in self.iter_pages(
+                path, query_params, collection_name, map_item, stop_if
+            ):
+                data += page
             return data
+
+    def iter_pages(
+        self,
+        path: str,
+        query_params: T,
+        collection_name: str,
+        map_item: Callable[dict, dict] = lambda item: item,
+        stop_if: Callable[dict, bool] = None,
+    ) -> Iterator[list[dict]]:
+        """Yields one list of mapped results per page as soon as it is fetched, so callers can stream them out."""
+        stop_if = stop_if or (lambda page: False)
+
+        if self.url in path:
+            path = path.replace(self.url, "")
+
+        while (
+            True
+        ):  # TODO: this is for github that doesn't give the total number of repos; only way to do it is to use graphql https://docs.github.com/en/graphql
+            curr_res = self._get_page(path, query_params)
+            if type(curr_res) is dict:
+                if collection_name:
+                    curr_res = curr_res.get(collection_name, [])
+                else:
+                    # This is a response with a single result
+                    yield [map_item(curr_res)]
+                    return
+            if not len(curr_res) or stop_if(curr_res[0]):
+                return
+            valid_results = [map_item(res) for res in curr_res]
+            query_params = self.update_params(query_params, valid_results)
+            yield valid_results
+
+    def _get_page(self, path: str, query_params: T):
+        if self.fields and path in self.projectable_paths:
+            response = self._get_projected(f"{self.url}{path}", query_params)
+        else:
+            response = self._request("GET", f"{self.url}{path}", params=query_params)
+        if response.status_code in (400, 404, 409, 204):
+            if response.status_code == 400:
+                logger.warn(
+                    f"Call to {response.request.method}/{response.request.url} {response.request.body} returned 400"
+                )
+            return []
+        elif response.status_code == 200:
+            return json.loads(response.content)
+        else:
+            logger.error(
+                f"Failed call {response.request.method}/{response.request.url} {response.request.body} "
+                f"with response {response.status_code} {response.content}"
+            )
+            raise HttpErrorException(
+                message="Something went wrong while calling the github api",
+                response=response,
+            )
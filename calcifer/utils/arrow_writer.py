@@ -0,0 +1,179 @@
+import json
+from pathlib import Path
+from typing import Any, Iterable, Literal, Optional, get_type_hints, is_typeddict
+from pydantic import HttpUrl
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is an optional dependency, see the arrow extra
+    pa = None
+
+ArrowFormat = Literal["parquet", "arrow"]
+
+DEFAULT_ROW_GROUP_SIZE = 64 * 1024
+DEFAULT_COMPRESSION = "zstd"
+
+
+class MissingArrowException(Exception):
+    pass
+
+
+def _check_pyarrow() -> None:
+    if pa is None:
+        raise MissingArrowException(
+            "parquet and arrow outputs need pyarrow, install calcifer with the arrow extra"
+        )
+
+
+def get_arrow_type(annotation: type) -> Optional["pa.DataType"]:
+    """Maps a model annotation to an arrow type; None means that the type is inferred from the data."""
+    if annotation in (str, HttpUrl):
+        return pa.string()
+    if annotation is bool:
+        return pa.bool_()
+    if annotation is int:
+        return pa.int64()
+    if annotation is float:
+        return pa.float64()
+    if is_typeddict(annotation):
+        return pa.struct(
+            [
+                (name, get_arrow_type(field_annotation) or pa.string())
+                for name, field_annotation in get_type_hints(annotation).items()
+            ]
+        )
+    return None
+
+
+def get_arrow_schema(
+    columns: dict[str, list], column_types: dict[str, type]
+) -> "pa.Schema":
+    """Types declared columns from column_types, inferring the others from their values (strings when all empty)."""
+    fields = []
+    for name, values in columns.items():
+        arrow_type = get_arrow_type(column_types.get(name))
+        if arrow_type is None:
+            arrow_type = pa.array(values).type
+        if pa.types.is_null(arrow_type):
+            arrow_type = pa.string()
+        elif pa.types.is_list(arrow_type) and pa.types.is_null(arrow_type.value_type):
+            arrow_type = pa.list_(pa.string())
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+
+def _get_column_types(model: Optional[type]) -> dict[str, type]:
+    return get_type_hints(model) if model else {}
+
+
+def _to_string(value: Any) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return str(value)
+
+
+class ArrowFileWriter:
+    """Writes tables to a parquet or arrow (IPC) file in compressed row groups, with the schema of the first one."""
+
+    def __init__(self, file_name: Path, output_format: ArrowFormat) -> None:
+        _check_pyarrow()
+        self.file_name = file_name
+        self.output_format = output_format
+        self.schema = None
+        self._writer = None
+
+    def write_columns(
+        self, columns: dict[str, list], column_types: dict[str, type]
+    ) -> None:
+        if self.schema is None:
+            self.schema = get_arrow_schema(columns, column_types)
+            if self.output_format == "parquet":
+                self._writer = pq.ParquetWriter(
+                    self.file_name, self.schema, compression=DEFAULT_COMPRESSION
+                )
+            else:
+                self._writer = pa.ipc.new_file(
+                    str(self.file_name),
+                    self.schema,
+                    options=pa.ipc.IpcWriteOptions(compression=DEFAULT_COMPRESSION),
+                )
+        table = pa.table(
+            {name: columns[name] for name in self.schema.names}, schema=self.schema
+        )
+        if self.output_format == "parquet":
+            self._writer.write_table(table, row_group_size=DEFAULT_ROW_GROUP_SIZE)
+        else:
+            self._writer.write_table(table, max_chunksize=DEFAULT_ROW_GROUP_SIZE)
+
+    def close(self) -> None:
+        if self._writer:
+            self._writer.close()
+
+
+def write_arrow_rows(
+    file_name: Path,
+    rows: Iterable[dict],
+    fieldnames: list[str],
+    output_format: ArrowFormat,
+    model: Optional[type] = None,
+    row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+) -> None:
+    """Writes rows to a parquet or arrow file, one row group of row_group_size rows at a time.
+
+    The columns are typed from the model TypedDict when they are declared there. The others are written as strings,
+    nested values as json, since a type inferred from the first row group may not fit the next ones. Keys that are
+    not in fieldnames are left out.
+    """
+    writer = ArrowFileWriter(file_name, output_format)
+    column_types = _get_column_types(model)
+    string_columns = {
+        name for name in fieldnames if get_arrow_type(column_types.get(name)) is None
+    }
+    column_types = {**column_types, **dict.fromkeys(string_columns, str)}
+    columns = {name: [] for name in fieldnames}
+    appenders = [
+        (name, column.append, name in string_columns)
+        for name, column in columns.items()
+    ]
+    batch_size = 0
+    try:
+        for row in rows:
+            for name, append, to_string in appenders:
+                value = row.get(name)
+                append(_to_string(value) if to_string else value)
+            batch_size += 1
+            if batch_size == row_group_size:
+                writer.write_columns(columns, column_types)
+                for column in columns.values():
+                    column.clear()
+                batch_size = 0
+        if batch_size or writer.schema is None:
+            writer.write_columns(columns, column_types)
+    finally:
+        writer.close()
+
+
+def write_arrow_columns(
+    file_name: Path,
+    columns: dict[str, list],
+    output_format: ArrowFormat,
+    column_types: Optional[dict[str, type]] = None,
+) -> None:
+    """Writes a table held as one list per column; columns typed as dict hold objects, with empty ones as nulls."""
+    column_types = column_types or {}
+    columns = {
+        name: (
+            [value or None for value in values]
+            if column_types.get(name) is dict
+            else values
+        )
+        for name, values in columns.items()
+    }
+    writer = ArrowFileWriter(file_name, output_format)
+    try:
+        writer.write_columns(columns, column_types)
+    finally:
+        writer.close()
@@ -1,32 +1,127 @@
+import hashlib
 import tempfile
-from calcifer.utils.json_logger import logger
+from typing import Callable, Iterator, Optional
+from calcifer.utils.compact_record import CompactRecord, to_json
+from calcifer.utils.json_logger import get_logger
+from calcifer.utils.metrics import current_cache, metrics
 import os
 import json
 
+logger = get_logger(__name__)
+
+_file_cache_enabled = True
+
+# Streamed caches are written under this prefix and renamed once complete, so that they are never read half written
+PARTIAL_PREFIX = "partial_"
+
+
+def disable_file_cache() -> None:
+    """Makes every cache_to_file decorated function call through, e.g. when results are persisted elsewhere."""
+    global _file_cache_enabled
+    _file_cache_enabled = False
+
+
+def _read_stream(
+    file_path: str, record_type: Optional[type[CompactRecord]]
+) -> Iterator:
+    with open(file_path, "r") as f:
+        for line in f:
+            item = json.loads(line)
+            yield record_type.from_dict(item) if record_type else item
+
+
+def _write_stream(items: Iterator, cache_prefix: str, file_prefix: str) -> Iterator:
+    """Yields items while saving them as json lines; the cache file only gets its final name after the last one."""
+    with tempfile.NamedTemporaryFile(
+        mode="w", prefix=f"{PARTIAL_PREFIX}{cache_prefix}", delete=False
+    ) as f:
+        try:
+            while True:
+                # Only the calls of the decorated function are counted as cache misses, not the ones of the consumer
+                token = current_cache.set(f"miss:{file_prefix}")
+                try:
+                    item = next(items)
+                except StopIteration:
+                    break
+                finally:
+                    current_cache.reset(token)
+                f.write(json.dumps(item, default=to_json) + "\n")
+                yield item
+        except BaseException:
+            f.close()
+            os.remove(f.name)
+            raise
+    folder, name = os.path.split(f.name)
+    file_name = os.path.join(folder, name.removeprefix(PARTIAL_PREFIX))
+    logger.info(f"Saving cache to {file_name}")
+    os.replace(f.name, file_name)
+
+
+def cache_to_file(
+    file_prefix: str,
+    key: Optional[Callable[..., str]] = None,
+    record_type: Optional[type[CompactRecord]] = None,
+    stream: bool = False,
+):
+    """Caches the result of the decorated function in a temporary json file named after file_prefix.
+
+    If key is given, it is called with the same arguments as the decorated function and its result is hashed into
+    the file name, so that e.g. different orgs don't share the same cache. If record_type is given, the result is a
+    list of that CompactRecord type, and the cached items are read back as records too. If stream is set, the
+    decorated function is a generator, whose items are saved as json lines as they are consumed and read back one
+    at a time, so that neither holds them all in memory.
+    """
+    if stream:
+        # Json lines can't be read as the json of a non streamed cache with the same prefix, and the other way round
+        file_prefix = f"{file_prefix}_stream"
 
-def cache_to_file(file_prefix: str):
     def inner(func):
         def wrapper(*args, **kwargs):
+            if not _file_cache_enabled:
+                metrics.record_cache_lookup(file_prefix, "disabled")
+                return func(*args, **kwargs)
             tmp_folder = tempfile.gettempdir()
+            cache_prefix = file_prefix
+            if key:
+                key_hash = hashlib.sha1(
+                    key(*args, **kwargs).encode(), usedforsecurity=False
+                ).hexdigest()
+                cache_prefix = f"{file_prefix}_{key_hash[:12]}_"
             file_name = None
             for file in os.listdir(tmp_folder):
-                if file.startswith(file_prefix):
+                if file.startswith(cache_prefix):
                     file_name = file
                     break
 
             if file_name:
+                metrics.record_cache_lookup(file_prefix, "hit")
                 logger.info(f"Found cache, reading data from {tmp_folder}/{file_name}")
+                if stream:
+                    return _read_stream(
+                        os.path.join(tmp_folder, file_name), record_type
+                    )
                 with open(os.path.join(tmp_folder, file_name), "r") as f:
                     data = json.load(f)
+                if record_type:
+                    data = [record_type.from_dict(item) for item in data]
             else:
                 logger.info("No cache found, creating new one")
-                data = func(*args, **kwargs)
+                metrics.record_cache_lookup(file_prefix, "miss")
+                if stream:
+                    return _write_stream(
+                        iter(func(*args, **kwargs)), cache_prefix, file_prefix
+                    )
+                token = current_cache.set(f"miss:{file_prefix}")
+                try:
+                    data = func(*args, **kwargs)
+                finally:
+                    current_cache.reset(token)
 
                 with tempfile.NamedTemporaryFile(
-                    mode="w", prefix=file_prefix, delete=False
+                    mode="w", prefix=cache_prefix, delete=False
                 ) as f:
                     logger.info(f"Saving cache to {f.name}")
-                    json.dump(data, f)
+                    json.dump(data, f, default=to_json)
             return data
 
         return wrapper
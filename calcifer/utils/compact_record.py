@@ -0,0 +1,80 @@
+from collections.abc import Mapping
+from typing import Any, Iterator, is_typeddict
+
+
+def _trim(value: Any, typed_dict: type) -> Any:
+    if not isinstance(value, dict):
+        return value
+    return {
+        field: _trim(value.get(field), hint)
+        for field, hint in typed_dict.__annotations__.items()
+    }
+
+
+class CompactRecord(Mapping):
+    """Read-only mapping that keeps its fields in __slots__, a fraction of the memory of the dict it replaces.
+
+    Subclasses are made from a TypedDict by compact_record, and are read like it: record["name"], record.get(...)
+    and {**record} all work. Fields missing from the item they are built from are None.
+    """
+
+    __slots__ = ()
+    _fields: tuple[str, ...] = ()
+    _field_set: frozenset[str] = frozenset()
+    _nested: dict[str, type] = {}
+
+    def __init__(self, **values: Any) -> None:
+        for field in self._fields:
+            setattr(self, field, values.get(field))
+
+    @classmethod
+    def from_dict(cls, item: dict) -> "CompactRecord":
+        """Keeps only the fields of the record, and of the TypedDicts nested in it, e.g. of a full api item."""
+        record = cls.__new__(cls)
+        for field in cls._fields:
+            value = item.get(field)
+            if field in cls._nested:
+                value = _trim(value, cls._nested[field])
+            setattr(record, field, value)
+        return record
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._field_set:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._fields)
+
+    def __len__(self) -> int:
+        return len(self._fields)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self)!r})"
+
+
+def compact_record(typed_dict: type) -> type[CompactRecord]:
+    """Returns a CompactRecord type with the fields of typed_dict; nested TypedDicts are kept as trimmed dicts."""
+    fields = tuple(typed_dict.__annotations__)
+    return type(
+        f"{typed_dict.__name__}Record",
+        (CompactRecord,),
+        {
+            "__slots__": fields,
+            "__module__": typed_dict.__module__,
+            "_fields": fields,
+            "_field_set": frozenset(fields),
+            "_nested": {
+                field: hint
+                for field, hint in typed_dict.__annotations__.items()
+                if is_typeddict(hint)
+            },
+        },
+    )
+
+
+def to_json(value: Any) -> Any:
+    """json default for CompactRecords, that are written as the dicts they stand for."""
+    if isinstance(value, CompactRecord):
+        return dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
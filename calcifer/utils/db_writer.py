@@ -0,0 +1,242 @@
+import json
+import sqlite3
+from itertools import islice
+from pathlib import Path
+from typing import Any, Iterable, Literal, Optional, Sequence, get_type_hints
+from calcifer.utils.json_logger import get_logger
+
+logger = get_logger(__name__)
+
+try:
+    import duckdb
+except ImportError:  # duckdb is an optional dependency, see the duckdb extra
+    duckdb = None
+
+DbFormat = Literal["sqlite", "duckdb"]
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Columns that get their own index when a table has them, as trend queries filter on them
+TREND_COLUMNS = ("date", "created")
+
+SQL_TYPES = {
+    "sqlite": {bool: "INTEGER", int: "INTEGER", float: "REAL", str: "TEXT"},
+    "duckdb": {bool: "BOOLEAN", int: "BIGINT", float: "DOUBLE", str: "VARCHAR"},
+}
+
+# Null-safe inequality of each dialect
+DISTINCT_OPERATORS = {"sqlite": "IS NOT", "duckdb": "IS DISTINCT FROM"}
+
+
+class MissingDuckdbException(Exception):
+    pass
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _to_sql_value(value: Any) -> Any:
+    if isinstance(value, (dict, list, tuple)):
+        return json.dumps(value, default=str)
+    return value
+
+
+class DbTableWriter:
+    """Upserts rows in a sqlite or duckdb table by their natural key, so that repeated runs only change what moved.
+
+    The table, its unique index on key and an index on each of TREND_COLUMNS are created on the first write; columns
+    missing from an existing table are added. Rows are written in one transaction per batch, and existing rows are
+    only updated when one of their values changed. Objects and lists are stored as json.
+    """
+
+    def __init__(
+        self,
+        file_name: Path,
+        output_format: DbFormat,
+        table: str,
+        key: Sequence[str],
+        column_types: Optional[dict[str, type]] = None,
+    ) -> None:
+        if output_format == "duckdb" and duckdb is None:
+            raise MissingDuckdbException(
+                "duckdb output needs duckdb, install calcifer with the duckdb extra"
+            )
+        self.output_format = output_format
+        self.table = table
+        self.key = list(key)
+        self.column_types = column_types or {}
+        self.columns: list[str] = []
+        self.rows_written = 0
+        self.rows_changed = 0
+        self._connection = (
+            duckdb.connect(str(file_name))
+            if output_format == "duckdb"
+            else sqlite3.connect(file_name, isolation_level=None)
+        )
+
+    def _get_sql_type(self, column: str, sample: list[dict]) -> str:
+        sql_types = SQL_TYPES[self.output_format]
+        column_type = self.column_types.get(column)
+        if column_type not in sql_types:
+            values = [row.get(column) for row in sample]
+            column_type = next(
+                (type(value) for value in values if value is not None), str
+            )
+        return sql_types.get(column_type, sql_types[str])
+
+    def _get_table_columns(self) -> list[str]:
+        if self.output_format == "duckdb":
+            rows = self._connection.execute(
+                "SELECT column_name FROM information_schema.columns WHERE table_name = ? ORDER BY ordinal_position",
+                [self.table],
+            ).fetchall()
+        else:
+            rows = [
+                (column[1],)
+                for column in self._connection.execute(
+                    f"PRAGMA table_info({_quote(self.table)})"
+                ).fetchall()
+            ]
+        return [row[0] for row in rows]
+
+    def _create_table(self, columns: list[str], sample: list[dict]) -> None:
+        missing_key = [column for column in self.key if column not in columns]
+        if missing_key:
+            raise ValueError(f"Key columns {missing_key} are not in the rows")
+        table_columns = self._get_table_columns()
+        if not table_columns:
+            column_definitions = ", ".join(
+                f"{_quote(column)} {self._get_sql_type(column, sample)}"
+                for column in columns
+            )
+            self._connection.execute(
+                f"CREATE TABLE {_quote(self.table)} ({column_definitions})"
+            )
+            self._connection.execute(
+                f"CREATE UNIQUE INDEX {_quote(self.table + '_key')} ON {_quote(self.table)} "
+                f"({', '.join(_quote(column) for column in self.key)})"
+            )
+            for column in TREND_COLUMNS:
+                if column in columns and column not in self.key:
+                    self._connection.execute(
+                        f"CREATE INDEX {_quote(self.table + '_' + column)} ON {_quote(self.table)} ({_quote(column)})"
+                    )
+        else:
+            for column in columns:
+                if column not in table_columns:
+                    logger.info(f"Adding column {column} to table {self.table}")
+                    self._connection.execute(
+                        f"ALTER TABLE {_quote(self.table)} ADD COLUMN {_quote(column)} "
+                        f"{self._get_sql_type(column, sample)}"
+                    )
+        self.columns = columns
+
+    def _get_upsert_sql(self, rows_number: int = 1) -> str:
+        values = [column for column in self.columns if column not in self.key]
+        distinct = DISTINCT_OPERATORS[self.output_format]
+        row_placeholders = f"({', '.join('?' for _ in self.columns)})"
+        sql = (
+            f"INSERT INTO {_quote(self.table)} ({', '.join(_quote(column) for column in self.columns)}) "
+            f"VALUES {', '.join(row_placeholders for _ in range(rows_number))} "
+            f"ON CONFLICT ({', '.join(_quote(column) for column in self.key)}) "
+        )
+        if not values:
+            return sql + "DO NOTHING"
+        return (
+            sql
+            + f"DO UPDATE SET {', '.join(f'{_quote(c)} = excluded.{_quote(c)}' for c in values)} "
+            + f"WHERE {' OR '.join(f'{_quote(self.table)}.{_quote(c)} {distinct} excluded.{_quote(c)}' for c in values)}"
+        )
+
+    def _upsert(self, values: list[list]) -> int:
+        """Upserts the rows and returns how many of them were new or changed."""
+        if self.output_format == "sqlite":
+            changes_before = self._connection.total_changes
+            self._connection.executemany(self._get_upsert_sql(), values)
+            return self._connection.total_changes - changes_before
+        # duckdb runs executemany one statement per row, a multi-row insert is much faster; it returns the rows changed
+        return self._connection.execute(
+            self._get_upsert_sql(len(values)),
+            [value for row in values for value in row],
+        ).fetchone()[0]
+
+    def write_rows(self, rows: list[dict], columns: list[str]) -> None:
+        """Upserts a batch of rows in a single transaction; columns not seen before are added to the table first."""
+        if not rows:
+            return
+        if columns != self.columns:
+            self._create_table(columns, rows)
+        # The same key can't be upserted twice in a statement, the last row wins
+        rows_by_key = {
+            tuple(row.get(column) for column in self.key): row for row in rows
+        }
+        values = [
+            [_to_sql_value(row.get(column)) for column in self.columns]
+            for row in rows_by_key.values()
+        ]
+        self._connection.execute("BEGIN TRANSACTION")
+        try:
+            rows_changed = self._upsert(values)
+            self._connection.execute("COMMIT")
+        except Exception:
+            self._connection.execute("ROLLBACK")
+            raise
+        self.rows_written += len(values)
+        self.rows_changed += rows_changed
+
+    def close(self) -> None:
+        logger.info(
+            f"Upserted {self.rows_written} rows in {self.table}, {self.rows_changed} of them new or changed"
+        )
+        self._connection.close()
+
+
+def write_db_rows(
+    file_name: Path,
+    rows: Iterable[dict],
+    fieldnames: list[str],
+    output_format: DbFormat,
+    table: str,
+    key: Sequence[str],
+    model: Optional[type] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> None:
+    """Upserts rows in table by key, batch_size rows per transaction.
+
+    fieldnames can grow while rows are consumed (see write_to_file late columns), new columns are then added to the
+    table. Column types come from the model TypedDict when declared there, else from the first values.
+    """
+    writer = DbTableWriter(
+        file_name, output_format, table, key, get_type_hints(model) if model else {}
+    )
+    batch = []
+    try:
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batch_size:
+                writer.write_rows(batch, list(fieldnames))
+                batch = []
+        writer.write_rows(batch, list(fieldnames))
+    finally:
+        writer.close()
+
+
+def write_db_columns(
+    file_name: Path,
+    columns: dict[str, list],
+    output_format: DbFormat,
+    table: str,
+    key: Sequence[str],
+    column_types: Optional[dict[str, type]] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> None:
+    """Upserts a table held as one list per column in table by key, batch_size rows per transaction."""
+    writer = DbTableWriter(file_name, output_format, table, key, column_types)
+    names = list(columns)
+    rows = (dict(zip(names, values)) for values in zip(*columns.values()))
+    try:
+        while batch := list(islice(rows, batch_size)):
+            writer.write_rows(batch, names)
+    finally:
+        writer.close()
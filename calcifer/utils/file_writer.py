@@ -1,14 +1,232 @@
+import gzip
+import json
+import os
 from pathlib import Path
-from csv import DictWriter
-from calcifer.utils.json_logger import logger
+from csv import DictWriter, reader as csv_reader, writer as csv_writer
+from itertools import chain, islice
+from typing import IO, Iterable, Iterator, Literal, Optional, Sequence
+from calcifer.utils.json_logger import get_logger
+from calcifer.utils.tracing import traced
 
+logger = get_logger(__name__)
 
-def write_to_file(file_name: Path, data: list[dict]):
+# pyarrow and duckdb, which are slow to import, are only imported by the writers of their formats
+try:
+    import zstandard
+except ImportError:  # zstandard is an optional dependency, see the zstd extra
+    zstandard = None
+
+DEFAULT_SCHEMA_SAMPLE_SIZE = 100
+
+LateColumnsPolicy = Literal["extend", "drop", "error"]
+
+OUTPUT_FORMATS = (
+    "csv",
+    "parquet",
+    "arrow",
+    "ndjson",
+    "ndjson.gz",
+    "ndjson.zst",
+    "sqlite",
+    "duckdb",
+)
+OutputFormat = Literal[
+    "csv", "parquet", "arrow", "ndjson", "ndjson.gz", "ndjson.zst", "sqlite", "duckdb"
+]
+NDJSON_FORMATS = ("ndjson", "ndjson.gz", "ndjson.zst")
+DB_FORMATS = ("sqlite", "duckdb")
+
+
+class MissingZstandardException(Exception):
+    pass
+
+
+class LateColumnsException(Exception):
+    pass
+
+
+@traced(
+    "write_output",
+    attributes=lambda file_name, *args, output_format="csv", **kwargs: {
+        "file": str(file_name),
+        "format": output_format,
+    },
+)
+def write_to_file(
+    file_name: Path,
+    data: Iterable[dict],
+    columns: Optional[Sequence[str]] = None,
+    sample_size: int = DEFAULT_SCHEMA_SAMPLE_SIZE,
+    late_columns: LateColumnsPolicy = "extend",
+    output_format: OutputFormat = "csv",
+    model: Optional[type] = None,
+    table: Optional[str] = None,
+    key: Sequence[str] = (),
+):
+    """Writes rows to a csv, parquet, arrow or ndjson file, or a database, as they are yielded by data.
+
+    The header is made of the declared columns or else of all the keys found in the first sample_size rows, which
+    are the only ones held in memory. Keys that first appear after that are handled according to late_columns:
+    "extend" adds them at the end of the header, rewriting the file once at the end, "drop" leaves them out and
+    "error" raises a LateColumnsException. Parquet and arrow files can't be extended, so there they are dropped.
+    The model TypedDict, if any, gives the type of the parquet, arrow and database columns it declares. Ndjson has
+    no header at all, see write_ndjson_to_file. Sqlite and duckdb upsert the rows in table by their natural key, see
+    DbTableWriter; there late columns are added to the table.
+    """
+    if output_format in NDJSON_FORMATS:
+        write_ndjson_to_file(file_name, data, output_format)
+        return
     logger.info(f"Saving output to {file_name}")
+    rows = iter(data)
+    sample = [] if columns else list(islice(rows, sample_size))
+    fieldnames = list(columns or dict.fromkeys(key for row in sample for key in row))
+    if output_format in ("parquet", "arrow") and late_columns == "extend":
+        late_columns = "drop"
+    rows = _check_late_columns(chain(sample, rows), fieldnames, late_columns, file_name)
+    if output_format == "csv":
+        _write_csv_rows(Path(file_name), rows, fieldnames)
+    elif output_format in DB_FORMATS:
+        from calcifer.utils.db_writer import write_db_rows
+
+        write_db_rows(file_name, rows, fieldnames, output_format, table, key, model)
+    else:
+        from calcifer.utils.arrow_writer import write_arrow_rows
+
+        write_arrow_rows(file_name, rows, fieldnames, output_format, model)
+
+
+def _check_late_columns(
+    rows: Iterator[dict],
+    fieldnames: list[str],
+    late_columns: LateColumnsPolicy,
+    file_name: Path,
+) -> Iterator[dict]:
+    """Yields rows, applying late_columns to keys that are not in fieldnames; with extend they are added to it."""
+    known_columns = set(fieldnames)
+    for row in rows:
+        if not known_columns.issuperset(row):
+            new_columns = [key for key in row if key not in known_columns]
+            if late_columns == "error":
+                raise LateColumnsException(
+                    f"Columns {new_columns} are not in the header of {file_name}"
+                )
+            logger.warning(
+                f"Columns {new_columns} first appeared after the header of {file_name} was written, "
+                f"{'dropping' if late_columns == 'drop' else 'adding'} them"
+            )
+            known_columns.update(new_columns)
+            if late_columns == "extend":
+                fieldnames += new_columns
+        yield row
+
+
+def _write_csv_rows(file_name: Path, rows: Iterator[dict], fieldnames: list[str]):
+    header_length = len(fieldnames)
     with open(file_name, "w") as csvfile:
-        if len(data):
-            writer = DictWriter(csvfile, fieldnames=data[0].keys())
+        if not fieldnames:
+            return
+        # fieldnames is shared with _check_late_columns, that extends it as new columns show up
+        writer = DictWriter(csvfile, fieldnames=fieldnames, extrasaction="ignore")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+    if len(fieldnames) > header_length:
+        _rewrite_header(file_name, fieldnames)
+
+
+def _rewrite_header(file_name: Path, fieldnames: list[str]):
+    """Replaces the header of file_name with fieldnames, padding the rows written before the last columns appeared."""
+    tmp_file_name = file_name.with_name(f"{file_name.name}.tmp")
+    with open(file_name, "r", newline="") as csvfile, open(
+        tmp_file_name, "w", newline=""
+    ) as tmp_csvfile:
+        rows = csv_reader(csvfile)
+        next(rows)
+        rows_writer = csv_writer(tmp_csvfile)
+        rows_writer.writerow(fieldnames)
+        for row in rows:
+            rows_writer.writerow(row + [""] * (len(fieldnames) - len(row)))
+    os.replace(tmp_file_name, file_name)
+
+
+@traced(
+    "write_output",
+    attributes=lambda file_name, *args, output_format="csv", **kwargs: {
+        "file": str(file_name),
+        "format": output_format,
+    },
+)
+def write_columns_to_file(
+    file_name: Path,
+    columns: dict[str, list],
+    append=False,
+    output_format: OutputFormat = "csv",
+    column_types: Optional[dict[str, type]] = None,
+    table: Optional[str] = None,
+    key: Sequence[str] = (),
+):
+    """Writes a table held as one list per column; with append, the header is written only if the file is new.
+
+    Parquet and arrow files are typed from column_types and can't be appended to. Sqlite and duckdb always upsert in
+    table by key.
+    """
+    file_name = Path(file_name)
+    if output_format in DB_FORMATS:
+        if not append:
+            logger.info(f"Saving output to {file_name}")
+        from calcifer.utils.db_writer import write_db_columns
+
+        write_db_columns(file_name, columns, output_format, table, key, column_types)
+        return
+    if output_format != "csv":
+        logger.info(f"Saving output to {file_name}")
+        from calcifer.utils.arrow_writer import write_arrow_columns
+
+        write_arrow_columns(file_name, columns, output_format, column_types)
+        return
+    write_header = not append or not file_name.exists() or not file_name.stat().st_size
+    if not append:
+        logger.info(f"Saving output to {file_name}")
+    with open(file_name, "a" if append else "w", newline="") as csvfile:
+        rows_writer = csv_writer(csvfile)
+        if write_header:
+            rows_writer.writerow(columns.keys())
+        rows_writer.writerows(zip(*columns.values()))
+
+
+def _open_ndjson(file_name: Path, output_format: OutputFormat, append: bool) -> IO:
+    mode = "at" if append else "wt"
+    if output_format == "ndjson.gz":
+        return gzip.open(file_name, mode)
+    if output_format == "ndjson.zst":
+        if zstandard is None:
+            raise MissingZstandardException(
+                "ndjson.zst output needs zstandard, install calcifer with the zstd extra"
+            )
+        return zstandard.open(file_name, mode)
+    return open(file_name, mode)
+
+
+@traced(
+    "write_output",
+    attributes=lambda file_name, *args, output_format="csv", **kwargs: {
+        "file": str(file_name),
+        "format": output_format,
+    },
+)
+def write_ndjson_to_file(
+    file_name: Path,
+    data: Iterable[dict],
+    output_format: OutputFormat = "ndjson",
+    append=False,
+):
+    """Writes each record, nested fields included, as a json line, compressing them as they go for .gz and .zst.
 
-            writer.writeheader()
-            for d in data:
-                writer.writerow(d)
+    Appending adds a new gzip member or zstd frame, which readers decompress as a single stream.
+    """
+    if not append:
+        logger.info(f"Saving output to {file_name}")
+    with _open_ndjson(file_name, output_format, append) as ndjsonfile:
+        for record in data:
+            ndjsonfile.write(json.dumps(record, default=str))
+            ndjsonfile.write("\n")
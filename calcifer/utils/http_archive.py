@@ -0,0 +1,131 @@
+import gzip
+import json
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import IO, Literal, Optional, TypedDict
+import requests
+from requests.structures import CaseInsensitiveDict
+from calcifer.utils.json_logger import get_logger
+
+logger = get_logger(__name__)
+
+ArchiveMode = Literal["off", "record", "replay"]
+
+# Response headers worth keeping, the ones the pagers and the rate budget read
+RECORDED_HEADERS = (
+    "Content-Type",
+    "X-RateLimit-Limit",
+    "X-RateLimit-Remaining",
+    "X-RateLimit-Reset",
+    "Retry-After",
+)
+
+
+class MissingRecordingException(Exception):
+    pass
+
+
+class ArchivedExchange(TypedDict):
+    method: str
+    url: str
+    body: Optional[str]
+    status: int
+    headers: dict[str, str]
+    content: str
+    latency: float
+
+
+def _get_exchange_key(request: requests.PreparedRequest) -> tuple:
+    body = request.body.decode() if isinstance(request.body, bytes) else request.body
+    return (request.method, request.url, body)
+
+
+class HttpArchive:
+    """Records the HTTP exchanges of a run to a gzipped json lines file, or serves them back instead of the network.
+
+    Exchanges are matched on method, url (query string included) and body; a request made several times, e.g. a
+    retried one, gets its responses back in the order they were recorded, the last one repeating. Credentials are
+    never recorded, and only the RECORDED_HEADERS of the responses are.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.mode: ArchiveMode = "off"
+        self.latency_factor = 0.0
+        self._file: Optional[IO] = None
+        self._exchanges: dict[tuple, list[ArchivedExchange]] = {}
+        self._replayed: dict[tuple, int] = defaultdict(int)
+        self.recorded = 0
+
+    def start_recording(self, file_path: Path) -> None:
+        logger.info(f"Recording HTTP exchanges to {file_path}")
+        self._file = gzip.open(file_path, "wt")
+        self.recorded = 0
+        self.mode = "record"
+
+    def start_replay(self, file_path: Path, latency_factor: float = 0.0) -> None:
+        """Loads the exchanges of file_path; each is replayed after latency_factor times its recorded latency."""
+        exchanges = defaultdict(list)
+        with gzip.open(file_path, "rt") as f:
+            for line in f:
+                exchange = json.loads(line)
+                key = (exchange["method"], exchange["url"], exchange["body"])
+                exchanges[key].append(exchange)
+        logger.info(f"Replaying {len(exchanges)} HTTP exchanges from {file_path}")
+        self._exchanges = dict(exchanges)
+        self._replayed = defaultdict(int)
+        self.latency_factor = latency_factor
+        self.mode = "replay"
+
+    def record(self, response: requests.Response, latency: float) -> None:
+        method, url, body = _get_exchange_key(response.request)
+        exchange = ArchivedExchange(
+            method=method,
+            url=url,
+            body=body,
+            status=response.status_code,
+            headers={
+                name: response.headers[name]
+                for name in RECORDED_HEADERS
+                if name in response.headers
+            },
+            content=response.content.decode("utf-8", errors="replace"),
+            latency=latency,
+        )
+        line = json.dumps(exchange) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self.recorded += 1
+
+    def replay(self, request: requests.PreparedRequest) -> requests.Response:
+        key = _get_exchange_key(request)
+        with self._lock:
+            exchanges = self._exchanges.get(key)
+            if not exchanges:
+                raise MissingRecordingException(
+                    f"No recorded response for {request.method} {request.url}"
+                )
+            exchange = exchanges[min(self._replayed[key], len(exchanges) - 1)]
+            self._replayed[key] += 1
+        if self.latency_factor:
+            time.sleep(exchange["latency"] * self.latency_factor)
+        response = requests.Response()
+        response.status_code = exchange["status"]
+        response.headers = CaseInsensitiveDict(exchange["headers"])
+        response._content = exchange["content"].encode()
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self) -> None:
+        if self.mode == "record" and self._file:
+            logger.info(f"Recorded {self.recorded} HTTP exchanges")
+            self._file.close()
+            self._file = None
+        self.mode = "off"
+
+
+http_archive = HttpArchive()
@@ -0,0 +1,72 @@
+from pathlib import Path
+from typing import Optional
+from calcifer.utils.json_file import read_json_file, write_json_file
+from calcifer.utils.json_logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class JiraIssueStore:
+    """Persists, by issue key, the status changes seen so far with the issue last `updated` and last changelog id.
+
+    A store belongs to a single search (e.g. project and since): if the file was built for another one, it is ignored
+    and rebuilt from scratch.
+    """
+
+    def __init__(self, file_path: Path, search: str) -> None:
+        self.file_path = Path(file_path)
+        self.search = search
+        data = read_json_file(self.file_path, {})
+        if data and data.get("search") != search:
+            logger.warning(
+                f"Issue store {self.file_path} was built for {data.get('search')}, starting from scratch"
+            )
+            data = {}
+        self.issues: dict[str, dict] = data.get("issues", {})
+
+    def get_last_updated(self) -> Optional[str]:
+        if not self.issues:
+            return None
+        return max(issue["updated"] for issue in self.issues.values())
+
+    def get_change_log_totals(self) -> dict[str, int]:
+        return {key: issue["change_log_total"] for key, issue in self.issues.items()}
+
+    def get_new_histories(self, issue_key: str, histories: list[dict]) -> list[dict]:
+        # None until a history of the issue was seen, as history ids start at 0
+        last_change_log_id = self.issues.get(issue_key, {}).get("last_change_log_id")
+        if last_change_log_id is None:
+            return histories
+        return [
+            history for history in histories if int(history["id"]) > last_change_log_id
+        ]
+
+    def update_issue(
+        self,
+        issue_key: str,
+        updated: str,
+        change_log_total: int,
+        new_histories: list[dict],
+        new_change_logs: list[dict],
+    ) -> None:
+        issue = self.issues.setdefault(
+            issue_key, {"last_change_log_id": None, "change_logs": []}
+        )
+        issue["updated"] = updated
+        issue["change_log_total"] = change_log_total
+        if new_histories:
+            issue["last_change_log_id"] = max(
+                int(history["id"]) for history in new_histories
+            )
+        issue["change_logs"] += new_change_logs
+
+    def get_change_logs(self) -> list[dict]:
+        return [
+            change_log
+            for issue in self.issues.values()
+            for change_log in issue["change_logs"]
+        ]
+
+    def save(self) -> None:
+        logger.info(f"Saving {len(self.issues)} issues to {self.file_path}")
+        write_json_file(self.file_path, {"search": self.search, "issues": self.issues})
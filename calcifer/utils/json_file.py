@@ -0,0 +1,21 @@
+import json
+import os
+from pathlib import Path
+from typing import Any
+from calcifer.utils.compact_record import to_json
+
+
+def read_json_file(file_path: Path, default: Any) -> Any:
+    if not Path(file_path).exists():
+        return default
+    with open(file_path, "r") as f:
+        return json.load(f)
+
+
+def write_json_file(file_path: Path, data: Any) -> None:
+    """Writes data to a temporary file first, so that an interrupted run never leaves a truncated file behind."""
+    file_path = Path(file_path)
+    tmp_file_path = file_path.with_name(f"{file_path.name}.tmp")
+    with open(tmp_file_path, "w") as f:
+        json.dump(data, f, default=to_json)
+    os.replace(tmp_file_path, file_path)
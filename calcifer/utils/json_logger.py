@@ -1,26 +1,157 @@
+import atexit
 import logging
-from datetime import datetime
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Iterable, Optional, TypedDict
 from pythonjsonlogger import jsonlogger
 
+# Debug records from a single call site beyond DEFAULT_MAX_REPEATS every REPEAT_INTERVAL seconds are dropped, and
+# counted in the "suppressed" field of the next record written from there
+DEFAULT_MAX_REPEATS = 20
+REPEAT_INTERVAL = 10.0
+
 
 class DateTimeJsonFormatter(jsonlogger.JsonFormatter):
+    """Formats the timestamp from the record creation time, the date and time part only once per second."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._second = None
+        self._second_str = ""
+
+    def _format_timestamp(self, created: float) -> str:
+        second = int(created)
+        if second != self._second:
+            self._second_str = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+            self._second = second
+        return f"{self._second_str}.{int((created - second) * 1_000_000):06d}Z"
+
     def add_fields(self, log_record, record, message_dict):
         super(DateTimeJsonFormatter, self).add_fields(log_record, record, message_dict)
         if not log_record.get("timestamp"):
-            now = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%fZ")
-            log_record["timestamp"] = now
+            log_record["timestamp"] = self._format_timestamp(record.created)
         if log_record.get("level"):
             log_record["level"] = log_record["level"].upper()
         else:
             log_record["level"] = record.levelname
 
 
+class CallSiteWindow(TypedDict):
+    started_at: float
+    written: int
+    suppressed: int
+
+
+class RepeatFilter(logging.Filter):
+    """Samples and rate limits the debug records of each call site, e.g. the ones logged for every request.
+
+    One debug record every 1 / sample_rate from each call site is kept. Records of higher levels are never dropped.
+    """
+
+    def __init__(
+        self, max_repeats: int = DEFAULT_MAX_REPEATS, sample_rate: float = 1.0
+    ) -> None:
+        super().__init__()
+        self._lock = threading.Lock()
+        self.max_repeats = max_repeats
+        self.sample_rate = sample_rate
+        self._windows: dict[tuple[str, int], CallSiteWindow] = {}
+        self._debug_seen: dict[tuple[str, int], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        call_site = (record.pathname, record.lineno)
+        with self._lock:
+            if record.levelno <= logging.DEBUG and self.sample_rate < 1:
+                seen = self._debug_seen.get(call_site, 0)
+                self._debug_seen[call_site] = seen + 1
+                if seen % round(1 / self.sample_rate):
+                    return False
+            if not self.max_repeats or record.levelno > logging.DEBUG:
+                return True
+            window = self._windows.get(call_site)
+            if (
+                window is None
+                or record.created - window["started_at"] >= REPEAT_INTERVAL
+            ):
+                suppressed = window["suppressed"] if window else 0
+                window = CallSiteWindow(
+                    started_at=record.created, written=0, suppressed=0
+                )
+                self._windows[call_site] = window
+            else:
+                suppressed = 0
+            if window["written"] >= self.max_repeats:
+                window["suppressed"] += 1
+                return False
+            window["written"] += 1
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+    def log_suppressed(self) -> None:
+        """Logs how many records each call site had suppressed in its last window."""
+        with self._lock:
+            suppressed = {
+                call_site: window["suppressed"]
+                for call_site, window in self._windows.items()
+            }
+            self._windows = {}
+        for (pathname, lineno), count in suppressed.items():
+            if count:
+                logger.warning(
+                    f"Suppressed {count} repeated messages from {pathname}:{lineno}"
+                )
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Returns the logger of a module, whose level can be set on its own with configure_logging."""
+    return logging.getLogger(name)
+
+
+def parse_log_levels(log_levels: Iterable[str]) -> dict[Optional[str], int]:
+    """Parses levels like "info" for the root logger or "calcifer.services.rest_pager=debug" for a module."""
+    levels = {}
+    for log_level in log_levels:
+        name, _, level = log_level.rpartition("=")
+        level_number = logging.getLevelName(level.upper())
+        if not isinstance(level_number, int):
+            raise ValueError(f"Unknown log level {level} in {log_level}")
+        levels[name or None] = level_number
+    return levels
+
+
+def configure_logging(
+    log_levels: Iterable[str] = (),
+    sample_rate: float = 1.0,
+    max_repeats: int = DEFAULT_MAX_REPEATS,
+) -> None:
+    for name, level in parse_log_levels(log_levels).items():
+        logging.getLogger(name).setLevel(level)
+    repeat_filter.sample_rate = sample_rate
+    repeat_filter.max_repeats = max_repeats
+
+
+def __stop_logging() -> None:
+    repeat_filter.log_suppressed()
+    # Waits for the writer thread to write every queued record
+    log_listener.stop()
+
+
 logger = logging.getLogger()
 
+# Records are only queued by the threads logging them, a single writer thread formats and writes them to stderr
+log_queue = queue.SimpleQueue()
 logHandler = logging.StreamHandler()
-formatter = jsonlogger.JsonFormatter()
 logHandler.setFormatter(
     DateTimeJsonFormatter("%(timestamp)s %(level)s %(name)s %(message)s")
 )
-logger.addHandler(logHandler)
+log_listener = QueueListener(log_queue, logHandler)
+repeat_filter = RepeatFilter()
+queue_handler = QueueHandler(log_queue)
+queue_handler.addFilter(repeat_filter)
+logger.addHandler(queue_handler)
 logger.setLevel(logging.INFO)
+log_listener.start()
+atexit.register(__stop_logging)
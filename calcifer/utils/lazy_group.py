@@ -0,0 +1,59 @@
+import importlib
+from typing import Optional
+import click
+from click.shell_completion import CompletionItem
+from click.utils import make_default_short_help
+
+
+class LazyGroup(click.Group):
+    """Click group that imports the module of a command only when the command is looked up, to run it or show its help.
+
+    lazy_commands maps each command name to the "module:function" it is defined in and its short help, which is what
+    the group help and shell completion list, so that neither imports any command module.
+    """
+
+    def __init__(
+        self,
+        *args,
+        lazy_commands: Optional[dict[str, tuple[str, str]]] = None,
+        **kwargs
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands or {}
+
+    def list_commands(self, ctx: click.Context) -> list[str]:
+        return sorted({*super().list_commands(ctx), *self.lazy_commands})
+
+    def get_command(self, ctx: click.Context, cmd_name: str) -> Optional[click.Command]:
+        if cmd_name not in self.commands and cmd_name in self.lazy_commands:
+            module_name, function_name = self.lazy_commands[cmd_name][0].split(":")
+            command = getattr(importlib.import_module(module_name), function_name)
+            self.add_command(command, cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+    def _get_short_help(self, cmd_name: str, limit: int = 45) -> str:
+        if cmd_name in self.commands:
+            return self.commands[cmd_name].get_short_help_str(limit)
+        return make_default_short_help(self.lazy_commands[cmd_name][1], limit)
+
+    def format_commands(
+        self, ctx: click.Context, formatter: click.HelpFormatter
+    ) -> None:
+        names = self.list_commands(ctx)
+        if not names:
+            return
+        # Same room for the help as click.Group.format_commands
+        limit = formatter.width - 6 - max(len(name) for name in names)
+        with formatter.section("Commands"):
+            formatter.write_dl(
+                [(name, self._get_short_help(name, limit)) for name in names]
+            )
+
+    def shell_complete(
+        self, ctx: click.Context, incomplete: str
+    ) -> list[CompletionItem]:
+        return [
+            CompletionItem(name, help=self._get_short_help(name))
+            for name in self.list_commands(ctx)
+            if name.startswith(incomplete)
+        ] + click.Command.shell_complete(self, ctx, incomplete)
@@ -0,0 +1,191 @@
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from pathlib import Path
+from typing import TypedDict
+from urllib.parse import urlparse
+from calcifer.utils.json_logger import get_logger
+
+logger = get_logger(__name__)
+
+# Path segments followed by identifiers, and the placeholders that replace them in endpoint templates
+ENDPOINT_PARAMETERS = {
+    "repos": ("{owner}", "{repo}"),
+    "orgs": ("{org}",),
+    "users": ("{user}",),
+    "branches": ("{branch}",),
+    "commits": ("{sha}",),
+    "issue": ("{issue_key}",),
+    "logs": ("{log_id}",),
+}
+
+PERCENTILES = (50, 90, 99)
+
+# Cache the requests made in this context are filling, see cache_to_file
+current_cache: ContextVar[str] = ContextVar("current_cache", default="none")
+
+
+class EndpointMetrics(TypedDict):
+    endpoint: str
+    requests: int
+    errors: int
+    retries: int
+    bytes: int
+    total_latency: float
+    latency_p50: float
+    latency_p90: float
+    latency_p99: float
+    statuses: dict[str, int]
+    caches: dict[str, int]
+
+
+def get_endpoint_template(url: str) -> str:
+    """Replaces the identifiers in the path of url with placeholders, e.g. /repos/{owner}/{repo}/commits."""
+    segments = [segment for segment in urlparse(url).path.split("/") if segment]
+    template = []
+    i = 0
+    while i < len(segments):
+        template.append(segments[i])
+        placeholders = ENDPOINT_PARAMETERS.get(segments[i], ())
+        for placeholder in placeholders:
+            if i + 1 >= len(segments):
+                break
+            i += 1
+            template.append(placeholder)
+        i += 1
+    return "/" + "/".join(template)
+
+
+def _percentile(sorted_values: list[float], percentile: int) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(math.ceil(percentile / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[index]
+
+
+class MetricsRecorder:
+    """Collects the metrics of every HTTP request and cache lookup of a run, from any thread."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # Whether pagers spend an extra unprojected request to measure the bytes saved by field projection
+        self.measure_projection = False
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started_at = time.perf_counter()
+            self._latencies: dict[tuple[str, str], list[float]] = defaultdict(list)
+            self._counters: dict[tuple[str, str], dict] = defaultdict(
+                lambda: {
+                    "errors": 0,
+                    "retries": 0,
+                    "bytes": 0,
+                    "statuses": defaultdict(int),
+                    "caches": defaultdict(int),
+                }
+            )
+            self.cache_lookups: dict[str, dict[str, int]] = defaultdict(
+                lambda: defaultdict(int)
+            )
+            self.projection_saved_bytes = 0
+
+    def record_request(
+        self,
+        method: str,
+        url: str,
+        status: int,
+        latency: float,
+        response_bytes: int,
+        retries: int,
+    ) -> None:
+        endpoint = (method, get_endpoint_template(url))
+        with self._lock:
+            self._latencies[endpoint].append(latency)
+            counters = self._counters[endpoint]
+            counters["retries"] += retries
+            counters["bytes"] += response_bytes
+            counters["statuses"][str(status)] += 1
+            counters["caches"][current_cache.get()] += 1
+            if status >= 400:
+                counters["errors"] += 1
+
+    def record_cache_lookup(self, file_prefix: str, outcome: str) -> None:
+        with self._lock:
+            self.cache_lookups[file_prefix][outcome] += 1
+
+    def record_projection_savings(self, saved_bytes: float) -> None:
+        with self._lock:
+            self.projection_saved_bytes += int(saved_bytes)
+
+    def get_endpoint_metrics(self) -> list[EndpointMetrics]:
+        """Returns the metrics of every endpoint, the ones that took the most time first."""
+        endpoints = []
+        with self._lock:
+            for (method, endpoint), latencies in self._latencies.items():
+                counters = self._counters[(method, endpoint)]
+                sorted_latencies = sorted(latencies)
+                endpoints.append(
+                    EndpointMetrics(
+                        endpoint=f"{method} {endpoint}",
+                        requests=len(latencies),
+                        errors=counters["errors"],
+                        retries=counters["retries"],
+                        bytes=counters["bytes"],
+                        total_latency=sum(latencies),
+                        **{
+                            f"latency_p{p}": _percentile(sorted_latencies, p)
+                            for p in PERCENTILES
+                        },
+                        statuses=dict(counters["statuses"]),
+                        caches=dict(counters["caches"]),
+                    )
+                )
+        return sorted(endpoints, key=lambda e: e["total_latency"], reverse=True)
+
+    def get_summary(self) -> dict:
+        endpoints = self.get_endpoint_metrics()
+        elapsed = time.perf_counter() - self.started_at
+        requests = sum(e["requests"] for e in endpoints)
+        received_bytes = sum(e["bytes"] for e in endpoints)
+        return {
+            "elapsed": elapsed,
+            "requests": requests,
+            "errors": sum(e["errors"] for e in endpoints),
+            "retries": sum(e["retries"] for e in endpoints),
+            "bytes": received_bytes,
+            "requests_per_second": requests / elapsed if elapsed else 0,
+            "bytes_per_second": received_bytes / elapsed if elapsed else 0,
+            "projection_saved_bytes": self.projection_saved_bytes,
+            "cache_lookups": {
+                prefix: dict(outcomes)
+                for prefix, outcomes in self.cache_lookups.items()
+            },
+            "endpoints": endpoints,
+        }
+
+    def log_summary(self, top_endpoints: int = 5) -> None:
+        summary = self.get_summary()
+        if not summary["requests"] and not summary["cache_lookups"]:
+            return
+        logger.info(
+            f"Run took {summary['elapsed']:.1f}s for {summary['requests']} requests "
+            f"({summary['requests_per_second']:.1f}/s, {summary['bytes']} bytes, {summary['errors']} errors, "
+            f"{summary['retries']} retries)"
+        )
+        for endpoint in summary["endpoints"][:top_endpoints]:
+            logger.info(
+                f"{endpoint['endpoint']}: {endpoint['requests']} requests in {endpoint['total_latency']:.1f}s, "
+                f"p50 {endpoint['latency_p50'] * 1000:.0f}ms p99 {endpoint['latency_p99'] * 1000:.0f}ms"
+            )
+
+    def write(self, file_path: Path) -> None:
+        logger.info(f"Saving metrics to {file_path}")
+        with open(file_path, "w") as f:
+            json.dump(self.get_summary(), f, indent=2)
+
+
+metrics = MetricsRecorder()
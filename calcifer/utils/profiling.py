@@ -0,0 +1,135 @@
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Literal, Optional
+from calcifer.utils.json_logger import get_logger
+from calcifer.utils.metrics import metrics
+
+logger = get_logger(__name__)
+
+ProfileMode = Literal["cpu", "wall", "memory"]
+
+TOP_ENTRIES = 30
+TRACEBACK_FRAMES = 10
+# How often the memory profiler checks whether the traced memory reached a new peak
+MEMORY_POLL_INTERVAL = 0.2
+# From python 3.12 cProfile is built on sys.monitoring, so a single profile sees every thread
+PROFILES_ALL_THREADS = sys.version_info >= (3, 12)
+
+
+class Profiler:
+    """Profiles a run, worker threads included, and reports where its time or memory went.
+
+    cpu and wall run cProfile in every thread, timing functions by thread CPU time or by wall time (network waits
+    included); memory traces allocations with tracemalloc and keeps a snapshot of the highest peak it sees. Every
+    report starts with the split of the run between CPU and network time, the latter from the request metrics.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.mode: Optional[ProfileMode] = None
+        self._profiles: list[cProfile.Profile] = []
+        self._peak_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._stop_polling = threading.Event()
+
+    def start(self, mode: ProfileMode) -> None:
+        self.mode = mode
+        self._profiles = []
+        self._started_at = time.perf_counter()
+        self._cpu_started_at = time.process_time()
+        if mode == "memory":
+            tracemalloc.start(TRACEBACK_FRAMES)
+            self._stop_polling.clear()
+            threading.Thread(target=self._poll_peak_memory, daemon=True).start()
+        else:
+            self.profile_thread()
+
+    def profile_thread(self) -> None:
+        """Profiles the calling thread from now on, if profiling cpu or wall time; worker pools call it in each thread."""
+        if self.mode not in ("cpu", "wall") or (
+            PROFILES_ALL_THREADS and self._profiles
+        ):
+            return
+        if self.mode == "cpu":
+            # A profile shared by all threads can't use their own CPU clocks
+            profile = cProfile.Profile(
+                time.process_time if PROFILES_ALL_THREADS else time.thread_time
+            )
+        else:
+            profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+
+    def _poll_peak_memory(self) -> None:
+        snapshot_size = 0
+        while not self._stop_polling.wait(MEMORY_POLL_INTERVAL):
+            current, _ = tracemalloc.get_traced_memory()
+            if current > snapshot_size * 1.1:
+                self._peak_snapshot = tracemalloc.take_snapshot()
+                snapshot_size = current
+
+    def _get_time_split(self, command: str) -> str:
+        wall = time.perf_counter() - self._started_at
+        cpu = time.process_time() - self._cpu_started_at
+        summary = metrics.get_summary()
+        network = sum(endpoint["total_latency"] for endpoint in summary["endpoints"])
+        return (
+            f"Profile ({self.mode}) of {command}\n"
+            f"wall {wall:.2f}s, cpu {cpu:.2f}s ({cpu / wall if wall else 0:.0%} of wall, all threads)\n"
+            f"network {network:.2f}s over {summary['requests']} requests, "
+            f"{network / wall if wall else 0:.1f} requests in flight on average\n"
+        )
+
+    def _get_function_report(self, stats_file: Optional[Path]) -> str:
+        # The profile of this thread is the only one still enabled, it has to stop before the others are merged
+        self._profiles[0].disable()
+        stream = io.StringIO()
+        stats = pstats.Stats(*self._profiles, stream=stream)
+        if stats_file:
+            stats.dump_stats(stats_file)
+        stream.write(f"\nTop {TOP_ENTRIES} functions by own time\n")
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(TOP_ENTRIES)
+        stream.write(f"\nTop {TOP_ENTRIES} functions by cumulative time\n")
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_ENTRIES)
+        return stream.getvalue()
+
+    def _get_memory_report(self) -> str:
+        self._stop_polling.set()
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = self._peak_snapshot or tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        lines = [
+            f"\npeak {peak / 2**20:.1f}MB, {current / 2**20:.1f}MB still allocated at the end",
+            f"Top {TOP_ENTRIES} allocation sites at the highest peak seen",
+        ]
+        for statistic in snapshot.statistics("lineno")[:TOP_ENTRIES]:
+            frame = statistic.traceback[0]
+            lines.append(
+                f"{statistic.size / 2**20:>8.2f}MB {statistic.count:>9} blocks  {frame.filename}:{frame.lineno}"
+            )
+        return "\n".join(lines) + "\n"
+
+    def stop(self, command: str, file_path: Optional[Path] = None) -> None:
+        """Writes the report to file_path, and the cProfile stats next to it as .pstats, or prints it."""
+        report = self._get_time_split(command)
+        if self.mode == "memory":
+            report += self._get_memory_report()
+        else:
+            stats_file = Path(file_path).with_suffix(".pstats") if file_path else None
+            report += self._get_function_report(stats_file)
+        self.mode = None
+        if file_path:
+            logger.info(f"Saving {command} profile to {file_path}")
+            with open(file_path, "w") as f:
+                f.write(report)
+        else:
+            print(report)
+
+
+profiler = Profiler()
@@ -0,0 +1,67 @@
+import os
+import sqlite3
+import tempfile
+from itertools import islice
+from typing import Any, Iterable, Iterator, Mapping, Sequence
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Size of the sqlite page cache; sorts and groupings that don't fit in it spill to temporary files
+CACHE_SIZE_KB = 16 * 1024
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SpillTable:
+    """Temporary on-disk sqlite table to group and sort rows with SQL in bounded memory, whatever their number.
+
+    Rows are inserted in batches as they are iterated and query results are streamed back, so that only a batch and
+    the page cache are held in memory. The table is called spill, and its file is deleted on close.
+    """
+
+    def __init__(
+        self, columns: Sequence[str], batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> None:
+        self.columns = list(columns)
+        self.batch_size = batch_size
+        self.rows = 0
+        self._dir = tempfile.TemporaryDirectory(prefix="calcifer_spill_")
+        self.connection = sqlite3.connect(os.path.join(self._dir.name, "spill.db"))
+        # Nothing has to survive a crash, so there is no journal and no fsync
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.execute("PRAGMA temp_store = FILE")
+        self.connection.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+        self.connection.execute(
+            f"CREATE TABLE spill ({', '.join(_quote(column) for column in self.columns)})"
+        )
+
+    def extend(self, rows: Iterable[Mapping]) -> None:
+        insert = f"INSERT INTO spill VALUES ({', '.join('?' * len(self.columns))})"
+        rows = iter(rows)
+        while batch := [
+            tuple(row.get(column) for column in self.columns)
+            for row in islice(rows, self.batch_size)
+        ]:
+            with self.connection:
+                self.connection.executemany(insert, batch)
+            self.rows += len(batch)
+
+    def query(self, sql: str, parameters: Sequence[Any] = ()) -> Iterator[dict]:
+        cursor = self.connection.execute(sql, parameters)
+        names = [description[0] for description in cursor.description]
+        while batch := cursor.fetchmany(self.batch_size):
+            for values in batch:
+                yield dict(zip(names, values))
+
+    def close(self) -> None:
+        self.connection.close()
+        self._dir.cleanup()
+
+    def __enter__(self) -> "SpillTable":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
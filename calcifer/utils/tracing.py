@@ -0,0 +1,188 @@
+import functools
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Iterator, Literal, Optional
+from calcifer.utils.json_logger import get_logger
+
+logger = get_logger(__name__)
+
+TraceFormat = Literal["json", "otlp"]
+
+SERVICE_NAME = "calcifer"
+
+
+class Span:
+    def __init__(
+        self, name: str, trace_id: str, parent: Optional["Span"], attributes: dict
+    ) -> None:
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.thread_id = threading.get_ident()
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+
+# Span the code running in this context is part of; map_concurrently carries it over to its worker threads
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """Keeps the spans of a run once it's enabled, which is what makes span() do anything at all."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.enabled = False
+        self.trace_id = secrets.token_hex(16)
+        self.spans: list[Span] = []
+
+    def enable(self) -> None:
+        self.enabled = True
+        self.trace_id = secrets.token_hex(16)
+        self.spans = []
+
+    def start_span(self, name: str, **attributes: Any) -> Optional[Span]:
+        if not self.enabled:
+            return None
+        return Span(name, self.trace_id, current_span.get(), attributes)
+
+    def end_span(self, span: Optional[Span]) -> None:
+        if span is None:
+            return
+        span.end_ns = time.time_ns()
+        with self._lock:
+            self.spans.append(span)
+
+    def _to_otlp(self) -> dict:
+        def to_otlp_value(value: Any) -> dict:
+            if isinstance(value, bool):
+                return {"boolValue": value}
+            if isinstance(value, int):
+                return {"intValue": str(value)}
+            if isinstance(value, float):
+                return {"doubleValue": value}
+            return {"stringValue": str(value)}
+
+        spans = []
+        for span in self.spans:
+            otlp_span = {
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 3 if span.name.startswith("HTTP ") else 1,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": [
+                    {"key": key, "value": to_otlp_value(value)}
+                    for key, value in {
+                        **span.attributes,
+                        "thread.id": span.thread_id,
+                    }.items()
+                ],
+                "status": (
+                    {"code": 2, "message": span.error} if span.error else {"code": 1}
+                ),
+            }
+            if span.parent_span_id:
+                otlp_span["parentSpanId"] = span.parent_span_id
+            spans.append(otlp_span)
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": SERVICE_NAME},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": spans}],
+                }
+            ]
+        }
+
+    def _to_trace_events(self) -> dict:
+        """Chrome trace event format, one lane per thread, that chrome://tracing and Perfetto open."""
+        return {
+            "traceEvents": [
+                {
+                    "name": span.name,
+                    "ph": "X",
+                    "ts": span.start_ns / 1000,
+                    "dur": (span.end_ns - span.start_ns) / 1000,
+                    "pid": os.getpid(),
+                    "tid": span.thread_id,
+                    "args": {
+                        **span.attributes,
+                        "span_id": span.span_id,
+                        "parent_span_id": span.parent_span_id,
+                        **({"error": span.error} if span.error else {}),
+                    },
+                }
+                for span in self.spans
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def write(self, file_path: Path, trace_format: TraceFormat = "otlp") -> None:
+        logger.info(f"Saving {len(self.spans)} spans to {file_path}")
+        with self._lock:
+            data = (
+                self._to_otlp() if trace_format == "otlp" else self._to_trace_events()
+            )
+        with open(file_path, "w") as f:
+            json.dump(data, f, default=str)
+
+
+tracer = Tracer()
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Times the enclosed block as a child of the current span, marking it as failed if it raises."""
+    if not tracer.enabled:
+        yield None
+        return
+    new_span = tracer.start_span(name, **attributes)
+    token = current_span.set(new_span)
+    try:
+        yield new_span
+    except BaseException as e:
+        new_span.error = repr(e)
+        raise
+    finally:
+        current_span.reset(token)
+        tracer.end_span(new_span)
+
+
+def traced(name: str, attributes: Optional[Callable[..., dict]] = None):
+    """Runs the decorated function in a span named name.
+
+    If attributes is given, it is called with the same arguments as the decorated function and returns the span
+    attributes, e.g. the repo or issue key the call is about.
+    """
+
+    def inner(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with span(name, **(attributes(*args, **kwargs) if attributes else {})):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return inner
@@ -0,0 +1,53 @@
+import threading
+from pathlib import Path
+from typing import Any, Callable
+from calcifer.models.github import Repo
+from calcifer.utils.json_file import read_json_file, write_json_file
+from calcifer.utils.json_logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class RepoWatermarkStore:
+    """Persists per-repo results together with the pushed_at/updated_at watermark they were computed at.
+
+    Results are grouped by section (one per kind of per-repo fetch, e.g. contributors or protections) so that each
+    section is refreshed independently: a repo is dirty for a section until that section has been fetched again
+    after the repo last moved.
+    """
+
+    def __init__(self, file_path: Path) -> None:
+        self.file_path = Path(file_path)
+        self._lock = threading.Lock()
+        self.refreshed = 0
+        self.reused = 0
+        self.sections: dict[str, dict[str, dict]] = read_json_file(self.file_path, {})
+
+    @staticmethod
+    def get_watermark(repo: Repo) -> list[str]:
+        return [repo.get("pushed_at"), repo.get("updated_at")]
+
+    def get_or_fetch(self, section: str, repo: Repo, fetch: Callable[[], Any]) -> Any:
+        """Returns the stored result for repo if it hasn't moved since it was stored, else calls fetch and stores it."""
+        watermark = self.get_watermark(repo)
+        with self._lock:
+            stored = self.sections.get(section, {}).get(repo["full_name"])
+            if stored and stored["watermark"] == watermark:
+                self.reused += 1
+                return stored["result"]
+        result = fetch()
+        with self._lock:
+            self.refreshed += 1
+            self.sections.setdefault(section, {})[repo["full_name"]] = {
+                "watermark": watermark,
+                "result": result,
+            }
+        return result
+
+    def save(self) -> None:
+        logger.info(
+            f"Refreshed {self.refreshed} and reused {self.reused} per-repo results, "
+            f"saving watermarks to {self.file_path}"
+        )
+        with self._lock:
+            write_json_file(self.file_path, self.sections)
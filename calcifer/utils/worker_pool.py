@@ -0,0 +1,33 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import copy_context
+from typing import Callable, Iterable, Iterator, TypeVar
+from tqdm import tqdm
+from calcifer.utils.profiling import profiler
+
+DEFAULT_MAX_WORKERS = 8
+
+Item = TypeVar("Item")
+Result = TypeVar("Result")
+
+
+def map_concurrently(
+    func: Callable[[Item], Result],
+    items: Iterable[Item],
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    show_progress: bool = True,
+) -> Iterator[tuple[Item, Result]]:
+    """Runs func on every item in a thread pool and yields (item, result) pairs as soon as each one completes.
+
+    Each call runs in a copy of the caller context, so that context variables (e.g. the current cache) carry over.
+    """
+    items = list(items)
+    with ThreadPoolExecutor(
+        max_workers=max_workers, initializer=profiler.profile_thread
+    ) as executor:
+        futures = {
+            executor.submit(copy_context().run, func, item): item for item in items
+        }
+        for future in tqdm(
+            as_completed(futures), total=len(futures), disable=not show_progress
+        ):
+            yield futures[future], future.result()
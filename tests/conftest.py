@@ -0,0 +1,12 @@
+import tempfile
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def file_cache_dir(tmp_path, monkeypatch):
+    """Keeps the cache_to_file caches of every test in its own temporary directory."""
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(cache_dir))
+    return cache_dir
@@ -0,0 +1,59 @@
+from typing import TypedDict
+
+import pytest
+
+from calcifer.utils.file_writer import write_to_file
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+ROW_GROUP_SIZE = 64 * 1024
+
+
+class Row(TypedDict):
+    id: int
+    name: str
+
+
+@pytest.mark.parametrize(
+    "first_value, late_value",
+    [(None, 5), (1, "x"), (None, {"nested": True})],
+)
+@pytest.mark.parametrize("output_format", ["parquet", "arrow"])
+def test_undeclared_columns_change_type_after_the_first_row_group(
+    tmp_path, output_format, first_value, late_value
+):
+    file_name = tmp_path / f"out.{output_format}"
+    rows = [{"id": i, "value": first_value} for i in range(ROW_GROUP_SIZE)]
+    rows.append({"id": ROW_GROUP_SIZE, "value": late_value})
+
+    write_to_file(file_name, rows, output_format=output_format)
+
+    if output_format == "parquet":
+        table = pq.read_table(file_name)
+    else:
+        table = pa.ipc.open_file(str(file_name)).read_all()
+    assert table.schema.field("value").type == pa.string()
+    assert table.num_rows == ROW_GROUP_SIZE + 1
+    values = table.column("value").to_pylist()
+    assert values[-1] == (
+        '{"nested": true}' if isinstance(late_value, dict) else str(late_value)
+    )
+    assert values[0] == (None if first_value is None else str(first_value))
+
+
+def test_model_columns_keep_their_type(tmp_path):
+    file_name = tmp_path / "out.parquet"
+    write_to_file(
+        file_name,
+        [{"id": 1, "name": "a", "extra": 2}],
+        output_format="parquet",
+        model=Row,
+    )
+
+    schema = pq.read_schema(file_name)
+    assert [(field.name, field.type) for field in schema] == [
+        ("id", pa.int64()),
+        ("name", pa.string()),
+        ("extra", pa.string()),
+    ]
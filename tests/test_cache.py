@@ -0,0 +1,96 @@
+from typing import TypedDict
+
+from calcifer.utils.cache import cache_to_file
+from calcifer.utils.compact_record import compact_record
+
+
+class Item(TypedDict):
+    org: str
+    index: int
+
+
+ItemRecord = compact_record(Item)
+
+
+def _items(calls: list, org: str, count: int) -> list[dict]:
+    calls.append((org, count))
+    return [{"org": org, "index": i, "extra": "dropped"} for i in range(count)]
+
+
+def test_same_arguments_hit_the_cache():
+    calls = []
+
+    @cache_to_file("test_items", key=lambda org, count: f"{org}:{count}")
+    def get_items(org: str, count: int) -> list[dict]:
+        return _items(calls, org, count)
+
+    first = get_items("org", 2)
+
+    assert get_items("org", 2) == first
+    assert calls == [("org", 2)]
+
+
+def test_different_arguments_miss_the_cache():
+    calls = []
+
+    @cache_to_file("test_items", key=lambda org, count: f"{org}:{count}")
+    def get_items(org: str, count: int) -> list[dict]:
+        return _items(calls, org, count)
+
+    get_items("org", 2)
+
+    assert get_items("other", 2)[0]["org"] == "other"
+    assert len(get_items("org", 3)) == 3
+    assert calls == [("org", 2), ("other", 2), ("org", 3)]
+
+
+def test_records_are_read_back_as_records():
+    calls = []
+
+    @cache_to_file("test_records", record_type=ItemRecord)
+    def get_items() -> list[ItemRecord]:
+        return [ItemRecord.from_dict(item) for item in _items(calls, "org", 2)]
+
+    get_items()
+    cached = get_items()
+
+    assert len(calls) == 1
+    assert all(isinstance(item, ItemRecord) for item in cached)
+    assert [dict(item) for item in cached] == [
+        {"org": "org", "index": 0},
+        {"org": "org", "index": 1},
+    ]
+
+
+def test_stream_replays_the_same_rows():
+    calls = []
+
+    @cache_to_file(
+        "test_stream", key=lambda org: org, record_type=ItemRecord, stream=True
+    )
+    def iter_items(org: str):
+        for item in _items(calls, org, 3):
+            yield ItemRecord.from_dict(item)
+
+    streamed = [dict(item) for item in iter_items("org")]
+    replayed = list(iter_items("org"))
+
+    assert calls == [("org", 3)]
+    assert [dict(item) for item in replayed] == streamed
+    assert all(isinstance(item, ItemRecord) for item in replayed)
+
+
+def test_interrupted_stream_is_not_cached(file_cache_dir):
+    calls = []
+
+    @cache_to_file("test_stream", stream=True)
+    def iter_items():
+        yield from _items(calls, "org", 3)
+
+    items = iter_items()
+    next(items)
+    items.close()
+
+    assert list(iter_items()) == _items([], "org", 3)
+    assert len(calls) == 2
+    assert not [path for path in file_cache_dir.iterdir() if "partial" in path.name]
@@ -0,0 +1,148 @@
+import sqlite3
+from typing import TypedDict
+
+import pytest
+
+from calcifer.utils.db_writer import DbTableWriter, write_db_columns, write_db_rows
+
+
+class Row(TypedDict):
+    org: str
+    name: str
+    stars: int
+
+
+@pytest.fixture(params=["sqlite", "duckdb"])
+def output_format(request) -> str:
+    if request.param == "duckdb":
+        pytest.importorskip("duckdb")
+    return request.param
+
+
+def _connect(file_name, output_format):
+    if output_format == "duckdb":
+        import duckdb
+
+        return duckdb.connect(str(file_name))
+    return sqlite3.connect(file_name)
+
+
+def _select(file_name, output_format, sql: str) -> list[tuple]:
+    connection = _connect(file_name, output_format)
+    try:
+        return connection.execute(sql).fetchall()
+    finally:
+        connection.close()
+
+
+def _write(file_name, output_format, rows: list[dict]) -> DbTableWriter:
+    writer = DbTableWriter(
+        file_name, output_format, "repos", ("org", "name"), Row.__annotations__
+    )
+    try:
+        writer.write_rows(rows, list(dict.fromkeys(k for row in rows for k in row)))
+    finally:
+        writer.close()
+    return writer
+
+
+def test_upsert_updates_conflicting_keys_and_counts_changed_rows(
+    tmp_path, output_format
+):
+    file_name = tmp_path / f"out.{output_format}"
+    first_run = _write(
+        file_name,
+        output_format,
+        [
+            {"org": "o", "name": "a", "stars": 1},
+            {"org": "o", "name": "b", "stars": 2},
+            # The last row of a key in a batch wins
+            {"org": "o", "name": "b", "stars": 3},
+        ],
+    )
+
+    second_run = _write(
+        file_name,
+        output_format,
+        [
+            {"org": "o", "name": "a", "stars": 1},
+            {"org": "o", "name": "b", "stars": 4},
+            {"org": "p", "name": "a", "stars": 5},
+        ],
+    )
+
+    assert (first_run.rows_written, first_run.rows_changed) == (2, 2)
+    assert (second_run.rows_written, second_run.rows_changed) == (3, 2)
+    assert _select(
+        file_name, output_format, "SELECT org, name, stars FROM repos ORDER BY 1, 2"
+    ) == [("o", "a", 1), ("o", "b", 4), ("p", "a", 5)]
+
+
+def test_unchanged_rows_are_not_counted(tmp_path, output_format):
+    file_name = tmp_path / f"out.{output_format}"
+    rows = [{"org": "o", "name": "a", "stars": 1}]
+    _write(file_name, output_format, rows)
+
+    assert _write(file_name, output_format, rows).rows_changed == 0
+
+
+def test_second_run_adds_new_columns(tmp_path, output_format):
+    file_name = tmp_path / f"out.{output_format}"
+    _write(file_name, output_format, [{"org": "o", "name": "a", "stars": 1}])
+
+    _write(
+        file_name,
+        output_format,
+        [{"org": "o", "name": "b", "stars": 2, "topics": ["x"], "fork": True}],
+    )
+
+    assert _select(
+        file_name,
+        output_format,
+        "SELECT name, stars, topics, fork FROM repos ORDER BY name",
+    ) == [("a", 1, None, None), ("b", 2, '["x"]', True)]
+
+
+def test_write_db_rows_adds_late_columns_between_batches(tmp_path, output_format):
+    file_name = tmp_path / f"out.{output_format}"
+    fieldnames = ["org", "name"]
+
+    def rows():
+        yield {"org": "o", "name": "a"}
+        fieldnames.append("stars")
+        yield {"org": "o", "name": "b", "stars": 2}
+
+    write_db_rows(
+        file_name,
+        rows(),
+        fieldnames,
+        output_format,
+        "repos",
+        ("org", "name"),
+        Row,
+        batch_size=1,
+    )
+
+    assert _select(
+        file_name, output_format, "SELECT name, stars FROM repos ORDER BY name"
+    ) == [("a", None), ("b", 2)]
+
+
+def test_write_db_columns_upserts_by_key(tmp_path, output_format):
+    file_name = tmp_path / f"out.{output_format}"
+    for stars in (1, 2):
+        write_db_columns(
+            file_name,
+            {"org": ["o"], "name": ["a"], "stars": [stars]},
+            output_format,
+            "repos",
+            ("org", "name"),
+            batch_size=1,
+        )
+
+    assert _select(file_name, output_format, "SELECT stars FROM repos") == [(2,)]
+
+
+def test_rows_without_the_key_columns_are_refused(tmp_path, output_format):
+    with pytest.raises(ValueError, match="Key columns"):
+        _write(tmp_path / f"out.{output_format}", output_format, [{"org": "o"}])
@@ -0,0 +1,123 @@
+import csv
+import gzip
+import json
+import sqlite3
+
+import pytest
+
+from calcifer.utils.file_writer import (
+    LateColumnsException,
+    write_columns_to_file,
+    write_to_file,
+)
+
+ROWS = [{"a": 1, "b": "x"}, {"a": 2, "b": "y"}, {"a": 3, "b": "z", "c": True}]
+
+
+def _read_csv(file_name) -> list[list[str]]:
+    with open(file_name, newline="") as csvfile:
+        return list(csv.reader(csvfile))
+
+
+def test_extend_rewrites_the_header_with_late_columns(tmp_path):
+    file_name = tmp_path / "out.csv"
+
+    write_to_file(file_name, ROWS, sample_size=2)
+
+    assert _read_csv(file_name) == [
+        ["a", "b", "c"],
+        ["1", "x", ""],
+        ["2", "y", ""],
+        ["3", "z", "True"],
+    ]
+
+
+def test_sampled_columns_need_no_rewrite(tmp_path):
+    file_name = tmp_path / "out.csv"
+
+    write_to_file(file_name, ROWS)
+
+    assert _read_csv(file_name)[0] == ["a", "b", "c"]
+
+
+def test_drop_leaves_late_columns_out(tmp_path):
+    file_name = tmp_path / "out.csv"
+
+    write_to_file(file_name, ROWS, sample_size=2, late_columns="drop")
+
+    assert _read_csv(file_name) == [["a", "b"], ["1", "x"], ["2", "y"], ["3", "z"]]
+
+
+def test_error_raises_on_late_columns(tmp_path):
+    with pytest.raises(LateColumnsException, match=r"\['c'\]"):
+        write_to_file(tmp_path / "out.csv", ROWS, sample_size=2, late_columns="error")
+
+
+def test_declared_columns_are_the_header(tmp_path):
+    file_name = tmp_path / "out.csv"
+
+    write_to_file(file_name, ROWS, columns=["b"], late_columns="drop")
+
+    assert _read_csv(file_name) == [["b"], ["x"], ["y"], ["z"]]
+
+
+def test_empty_data_writes_an_empty_csv(tmp_path):
+    file_name = tmp_path / "out.csv"
+
+    write_to_file(file_name, [])
+
+    assert file_name.read_text() == ""
+
+
+@pytest.mark.parametrize("output_format", ["ndjson", "ndjson.gz", "ndjson.zst"])
+def test_ndjson_keeps_every_record_whole(tmp_path, output_format):
+    if output_format == "ndjson.zst":
+        zstandard = pytest.importorskip("zstandard")
+        opener = zstandard.open
+    else:
+        opener = gzip.open if output_format == "ndjson.gz" else open
+    file_name = tmp_path / f"out.{output_format}"
+    rows = ROWS + [{"nested": {"d": [1, 2]}}]
+
+    write_to_file(file_name, rows, sample_size=1, output_format=output_format)
+
+    with opener(file_name, "rt") as ndjsonfile:
+        assert [json.loads(line) for line in ndjsonfile] == rows
+
+
+@pytest.mark.parametrize("output_format", ["parquet", "arrow"])
+def test_arrow_formats_drop_late_columns(tmp_path, output_format):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    file_name = tmp_path / f"out.{output_format}"
+
+    write_to_file(file_name, ROWS, sample_size=2, output_format=output_format)
+
+    if output_format == "parquet":
+        table = pq.read_table(file_name)
+    else:
+        table = pa.ipc.open_file(str(file_name)).read_all()
+    assert table.column_names == ["a", "b"]
+    assert table.num_rows == 3
+
+
+def test_sqlite_upserts_in_the_table(tmp_path):
+    file_name = tmp_path / "out.sqlite"
+
+    write_to_file(file_name, ROWS, output_format="sqlite", table="rows", key=["a"])
+
+    with sqlite3.connect(file_name) as connection:
+        assert connection.execute("SELECT a, b, c FROM rows ORDER BY a").fetchall() == [
+            (1, "x", None),
+            (2, "y", None),
+            (3, "z", 1),
+        ]
+
+
+def test_write_columns_appends_rows_under_a_single_header(tmp_path):
+    file_name = tmp_path / "out.csv"
+
+    write_columns_to_file(file_name, {"a": [1], "b": ["x"]}, append=True)
+    write_columns_to_file(file_name, {"a": [2], "b": ["y"]}, append=True)
+
+    assert _read_csv(file_name) == [["a", "b"], ["1", "x"], ["2", "y"]]
@@ -0,0 +1,119 @@
+import os
+import subprocess
+from pathlib import Path
+
+import pytest
+from pydantic import SecretStr
+
+from calcifer.commands.github import (
+    get_first_contributions_from_mirror,
+    get_last_commit_from_mirror,
+    get_repo_commit_number_from_mirror,
+    sync_repo_mirrors,
+)
+from calcifer.services.git_mirror import GitMirror
+
+
+def _git(*args: str, cwd: Path, date: str = "2020-01-01T00:00:00Z", author="alice"):
+    env = {
+        **os.environ,
+        "GIT_AUTHOR_NAME": author,
+        "GIT_AUTHOR_EMAIL": f"{author}@example.com",
+        "GIT_AUTHOR_DATE": date,
+        "GIT_COMMITTER_NAME": author,
+        "GIT_COMMITTER_EMAIL": f"{author}@example.com",
+        "GIT_COMMITTER_DATE": date,
+    }
+    subprocess.run(["git", *args], cwd=cwd, env=env, check=True, capture_output=True)
+
+
+def _bare_repo(tmp_path: Path, name: str) -> Path:
+    path = tmp_path / "upstream" / f"{name}.git"
+    path.mkdir(parents=True)
+    _git("init", "--bare", "--initial-branch=main", cwd=path)
+    _git("config", "uploadpack.allowFilter", "true", cwd=path)
+    return path
+
+
+def _commit(upstream: Path, work_dir: Path, message: str, author: str, date: str):
+    if not work_dir.exists():
+        _git("clone", upstream.as_uri(), str(work_dir), cwd=upstream.parent)
+    _git(
+        "commit", "--allow-empty", "-m", message, cwd=work_dir, author=author, date=date
+    )
+    _git("push", "origin", "HEAD:main", cwd=work_dir)
+
+
+def _repo(upstream: Path, name: str) -> dict:
+    return {
+        "name": name,
+        "full_name": f"org/{name}",
+        "default_branch": "main",
+        "clone_url": upstream.as_uri(),
+    }
+
+
+@pytest.fixture
+def repos(tmp_path: Path) -> list[dict]:
+    upstream = _bare_repo(tmp_path, "project")
+    work_dir = tmp_path / "work"
+    _commit(upstream, work_dir, "first", "alice", "2020-01-01T00:00:00Z")
+    _commit(upstream, work_dir, "second", "bob", "2020-01-02T00:00:00Z")
+    _commit(upstream, work_dir, "third", "alice", "2020-01-03T00:00:00Z")
+    empty_upstream = _bare_repo(tmp_path, "empty")
+    return [_repo(upstream, "project"), _repo(empty_upstream, "empty")]
+
+
+def test_mirror_reads_first_contributions_and_empty_repos(tmp_path, repos, caplog):
+    git_mirror = GitMirror(tmp_path / "mirrors")
+
+    sync_repo_mirrors(git_mirror, repos)
+
+    assert sorted(
+        get_first_contributions_from_mirror(git_mirror, repos),
+        key=lambda contribution: contribution["author"],
+    ) == [
+        {"author": "alice", "date": "2020-01-01T00:00:00Z", "repo": "project"},
+        {"author": "bob", "date": "2020-01-02T00:00:00Z", "repo": "project"},
+    ]
+    assert get_repo_commit_number_from_mirror(git_mirror, repos) == [
+        {"name": "project", "commits": 3},
+        {"name": "empty", "commits": 0},
+    ]
+    assert not [record for record in caplog.records if record.levelname == "ERROR"]
+
+
+def test_mirror_fetches_new_commits(tmp_path, repos):
+    git_mirror = GitMirror(tmp_path / "mirrors")
+    sync_repo_mirrors(git_mirror, repos)
+    upstream = tmp_path / "upstream" / "project.git"
+    _commit(upstream, tmp_path / "work", "fourth", "carol", "2020-01-04T00:00:00Z")
+
+    sync_repo_mirrors(git_mirror, repos)
+
+    [last_commit] = get_last_commit_from_mirror(git_mirror, repos[:1])
+    assert (last_commit["author"], last_commit["message"]) == ("carol", "fourth")
+
+
+def test_mirror_passes_the_token_in_the_environment(tmp_path):
+    git_mirror = GitMirror(tmp_path / "mirrors", "user", SecretStr("token"))
+
+    header = git_mirror._git(None, "config", "--get", "http.extraHeader")
+
+    assert header.strip() == "Authorization: Basic dXNlcjp0b2tlbg=="
+
+
+def test_mirror_fetches_only_branches_and_tags(tmp_path, repos):
+    upstream = tmp_path / "upstream" / "project.git"
+    _git("update-ref", "refs/pull/1/head", "refs/heads/main", cwd=upstream)
+    _git("tag", "v1", "refs/heads/main", cwd=upstream)
+    git_mirror = GitMirror(tmp_path / "mirrors")
+
+    for _ in range(2):
+        sync_repo_mirrors(git_mirror, repos[:1])
+        refs = git_mirror._git(
+            git_mirror.get_mirror_path("org/project"),
+            "for-each-ref",
+            "--format=%(refname)",
+        )
+        assert refs.split() == ["refs/heads/main", "refs/tags/v1"]
@@ -0,0 +1,95 @@
+from calcifer.commands.github import (
+    DEFAULT_PROTECTION,
+    _fetch_for_repo,
+    add_protection_to_repo_if_missing,
+    get_repo_protections_info,
+    get_repos_protections,
+)
+from calcifer.utils import cache
+from calcifer.utils.watermark_store import RepoWatermarkStore
+
+REPO = {
+    "name": "repo",
+    "full_name": "org/repo",
+    "visibility": "private",
+    "default_branch": "main",
+    "pushed_at": "2020-01-01T00:00:00Z",
+    "updated_at": "2020-01-01T00:00:00Z",
+}
+
+
+class FakeGithubRestManager:
+    def __init__(self) -> None:
+        self.added_protections = []
+        self.protection_urls = []
+        self.protections = []
+
+    def get_all_pages(self, path, query_params, collection_name, **kwargs):
+        self.protection_urls.append(path)
+        return self.protections
+
+    def add_protections(self, github_org, github_repo_name, main_branch, protections):
+        self.added_protections.append(
+            (github_org, github_repo_name, main_branch, protections)
+        )
+
+
+def test_add_protection_to_repo_if_missing_uses_the_repo_default_branch():
+    repos = [
+        {"name": "protected", "default_branch": "main"},
+        {"name": "unprotected", "default_branch": "develop"},
+    ]
+    repo_protections = get_repo_protections_info(
+        [
+            {"repo": "protected", "visibility": "private", "url": "https://x"},
+            {"repo": "unprotected", "visibility": "private"},
+        ]
+    )
+    github_rest_manager = FakeGithubRestManager()
+
+    add_protection_to_repo_if_missing(
+        github_rest_manager, repo_protections, repos, "org"
+    )
+
+    assert github_rest_manager.added_protections == [
+        ("org", "unprotected", "develop", DEFAULT_PROTECTION)
+    ]
+
+
+def test_protections_are_refetched_although_the_repo_did_not_move(
+    tmp_path, monkeypatch
+):
+    monkeypatch.setattr(cache, "_file_cache_enabled", False)
+    github_rest_manager = FakeGithubRestManager()
+    github_rest_manager.protections = [{"url": "https://protection"}]
+    watermark_store = RepoWatermarkStore(tmp_path / "state.json")
+    get_repos_protections(
+        github_rest_manager, [REPO], "org", watermark_store=watermark_store
+    )
+    watermark_store.save()
+    github_rest_manager.protections = []
+
+    [protection] = get_repos_protections(
+        github_rest_manager,
+        [REPO],
+        "org",
+        watermark_store=RepoWatermarkStore(tmp_path / "state.json"),
+    )
+
+    assert (
+        github_rest_manager.protection_urls
+        == ["repos/org/repo/branches/main/protection"] * 2
+    )
+    assert "url" not in protection
+
+
+def test_other_sections_are_reused_while_the_repo_did_not_move(tmp_path):
+    watermark_store = RepoWatermarkStore(tmp_path / "state.json")
+    calls = []
+
+    for _ in range(2):
+        _fetch_for_repo(
+            watermark_store, "has_catalog_info", REPO, lambda: calls.append(1)
+        )
+
+    assert len(calls) == 1
@@ -0,0 +1,77 @@
+from datetime import datetime
+
+import pytest
+from pydantic import SecretStr
+
+from benchmarks.mock_servers import start_mock_server
+from calcifer.commands import jira
+from calcifer.commands.jira import (
+    _get_window_jql,
+    count_issues,
+    get_created_windows,
+    get_issues_for_project,
+)
+from calcifer.services.jira_pager import JiraPager
+
+JQL_QUERY = "project=PROJ"
+
+
+@pytest.fixture
+def server():
+    # Mock issues are created every 30 minutes from 2022/01/01 00:00, so many fall exactly on window boundaries
+    server = start_mock_server({"issues": 600})
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def jira_pager(server) -> JiraPager:
+    return JiraPager(url=f"{server.url}/jira", user="user", token=SecretStr("token"))
+
+
+def _window_keys(jira_pager: JiraPager, window) -> list[str]:
+    query_param = jira.get_default_query_param()
+    query_param["jql"] = _get_window_jql(JQL_QUERY, window)
+    return [
+        issue["key"]
+        for issue in jira_pager.get_all_pages(
+            jira.SEARCH_PATH, query_param, "issues", show_progress=False
+        )
+    ]
+
+
+def test_windows_are_split_at_the_limit(monkeypatch, jira_pager):
+    monkeypatch.setattr(jira, "MAX_ISSUES_PER_WINDOW", 10)
+    # Issues 0 to 19, the split at 05:00 falls exactly on the creation of issue 10
+    window = (datetime(2022, 1, 1), datetime(2022, 1, 1, 10))
+
+    windows = get_created_windows(jira_pager, JQL_QUERY, window, 20)
+
+    counts = [count_issues(jira_pager, _get_window_jql(JQL_QUERY, w)) for w in windows]
+    assert windows[0][0] == window[0] and windows[-1][1] == window[1]
+    assert all(end == start for (_, end), (start, _) in zip(windows, windows[1:]))
+    assert all(count <= 10 for count in counts)
+    keys = [key for w in windows for key in _window_keys(jira_pager, w)]
+    assert sorted(keys) == sorted(f"PROJ-{i}" for i in range(20))
+
+
+def test_windows_too_large_are_split_again(monkeypatch, jira_pager):
+    monkeypatch.setattr(jira, "MAX_ISSUES_PER_WINDOW", 10)
+    # Sized from a total of 20 the two halves hold 0 and 40 issues, the second one is split again
+    window = (datetime(2021, 12, 31, 4), datetime(2022, 1, 1, 20))
+
+    windows = get_created_windows(jira_pager, JQL_QUERY, window, 20)
+
+    counts = [count_issues(jira_pager, _get_window_jql(JQL_QUERY, w)) for w in windows]
+    assert all(0 < count <= 10 for count in counts)
+    assert sum(counts) == 40
+
+
+def test_issues_of_every_window_are_returned_once(monkeypatch, jira_pager):
+    monkeypatch.setattr(jira, "MAX_ISSUES_PER_WINDOW", 100)
+
+    issues = get_issues_for_project(jira_pager, "PROJ", "2021-01-01")
+
+    assert sorted(issue["key"] for issue in issues) == sorted(
+        f"PROJ-{i}" for i in range(600)
+    )
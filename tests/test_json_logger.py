@@ -0,0 +1,25 @@
+import logging
+
+from calcifer.utils.json_logger import RepeatFilter
+
+
+def _record(level: int) -> logging.LogRecord:
+    return logging.LogRecord("test", level, "module.py", 1, "message", None, None)
+
+
+def test_repeat_filter_suppresses_repeated_debug_records():
+    repeat_filter = RepeatFilter(max_repeats=2)
+
+    assert [repeat_filter.filter(_record(logging.DEBUG)) for _ in range(4)] == [
+        True,
+        True,
+        False,
+        False,
+    ]
+
+
+def test_repeat_filter_never_drops_info_and_higher_records():
+    repeat_filter = RepeatFilter(max_repeats=2)
+
+    for level in (logging.INFO, logging.WARNING, logging.ERROR, logging.CRITICAL):
+        assert all(repeat_filter.filter(_record(level)) for _ in range(4))
@@ -0,0 +1,19 @@
+import threading
+import time
+
+from calcifer.services.rate_budget import RateBudget
+
+
+def test_acquire_waits_for_the_reset_without_holding_the_lock():
+    rate_budget = RateBudget(reserved_requests=0)
+    rate_budget.remaining = 0
+    rate_budget.reset_at = time.time() + 0.5
+    waiter = threading.Thread(target=rate_budget.acquire)
+    waiter.start()
+    time.sleep(0.1)
+
+    assert waiter.is_alive()
+    assert rate_budget._lock.acquire(timeout=0.1)
+    rate_budget._lock.release()
+    waiter.join()
+    assert rate_budget.remaining is None
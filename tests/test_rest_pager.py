@@ -0,0 +1,72 @@
+import pytest
+from pydantic import SecretStr
+
+from benchmarks.mock_servers import start_mock_server
+from calcifer.services import rest_pager
+from calcifer.services.auth0_pager import (
+    Auth0LatestLogsPager,
+    get_default_auth0_latest_logs_query_param,
+)
+from calcifer.services.github_rest_manager import GithubRestManager
+from calcifer.utils.metrics import metrics
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(rest_pager, "RETRY_BACKOFF", 0)
+
+
+def _github_rest_manager(server) -> GithubRestManager:
+    return GithubRestManager(
+        url=f"{server.url}/github/", user="user", token=SecretStr("token")
+    )
+
+
+def test_send_retries_server_errors():
+    server = start_mock_server({"error_rate": 1.0})
+    try:
+        response, retries = _github_rest_manager(server)._send(
+            "GET", f"{server.url}/github/orgs/org/repos"
+        )
+    finally:
+        server.shutdown()
+
+    assert response.status_code == 500
+    assert retries == rest_pager.MAX_RETRIES
+    assert server.requests["errors"] == rest_pager.MAX_RETRIES + 1
+
+
+def test_send_returns_the_first_successful_response():
+    server = start_mock_server({"error_rate": 0.5, "seed": 1})
+    try:
+        response, retries = _github_rest_manager(server)._send(
+            "GET", f"{server.url}/github/orgs/org/repos"
+        )
+    finally:
+        server.shutdown()
+
+    assert response.status_code == 200
+    assert server.requests["github"] == retries + 1
+
+
+@pytest.mark.parametrize("measure_projection, requests", [(False, 3), (True, 4)])
+def test_projection_is_only_measured_on_demand(
+    monkeypatch, measure_projection, requests
+):
+    monkeypatch.setattr(metrics, "measure_projection", measure_projection)
+    server = start_mock_server({"logs": 150})
+    try:
+        pager = Auth0LatestLogsPager(
+            url=f"{server.url}/auth0",
+            bearer=SecretStr("token"),
+            fields=["log_id", "date"],
+        )
+        logs = pager.get_all_pages(
+            "/logs", get_default_auth0_latest_logs_query_param(), None
+        )
+    finally:
+        server.shutdown()
+
+    assert len(logs) == 150
+    assert server.requests["auth0"] == requests
+    assert (pager.projection_ratio is not None) == measure_projection